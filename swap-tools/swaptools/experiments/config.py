@@ -11,5 +11,7 @@ experiment_db = Object({
 
 trials = Object({
     'keep_amount': 10,
-    'cutoff': 0.96
+    'cutoff': 0.96,
+    # Trials solved together by swap.engine.trials
+    'batch_size': 64,
 })
@@ -63,11 +63,13 @@ class Experiment(experiment.Experiment):
     def _run(self):
         gg = GoldGetter()
         swap = self.init_swap()
-        n = 1
-        for cv in range(*self.controversial):
-            for cn in range(*self.consensus):
-                if cv == 0 and cn == 0:
-                    continue
+
+        params = [(cv, cn) for cv in range(*self.controversial)
+                  for cn in range(*self.consensus)
+                  if cv != 0 or cn != 0]
+
+        def gold_sets():
+            for n, (cv, cn) in enumerate(params, 1):
                 gg.reset()
 
                 logger.info('\nRunning trial %d with cv=%d cn=%d',
@@ -77,12 +79,11 @@ class Experiment(experiment.Experiment):
                 if cn > 0:
                     gg.consensus(cn,)
 
-                swap.set_gold_labels(gg.golds)
-                swap.process_changes()
-                self.add_trial(
-                    self.Trial(cn, cv, gg.golds, swap.score_export()))
+                yield gg.golds
 
-                n += 1
+        trials = self.run_trials(swap, gold_sets())
+        for (cv, cn), (golds, scores) in zip(params, trials):
+            self.add_trial(self.Trial(cn, cv, golds, scores))
 
     def plot(self, type_, fname):
         if type_ == 'purity':
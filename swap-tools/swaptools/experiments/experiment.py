@@ -1,6 +1,7 @@
 
 from swap import Control
 from swap.agents.agent import Stat
+from swap.engine.trials import Trials
 from swap.utils.scores import Score, ScoreExport
 import swaptools.experiments.config as config
 import swap.ui
@@ -142,6 +143,17 @@ class Experiment:
 
         return control.getSWAP()
 
+    @staticmethod
+    def run_trials(swap, gold_sets):
+        """
+            Evaluate gold label sets against the classifications in swap,
+            trials.batch_size trials at a time
+
+            Yields (golds, ScoreExport) for every gold set, in order
+        """
+        trials = Trials(swap, config.trials.batch_size)
+        return trials.run(gold_sets)
+
     def clear_mem(self):
         """
             Saves trial objects to disk to free up memory
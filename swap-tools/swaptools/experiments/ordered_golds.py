@@ -34,21 +34,24 @@ class Experiment(randomex.Experiment):
         swap = self.init_swap()
         gi = GoldIterator(gg.golds, self.start, self.step)
 
-        for n, golds in enumerate(gi):
+        def gold_sets():
+            for n, golds in enumerate(gi):
 
-            logger.info('Running trial %d with %d golds', n, len(golds))
-            fake = 0
-            for gold in golds.values():
-                if gold == -1:
-                    fake += 1
-            logger.debug('Fake n golds: %d', fake)
+                logger.info('Running trial %d with %d golds', n, len(golds))
+                fake = 0
+                for gold in golds.values():
+                    if gold == -1:
+                        fake += 1
+                logger.debug('Fake n golds: %d', fake)
 
-            swap.set_gold_labels(golds)
-            swap.process_changes()
-            self.add_trial(randomex.Trial(n, golds, swap.score_export()))
+                yield golds
 
-            if len(golds) > self.end:
-                break
+                if len(golds) > self.end:
+                    break
+
+        trials = self.run_trials(swap, gold_sets())
+        for n, (golds, scores) in enumerate(trials):
+            self.add_trial(randomex.Trial(n, golds, scores))
 
     def __str__(self):
         s = '%d points\n' % len(self.plot_points)
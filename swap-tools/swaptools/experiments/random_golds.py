@@ -64,9 +64,12 @@ class Experiment(experiment.Experiment):
     def _run(self):
         gg = GoldGetter()
         swap = self.init_swap()
-        for n_golds in range(*self.num_golds):
-            for n in range(self.num_trials):
 
+        params = [(n_golds, n) for n_golds in range(*self.num_golds)
+                  for n in range(self.num_trials)]
+
+        def gold_sets():
+            for n_golds, n in params:
                 gg.reset()
                 gg.random(n_golds)
 
@@ -78,9 +81,11 @@ class Experiment(experiment.Experiment):
                         fake += 1
                 logger.debug('Fake n golds: %d' % fake)
 
-                swap.set_gold_labels(gg.golds)
-                swap.process_changes()
-                self.add_trial(self.Trial(n, gg.golds, swap.score_export()))
+                yield gg.golds
+
+        trials = self.run_trials(swap, gold_sets())
+        for (_, n), (golds, scores) in zip(params, trials):
+            self.add_trial(self.Trial(n, golds, scores))
 
     def _db_export_plot(self):
         data = []
@@ -4,6 +4,7 @@
 import swap.agents.ledger as ledger
 
 import abc
+import math
 import statistics as st
 
 import logging
@@ -20,6 +21,8 @@ class Agent(metaclass=abc.ABCMeta):
             Initial probability used depending on subclass.
     """
 
+    __slots__ = ('_id', 'ledger')
+
     def __init__(self, id_, ledger_type):
         self._id = id_
         self.ledger = ledger_type(id_)
@@ -28,6 +31,17 @@ class Agent(metaclass=abc.ABCMeta):
     def id(self):
         return self._id
 
+    @property
+    def raw_id(self):
+        """
+            Id of this agent outside of SWAP. Agents in a bureau with
+            an index use dense ids, translated back here
+        """
+        bureau = self.ledger.bureau
+        if bureau is None:
+            return self._id
+        return bureau.raw_id(self._id)
+
     @property
     def score(self):
         """
@@ -51,6 +65,36 @@ class Agent(metaclass=abc.ABCMeta):
         p = [agent.score for agent in bureau]
         return Stat(p)
 
+    @staticmethod
+    def stat_values(score):
+        """
+            Values of a score kept in the running statistics of a
+            bureau, as (label, value) pairs
+        """
+        if score is None:
+            return ()
+        return ((None, score),)
+
+    @staticmethod
+    def running_stats(stat):
+        """
+            Stat from the running statistics of a bureau, see
+            Bureau.stats
+
+            Args:
+                stat: function returning the RunningStat of a label
+        """
+        return stat(None).stat()
+
+    @staticmethod
+    def recalculate(ledgers):
+        """
+            Recalculate the ledgers of several agents of this type,
+            see Bureau.process_changes
+        """
+        for ledger_ in ledgers:
+            ledger_.recalculate()
+
     def __str__(self):
         return 'id %s transactions %d' % \
             (str(self.id), len(self.ledger.transactions))
@@ -74,6 +118,17 @@ class Stat(BaseStat):
         self.median = st.median(data)
         self.stdev = st.pstdev(data)
 
+    @classmethod
+    def from_values(cls, mean, median, stdev):
+        """
+            Stat of statistics already calculated elsewhere
+        """
+        stat = cls.__new__(cls)
+        stat.mean = mean
+        stat.median = median
+        stat.stdev = stdev
+        return stat
+
     def export(self):
         return {'mean': self.mean,
                 'stdev': self.stdev,
@@ -84,6 +139,92 @@ class Stat(BaseStat):
             (self.mean, self.median, self.stdev)
 
 
+class RunningStat:
+    """
+        Running mean, standard deviation and median of values in
+        [0, 1], such as agent scores, that are added and removed as
+        scores change. Mean and variance are updated with Welford's
+        algorithm, the median is read from a fixed width histogram
+        and is accurate to 1 / bins.
+    """
+
+    __slots__ = ('n', 'mean', 'm2', 'counts')
+
+    def __init__(self, bins=4096):
+        self.n = 0
+        self.mean = 0.
+        # Sum of squared differences from the mean
+        self.m2 = 0.
+        self.counts = [0] * bins
+
+    def _bin(self, value):
+        bins = len(self.counts)
+        return min(max(int(value * bins), 0), bins - 1)
+
+    def add(self, value):
+        if math.isnan(value):
+            return
+
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+        self.counts[self._bin(value)] += 1
+
+    def remove(self, value):
+        if math.isnan(value):
+            return
+
+        if self.n <= 1:
+            self.n = 0
+            self.mean = self.m2 = 0.
+        else:
+            mean = self.mean
+            self.n -= 1
+            self.mean = (mean * (self.n + 1) - value) / self.n
+            self.m2 -= (value - mean) * (value - self.mean)
+
+        self.counts[self._bin(value)] -= 1
+
+    @property
+    def stdev(self):
+        if self.n == 0:
+            return 0.
+        return math.sqrt(max(self.m2, 0.) / self.n)
+
+    def _rank(self, k):
+        """
+            Center of the bin holding the k-th smallest value
+        """
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= k:
+                return (i + .5) / len(self.counts)
+        return 1.
+
+    @property
+    def median(self):
+        """
+            Average of the middle ranks, each taken as the center of
+            its bin
+        """
+        if self.n == 0:
+            return math.nan
+
+        lower = self._rank((self.n + 1) // 2)
+        if self.n % 2 == 1:
+            return lower
+        return (lower + self._rank(self.n // 2 + 1)) / 2
+
+    def stat(self):
+        return Stat.from_values(self.mean, self.median, self.stdev)
+
+    def __len__(self):
+        return self.n
+
+
 class MultiStat(BaseStat):
     """
         Keeps track of statistics for multiple classes in a single
@@ -2,7 +2,7 @@
 # Keeps track of all user and subject agents
 # - Initial class to test SWAP
 
-from swap.agents.agent import Agent
+from swap.agents.agent import Agent, RunningStat
 from swap.utils import Singleton
 
 
@@ -13,25 +13,64 @@ class Bureau:
     ----------
         agent_type: str
             Informative string to indicate agent types in that specific bureau
+        index: swap.utils.index.Index
+            (optional) Interning table between raw ids and dense integer
+            ids. With an index, agents, ledgers and transactions use the
+            dense ids, while get, add, has and idset take and return raw
+            ids. Without one, agents use the raw ids directly.
     """
 
-    def __init__(self, agent_type):
+    def __init__(self, agent_type, index=None):
         # type of agents, just a string? (e.g. users, subjects, machines,...)
         # maybe not required because we could look at the agents' subclass
 
         # What if we pass the type of the agents here... as in Bureau(Subject)
         # or Bureau(User) etc. ?
         self.agent_type = agent_type
+        self.index = index
         # dictionary to store all agents, key is agent-ID
         self._agents = dict()
 
+        # ids of agents whose ledgers changed and need recalculating
+        self._dirty = set()
+        # ids of agents whose score changed since they last
+        # notified their connected agents
+        self._notify = set()
+        # ids of agents that retired since the last call to retired,
+        # in the order they retired
+        self._retired = []
+        # Running statistics of agent scores by label, see stats
+        self._stats = {}
+        # ids of agents whose score or ledger changed, only recorded
+        # after the first call to score_changes
+        self._changed = None
+
+    def _id(self, id_, make_new=True):
+        """
+        Translate a raw id to the id agents use in this bureau
+        """
+        if self.index is None:
+            return id_
+        return self.index.get(id_, make_new)
+
+    def raw_id(self, agent_id):
+        """ Raw id of an agent, for data leaving the bureau
+
+        Parameter:
+        ----------
+            agent_id: id the agent uses (agent.id)
+        """
+        if self.index is None:
+            return agent_id
+        return self.index.id(agent_id)
+
     def add(self, agent, override=True):
         """
             Add agent to bureau
 
             Parameter:
             ----------
-                agent: agent object
+                agent: agent object, with its raw id
         """
         # Verify agent is of proper type
         if not isinstance(agent, self.agent_type):
@@ -39,84 +78,311 @@ class Bureau:
                 'Agent type %s is not of type %s' %
                 (type(agent), self.agent_type))
 
+        agent_id = self._id(agent.id)
+
         # Add agent to collection
-        if agent.id in self._agents and not override:
+        if agent_id in self._agents and not override:
             raise KeyError("Agent-ID already in bureau, remove first")
         else:
-            self._agents[agent.id] = agent
+            if agent_id != agent.id:
+                agent._id = agent.ledger.id = agent_id
+            self._add(agent)
+
+    def _add(self, agent):
+        """
+        Store an agent under the id it already uses
+        """
+        self._agents[agent.id] = agent
+        agent.ledger.bureau = self
+        self.score_changed(None, agent.ledger._score, agent.id)
+
+        if agent.ledger.stale:
+            self._dirty.add(agent.id)
+
+    def merge_ids(self, other):
+        """ Ids the agents of other_bureau get in this bureau
+
+        Parameter:
+        ----------
+            other: Bureau with agents that are not in this bureau
+
+        Returns:
+        --------
+            dict mapping ids in other to ids in this bureau
+        """
+        raw_ids = {agent_id: other.raw_id(agent_id)
+                   for agent_id in other._agents}
+        for raw_id in raw_ids.values():
+            if self.has(raw_id):
+                raise KeyError('Agent-ID %s in both bureaus' % str(raw_id))
+
+        return {agent_id: self._id(raw_id)
+                for agent_id, raw_id in raw_ids.items()}
+
+    def merge(self, other, ids, links):
+        """ Move the agents of another bureau into this one
+
+        Parameter:
+        ----------
+            other: Bureau to take agents from, left empty
+            ids: old to new ids of the agents in other, from merge_ids
+            links: old to new ids of the agents their ledgers point to
+        """
+        for agent in other:
+            old = agent.id
+            agent._id = ids[old]
+            agent.ledger.relabel(agent.id, links)
+            self._add(agent)
+
+            if old in other._dirty:
+                self._dirty.add(agent.id)
+            if old in other._notify:
+                self._notify.add(agent.id)
+
+        self._retired.extend(ids[old] for old in other.retired())
+        other._agents = dict()
+        other._stats = {}
+        other.clear_changes()
 
     def get(self, agent_id, make_new=True):
         """ Get agent from bureau
 
         Parameter:
         ----------
-            agent_id: id of agent
+            agent_id: raw id of agent
 
         Returns:
         -------
             agent
         """
-        if agent_id in self._agents:
-            return self._agents[agent_id]
+        id_ = self._id(agent_id, make_new)
+
+        if id_ in self._agents:
+            return self._agents[id_]
         elif make_new:
-            agent = self.agent_type(agent_id)
-            self.add(agent)
+            agent = self.agent_type(id_)
+            self._add(agent)
             return agent
         else:
             return None
 
+    def agent(self, agent_id):
+        """ Get an agent by the id it uses (agent.id), as stored in
+        ledgers and transactions
+
+        Parameter:
+        ----------
+            agent_id: id of agent
+        """
+        if self.index is None:
+            return self.get(agent_id)
+        return self._agents[agent_id]
+
     def remove(self, agent_id):
         """ Remove agent from bureau
 
         Parameter:
         ----------
-            agent_id: id of agent
+            agent_id: raw id of agent
         """
+        agent_id = self._id(agent_id, False)
+        self.score_changed(self._agents[agent_id].ledger._score, None)
         del self._agents[agent_id]
+        self._dirty.discard(agent_id)
+        self._notify.discard(agent_id)
 
     def has(self, agent_id):
         """ Check if agent is in bureau
 
         Parameter:
         ----------
-            agent_id: id of agent
+            agent_id: raw id of agent
 
         Returns:
         --------
             boolean
         """
-        return agent_id in self._agents
+        return self._id(agent_id, False) in self._agents
+
+    def mark_dirty(self, agent_id):
+        """ Queue an agent whose ledger needs recalculating
+
+        Parameter:
+        ----------
+            agent_id: id of agent
+        """
+        self._dirty.add(agent_id)
+        self.mark_changed(agent_id)
+
+    def mark_changed(self, agent_id):
+        """ Record that an agent changed, see score_changes
+
+        Parameter:
+        ----------
+            agent_id: id of agent
+        """
+        if self._changed is not None:
+            self._changed.add(agent_id)
+
+    def mark_notify(self, agent_id):
+        """ Queue an agent whose score changed, so it notifies its
+        connected agents in the next notify_changes
+
+        Parameter:
+        ----------
+            agent_id: id of agent
+        """
+        self._notify.add(agent_id)
+
+    def mark_retired(self, agent_id):
+        """ Queue an agent that just retired
+
+        Parameter:
+        ----------
+            agent_id: id of agent
+        """
+        self._retired.append(agent_id)
+
+    def retired(self):
+        """ Agents that retired since the last call, in the order
+        they retired
+
+        Returns:
+        --------
+            list of agent ids
+        """
+        retired = self._retired
+        self._retired = []
+        return retired
 
     def process_changes(self, bar=None):
-        for agent in self:
-            if bar is not None and agent.ledger.stale:
-                bar.update(bar.value + 1)
+        """ Recalculate the ledgers of all queued agents, together
+        when the agent type has a batch recalculation
+        """
+        dirty = self._dirty
+        self._dirty = set()
 
-            agent.ledger.recalculate()
+        ledgers = []
+        for agent_id in dirty:
+            agent = self._agents.get(agent_id)
+            if agent is not None:
+                ledgers.append(agent.ledger)
+
+        self.agent_type.recalculate(ledgers)
+
+        if bar is not None:
+            bar.update(bar.value + len(ledgers))
 
     def notify_changes(self, other_bureau):
-        for agent in self:
-            agent.ledger.notify_agents(self, other_bureau)
+        """ Queued agents notify their connected agents in other_bureau
+        that their score changed
+        """
+        notify = self._notify
+        self._notify = set()
+
+        for agent_id in notify:
+            agent = self._agents.get(agent_id)
+            if agent is not None:
+                agent.ledger.notify_agents(self, other_bureau)
+
+    def pending(self, agent_id):
+        """ Whether an agent is queued for recalculating and
+        for notifying
+
+        Parameter:
+        ----------
+            agent_id: id of agent
+
+        Returns:
+        --------
+            (dirty, notify) booleans
+        """
+        return agent_id in self._dirty, agent_id in self._notify
 
     def calculate_changes(self):
-        return len([1 for i in self if i.ledger.stale])
+        return len(self._dirty)
+
+    def clear_changes(self):
+        """ Empty the change queues, for when every agent was
+        recalculated outside the bureau
+        """
+        self._dirty = set()
+        self._notify = set()
 
     # ----------------------------------------------------------------
 
     def idset(self):
-        return set(self._agents.keys())
+        """ Raw ids of all agents
+        """
+        return set(self.raw_id(id_) for id_ in self._agents)
 
     def stats(self):
         """
-            Calculates the mean, standard deviation, and median
-            of scores in this bureau
+            Mean, standard deviation, and median of the scores in
+            this bureau, from running statistics kept up to date as
+            ledgers change their scores. The median is accurate to
+            1 / RunningStat bins
         """
-        return self.agent_type.stats(self)
+        return self.agent_type.running_stats(self._stat)
+
+    def _stat(self, label):
+        stat = self._stats.get(label)
+        if stat is None:
+            stat = self._stats[label] = RunningStat()
+        return stat
+
+    def score_changed(self, old, new, agent_id=None):
+        """ Update the running statistics when an agent's score
+        changes from old to new, None for no score
+
+        Parameter:
+        ----------
+            old: previous score
+            new: new score
+            agent_id: (optional) id of the agent, see score_changes
+        """
+        agent_type = self.agent_type
+        for label, value in agent_type.stat_values(old):
+            self._stat(label).remove(value)
+        for label, value in agent_type.stat_values(new):
+            self._stat(label).add(value)
+
+        if agent_id is not None:
+            self.mark_changed(agent_id)
+
+    def score_changes(self):
+        """ Ids of the agents whose score, ledger or gold label changed since
+        the last call, see SWAP.publish. Changes are only recorded
+        after the first call, which returns None
+
+        Returns:
+        --------
+            set of agent ids, or None on the first call
+        """
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def rebuild_stats(self):
+        """ Recalculate the running statistics from every agent,
+        for when scores were set outside of the ledgers
+        """
+        self._stats = {}
+        for agent in self:
+            self.score_changed(None, agent.ledger._score)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Bureaus pickled before these were added
+        self.__dict__.setdefault('_retired', [])
+        self.__dict__.setdefault('_changed', None)
+        if '_stats' not in state:
+            self.rebuild_stats()
 
     def export(self):
         data = dict()
         for name, agent in self._agents.items():
-            data[name] = agent.export()
+            data[self.raw_id(name)] = agent.export()
         return data
 
     def iter_ids(self, ids):
@@ -127,11 +393,9 @@ class Bureau:
 
     def __contains__(self, item):
         if isinstance(item, Agent):
-            id_ = item.id
-        else:
-            id_ = item
+            return item.id in self._agents
 
-        return self.has(id_)
+        return self.has(item)
 
     def __len__(self):
         return len(self._agents)
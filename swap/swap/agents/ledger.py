@@ -26,6 +26,8 @@ class Ledger:
     # Logic for reclassification needs to be in the higher levels
     # in order to provide bureaus at the appropriate time
 
+    __slots__ = ('id', 'transactions', 'stale', 'bureau', 'changed', '_score')
+
     def __init__(self, id_):
         """
         Args:
@@ -51,6 +53,10 @@ class Ledger:
         """
         self.changed.append(id_)
 
+        # Queue this ledger for recalculation in its bureau
+        if self.bureau is not None:
+            self.bureau.mark_dirty(self.id)
+
     @property
     def score(self):
         """
@@ -61,6 +67,29 @@ class Ledger:
         #     raise StaleException(self)
         return self._score
 
+    @score.setter
+    def score(self, new):
+        """
+        Set the score. If it changed, queue this ledger in its bureau
+        to notify its connected agents
+        """
+        if self._score != new:
+            self._set_score(new)
+
+            if self.bureau is not None:
+                self.bureau.mark_notify(self.id)
+
+    def _set_score(self, new):
+        """
+        Replace the score, keeping the running score statistics of
+        the bureau up to date
+        """
+        old = self._score
+        self._score = new
+
+        if self.bureau is not None:
+            self.bureau.score_changed(old, new, self.id)
+
     def add(self, transaction):
         """
         Add a transaction to the ledger
@@ -112,7 +141,7 @@ class Ledger:
         If this ledger is part of a subject, the connected user agent
         is notifying the subject that its score has changed.
         """
-        agent = bureau.get(id_)
+        agent = bureau.agent(id_)
         self.update(id_)
         self.transactions[id_].notify(agent)
 
@@ -131,6 +160,26 @@ class Ledger:
         self._change(id_)
         # self.transactions[id_].notify()
 
+    def relabel(self, id_, ids):
+        """
+        Change the id of this ledger and of the agents its transactions
+        point to, when moving the agent into another bureau
+
+        Parameters
+        ----------
+        id_
+            New id of this ledger
+        ids : dict
+            Old to new ids of the connected agents
+        """
+        self.id = id_
+        transactions = {}
+        for t in self:
+            t.id = ids[t.id]
+            transactions[t.id] = t
+        self.transactions = transactions
+        self.changed = [ids[i] for i in self.changed]
+
     def print(self):
         print(self)
 
@@ -169,6 +218,8 @@ class Transaction:
     Records an interaction from an agent with this ledger
     """
 
+    __slots__ = ('id', 'annotation', 'order', 'score', 'change')
+
     def __init__(self, agent, annotation):
         self.id = agent.id
         self.annotation = annotation
@@ -178,7 +229,7 @@ class Transaction:
         self.change = None
 
     def agent(self, bureau):
-        return bureau.get(self.id)
+        return bureau.agent(self.id)
 
     def notify(self, agent):
         pass
@@ -4,8 +4,10 @@
 
 from swap.agents.agent import Agent
 import swap.agents.ledger as ledger
+from swap.utils.fenwick import FenwickTree
 import swap.config as config
 
+import math
 import logging
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,8 @@ class Subject(Agent):
 
     class_name = 'subject'
 
+    __slots__ = ('_gold',)
+
     def __init__(self, subject_id, gold_label=-1):
         """
             Initialize a Subject Agent
@@ -28,7 +32,7 @@ class Subject(Agent):
                      0 bogus object
                      1 real supernova
         """
-        super().__init__(subject_id, Ledger)
+        super().__init__(subject_id, ledger_type())
         # store gold label
         self._gold = gold_label
 
@@ -69,7 +73,7 @@ class Subject(Agent):
             t = Transaction(user, annotation)
             self.ledger.add(t)
 
-    def set_gold_label(self, gold_label, subjects, users):
+    def set_gold_label(self, gold_label, subjects, users, notify=True):
         """
             Set a subject's gold label
 
@@ -78,13 +82,24 @@ class Subject(Agent):
                     -1 no gold label
                      0 bogus object
                      1 real supernova
+                notify: (bool)
+                    Notify the users who classified this subject.
+                    Set to False when the caller notifies them in
+                    a batch, see SWAP.set_gold_labels
+
+            Returns:
+                (bool) whether the gold label changed
         """
         old = self._gold
         new = gold_label
 
         if old != new:
             self._gold = gold_label
-            self.ledger.notify_agents(subjects, users)
+            if notify:
+                self.ledger.notify_agents(subjects, users)
+            return True
+
+        return False
 
     def isgold(self):
         return self.gold in [0, 1]
@@ -121,13 +136,80 @@ class Subject(Agent):
             (self.id, score, self.gold)
 
 
+def ledger_type():
+    """
+    Subject ledger class selected by config.subject_ledger, or
+    LiteLedger when config.keep_history is off
+    """
+    if not config.keep_history:
+        return LiteLedger
+
+    types = {'chain': Ledger, 'tree': TreeLedger}
+    if config.subject_ledger not in types:
+        raise ValueError('Unknown subject ledger %s' %
+                         str(config.subject_ledger))
+    return types[config.subject_ledger]
+
+
+def logit(p):
+    """
+    Log odds of a probability
+    """
+    if p <= 0:
+        return -math.inf
+    if p >= 1:
+        return math.inf
+    return math.log(p) - math.log1p(-p)
+
+
+def expit(x):
+    """
+    Probability from log odds, inverse of logit
+    """
+    if x >= 0:
+        return 1 / (1 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1 + z)
+
+
+# Bound on the log odds kept in running totals. Further out expit
+# is 0 or 1 anyway, and clipped saturated terms add up to a finite
+# total instead of inf - inf = nan
+LOG_ODDS_LIMIT = 700.
+
+
+def clip_log_odds(x):
+    """
+    Log odds clipped to +-LOG_ODDS_LIMIT
+    """
+    return min(max(x, -LOG_ODDS_LIMIT), LOG_ODDS_LIMIT)
+
+
+def log_ratio(a, b):
+    """
+    log(a / b), where a zero a or b saturates to -inf or inf
+    """
+    if a <= 0 and b <= 0:
+        return 0.
+    if a <= 0:
+        return -math.inf
+    if b <= 0:
+        return math.inf
+    return math.log(a) - math.log(b)
+
+
 class Ledger(ledger.Ledger):
+    __slots__ = ('last', 'retired')
+
     def __init__(self, id_):
         super().__init__(id_)
         # First change in the change cascade
         # self.first_change = None
         # Most recently added transaction
         self.last = None
+        # (classifications, score) when the score first crossed
+        # config.thresholds, see retire
+        self.retired = None
         # Note: first_change and last are references to the
         #       actual transactions, not their id numbers
 
@@ -150,12 +232,17 @@ class Ledger(ledger.Ledger):
             while transaction is not None:
                 transaction.commit_change()
 
-                prior = transaction.calculate(prior)
+                if config.log_odds:
+                    # Chain through the stored log odds instead of
+                    # the rounded probability
+                    prior = transaction.calculate()
+                else:
+                    prior = transaction.calculate(prior)
                 transaction = transaction.right
 
             score = prior
 
-        self._score = score
+        self._update(score)
         super().recalculate()
         return score
 
@@ -172,7 +259,7 @@ class Ledger(ledger.Ledger):
         id_ = super().add(transaction)
 
         if not config.back_update:
-            self._score = transaction.calculate()
+            self._update(transaction.calculate())
             # TODO
             # calculate new score
             # but not by calling recalcluate
@@ -184,6 +271,81 @@ class Ledger(ledger.Ledger):
 
         return id_
 
+    def history(self):
+        """
+        Score after each transaction, in the order they were added
+        """
+        return [t.score for t in self]
+
+    def commit(self, score):
+        """
+        Accept scores calculated outside of this ledger, for example
+        by swap.engine.static. Transaction scores must already be set
+        """
+        self._update(score)
+        self.clear_changes()
+
+    def _update(self, score):
+        """
+        Set a newly calculated score, updating the running statistics
+        of the bureau and checking the retirement thresholds
+        """
+        self._set_score(score)
+        self.retire(score)
+
+    def retire(self, score):
+        """
+        Check a new score against the retirement thresholds in
+        config.thresholds. The first score below bogus or above real
+        retires the subject, recording how many classifications it
+        took, and queues it in the bureau (see Bureau.retired).
+        Retirement is permanent
+        """
+        if self.retired is not None or config.thresholds is None:
+            return
+
+        bogus, real = config.thresholds
+        if score < bogus or score > real:
+            self.retired = (len(self.transactions), score)
+            if self.bureau is not None:
+                self.bureau.mark_retired(self.id)
+
+    def relink(self):
+        """
+        Rebuild the links between transactions from their order
+        """
+        last = None
+        for t in sorted(self.transactions.values(), key=lambda t: t.order):
+            t.left = last
+            if last is not None:
+                last.right = t
+            last = t
+
+        if last is not None:
+            last.right = None
+        self.last = last
+
+    def __setstate__(self, state):
+        # Transactions are pickled without their links, see
+        # Transaction.__getstate__
+        data, slots = state if type(state) is tuple else (state, None)
+        for attrs in (data, slots):
+            for key, value in (attrs or {}).items():
+                setattr(self, key, value)
+
+        self.relink()
+
+    def notify(self, id_, bureau):
+        """
+        User notifies this subject of its score. Only marks the
+        transaction as changed if the score is different
+        """
+        t = self.transactions[id_]
+        t.notify(bureau.agent(id_))
+
+        if t.changed:
+            self.update(id_)
+
     @property
     def first_change(self):
         if len(self.changed) == 0:
@@ -212,20 +374,216 @@ class Ledger(ledger.Ledger):
     #             self.first_change = transaction
 
 
+class TreeLedger(Ledger):
+    """
+    Subject ledger that keeps the log likelihood ratio of every
+    transaction in a Fenwick tree.
+
+    The score is the prior times the product of the likelihood
+    ratios, so in log odds a changed user score is a single
+    O(log n) point update, and the score after any transaction is
+    a prefix sum. Saturated ratios are clipped, see clip_log_odds.
+    Transaction scores are only rebuilt when the history is
+    requested.
+
+    Select with config.subject_ledger = 'tree'
+    """
+
+    __slots__ = ('tree', '_history')
+
+    def __init__(self, id_):
+        super().__init__(id_)
+        self.tree = FenwickTree()
+        # Whether the transaction scores match the tree
+        self._history = True
+
+    def _calculate(self):
+        return expit(logit(config.p0) + self.tree.total)
+
+    def recalculate(self):
+        for id_ in self.changed:
+            t = self.transactions[id_]
+            t.commit_change()
+            self.tree.set(t.order, clip_log_odds(t.likelihood()))
+            self._history = False
+
+        self._update(self._calculate())
+        self.clear_changes()
+        return self._score
+
+    def add(self, transaction):
+        if transaction.id in self.transactions:
+            return None
+
+        id_ = ledger.Ledger.add(self, transaction)
+        self.tree.append(clip_log_odds(transaction.likelihood()))
+
+        if not config.back_update:
+            self._update(self._calculate())
+            transaction.score = self._score
+        else:
+            self._history = False
+
+        self.last = transaction
+        return id_
+
+    def relink(self):
+        """
+        Rebuild the links between transactions and the tree of
+        their likelihood ratios
+        """
+        super().relink()
+
+        self.tree = FenwickTree()
+        for t in self:
+            self.tree.append(clip_log_odds(t.likelihood()))
+
+    def history(self):
+        """
+        Score after each transaction, in the order they were added.
+        Rebuilds the transaction scores from the tree if needed
+        """
+        if not self._history:
+            prior = logit(config.p0)
+            for t in self:
+                t.score = expit(prior + self.tree.prefix(t.order + 1))
+            self._history = True
+
+        return super().history()
+
+    def commit(self, score):
+        for t in self:
+            self.tree.set(t.order, clip_log_odds(t.likelihood()))
+        self._history = True
+        super().commit(score)
+
+    @property
+    def first_change(self):
+        # Changes are applied as point updates, order is irrelevant
+        return None
+
+
+class LiteLedger(Ledger):
+    """
+    Subject ledger that only keeps the current score. Transactions
+    keep their user and committed user score, all a recalculation
+    needs, but no score and no links to their neighbours. The score
+    is the prior plus the running total of the transaction log
+    likelihood ratios, in log odds. Saturated ratios are clipped, see
+    clip_log_odds, and the total is summed again after every n
+    changes so rounding drift does not grow.
+
+    Used when config.keep_history is off
+    """
+
+    __slots__ = ('total', '_changes')
+
+    def __init__(self, id_):
+        super().__init__(id_)
+        self.total = 0.
+        # Changes since the total was last summed
+        self._changes = 0
+
+    def _calculate(self):
+        return expit(logit(config.p0) + self.total)
+
+    def recalculate(self):
+        for id_ in self.changed:
+            t = self.transactions[id_]
+            if t.changed:
+                old = clip_log_odds(t.likelihood())
+                t.commit_change()
+                self.total += clip_log_odds(t.likelihood()) - old
+                self._changes += 1
+
+        if self._changes > len(self.transactions):
+            self.resum()
+
+        self._update(self._calculate())
+        self.clear_changes()
+        return self._score
+
+    def add(self, transaction):
+        if transaction.id in self.transactions:
+            return None
+
+        id_ = ledger.Ledger.add(self, transaction)
+        self.total += clip_log_odds(transaction.likelihood())
+
+        if not config.back_update:
+            self._update(self._calculate())
+
+        return id_
+
+    def resum(self):
+        """
+        Sum the running total again from the transactions
+        """
+        self.total = math.fsum(clip_log_odds(t.likelihood()) for t in self)
+        self._changes = 0
+
+    def relink(self):
+        """
+        Rebuild the running total from the transactions
+        """
+        self.resum()
+
+    def history(self):
+        raise ValueError('Subject score history is not kept with '
+                         'config.keep_history off')
+
+    def commit(self, score):
+        # The committed user scores are already in the transactions.
+        # Summing them keeps the total finite, logit(score) is not
+        # for a saturated score
+        self.resum()
+        super().commit(score)
+
+    @property
+    def first_change(self):
+        return None
+
+
 class Transaction(ledger.Transaction):
+    __slots__ = ('user_score', 'logodds', 'right', 'left')
+
     def __init__(self, user, annotation):
         super().__init__(user, annotation)
 
         self.user_score = None
+        # Subject score in log odds, only used with config.log_odds
+        self.logodds = None
         self.right = None
         self.left = None
 
         self.notify(user)
         self.commit_change()
 
+    def __getstate__(self):
+        # Leave out the links to neighbouring transactions. Pickling
+        # them recurses once per transaction in the ledger, which
+        # overflows the stack for well classified subjects. The
+        # ledger relinks its transactions when unpickled
+        state = {}
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if slot not in ('left', 'right') and hasattr(self, slot):
+                    state[slot] = getattr(self, slot)
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+        self.left = None
+        self.right = None
+
     def commit_change(self):
         self.user_score = self.change
 
+    @property
+    def changed(self):
+        return self.user_score != self.change
+
     def notify(self, agent):
         try:
             self.change = agent.score
@@ -239,6 +597,22 @@ class Transaction(ledger.Transaction):
             return config.p0
         return self.left.score
 
+    def get_prior_logodds(self):
+        if self.left is None or self.left.logodds is None:
+            return logit(self.get_prior())
+        return self.left.logodds
+
+    def likelihood(self):
+        """
+        Log likelihood ratio of this transaction using the committed
+        user score, how much it moves the subject score in log odds
+        """
+        u0, u1 = self.user_score
+
+        if self.annotation == 1:
+            return log_ratio(u1, 1 - u0)
+        return log_ratio(1 - u1, u0)
+
     def calculate(self, prior=None):
         # Calculation when annotation 1
         #           s*u1
@@ -250,6 +624,9 @@ class Transaction(ledger.Transaction):
         # -------------------------
         #    s*(1-u1) + (1-s)*u0
 
+        if config.log_odds:
+            return self.calculate_logodds(prior)
+
         if prior is None:
             prior = self.get_prior()
         u0, u1 = self.user_score
@@ -273,6 +650,28 @@ class Transaction(ledger.Transaction):
         self.score = score
         return score
 
+    def calculate_logodds(self, prior=None):
+        """
+        Same update as calculate, in log odds. The classification
+        adds its log likelihood ratio to the prior log odds, so there
+        is no division that can collapse when user scores saturate.
+
+        Sets and returns the score as a probability
+        """
+        if prior is None:
+            prior = self.get_prior_logodds()
+        else:
+            prior = logit(prior)
+
+        logodds = prior + self.likelihood()
+        # inf - inf, contradicting saturated users; leave score unchanged
+        if math.isnan(logodds):
+            logodds = prior
+
+        self.logodds = logodds
+        self.score = expit(logodds)
+        return self.score
+
     def __str__(self):
         score = self.score
         if score is None:
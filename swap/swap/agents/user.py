@@ -7,6 +7,8 @@ from swap.agents.agent import Agent, MultiStat
 import swap.agents.ledger as ledger
 import swap.config as config
 
+import numpy as np
+
 
 class User(Agent):
     """
@@ -15,6 +17,8 @@ class User(Agent):
 
     class_name = 'user'
 
+    __slots__ = ()
+
     def __init__(self, user_name):
         """
             Initialize a User Agent
@@ -87,6 +91,20 @@ class User(Agent):
 
         return MultiStat(*data)
 
+    @staticmethod
+    def stat_values(score):
+        if score is None:
+            return ()
+        return ((0, score[0]), (1, score[1]))
+
+    @staticmethod
+    def running_stats(stat):
+        return MultiStat().add(0, stat(0).stat()).add(1, stat(1).stat())
+
+    @staticmethod
+    def recalculate(ledgers):
+        Ledger.recalculate_batch(ledgers)
+
 
 # class User_Score_Tracker(Tracker):
 #     """
@@ -161,6 +179,8 @@ class User(Agent):
 
 
 class Ledger(ledger.Ledger):
+    __slots__ = ('no', 'yes')
+
     def __init__(self, id_):
         super().__init__(id_)
         self.no = Counter()
@@ -168,11 +188,6 @@ class Ledger(ledger.Ledger):
 
         self.recalculate()
 
-    @ledger.Ledger.score.setter
-    def score(self, new):
-        if self._score != new:
-            self._score = new
-
     def add(self, transaction):
         # Remove gold label from transaction, will be put back in when
         # recalculating
@@ -184,6 +199,31 @@ class Ledger(ledger.Ledger):
 
         return id_
 
+    def notify(self, id_, bureau):
+        """
+        Subject notifies this user of its gold label. Only marks the
+        transaction as changed if the gold label is different
+        """
+        t = self.transactions[id_]
+        t.notify(bureau.agent(id_))
+
+        if t.changed:
+            self.update(id_)
+
+    def notify_golds(self, subjects):
+        """
+        Several subjects notify this user of their gold labels at once
+
+        Args:
+            subjects: (list) subject agents whose gold label changed
+        """
+        for subject in subjects:
+            t = self.transactions[subject.id]
+            t.notify(subject)
+
+            if t.changed:
+                self.update(subject.id)
+
     def counter(self, gold):
         if gold == 0:
             return self.no
@@ -216,7 +256,8 @@ class Ledger(ledger.Ledger):
                 t.commit_change()
                 self.action(t, 'new')
 
-                t.score = self._calculate()
+                if config.keep_history:
+                    t.score = self._calculate()
 
         score = self._calculate()
 
@@ -228,8 +269,100 @@ class Ledger(ledger.Ledger):
     def _calculate(self):
         return (self.no.score, self.yes.score)
 
+    @staticmethod
+    def recalculate_batch(ledgers):
+        """
+        Recalculate several user ledgers at once. Gives the same scores
+        and score histories as calling recalculate on each ledger.
+
+        The changed transactions of every ledger are collected into
+        arrays of (user, annotation, old gold, new gold), the seen and
+        matched counts of all users are updated with np.add.at, and the
+        scores of all users are recalculated together
+
+        Args:
+            ledgers: (list) user ledgers to recalculate
+        """
+        users = []
+        transactions = []
+        rows = []
+        for i, ledger_ in enumerate(ledgers):
+            get = ledger_.transactions.__getitem__
+            n = len(transactions)
+            for t in map(get, dict.fromkeys(ledger_.changed)):
+                # Same as Transaction.changed and commit_change,
+                # inlined for speed
+                gold = t.gold
+                change = t.change
+                if gold != change:
+                    transactions.append(t)
+                    rows.append((t.annotation, gold, change))
+                    t.gold = change
+            users += [i] * (len(transactions) - n)
+
+        # Annotation, old and new gold label of every change. Without
+        # a gold label (None or -1) neither label matches
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        annotations, old, new = rows.T
+
+        # Columns are no.seen, no.matched, yes.seen, yes.matched
+        counts = np.array([(l.no.seen, l.no.matched,
+                            l.yes.seen, l.yes.matched) for l in ledgers],
+                          dtype=np.int64).reshape(-1, 4)
+
+        if len(transactions) > 0:
+            users = np.array(users, dtype=np.int64)
+
+            delta = np.empty((len(users), 4), dtype=np.int64)
+            for label in (0, 1):
+                was = old == label
+                now = new == label
+                match = annotations == label
+                delta[:, 2 * label] = now.astype(np.int64) - was
+                delta[:, 2 * label + 1] = \
+                    (now & match).astype(np.int64) - (was & match)
+
+            if config.keep_history:
+                # Counts after each change, in order within each user.
+                # Rows of a user are contiguous
+                cumulative = np.cumsum(delta, axis=0)
+                first = np.r_[True, users[1:] != users[:-1]]
+                start = np.maximum.accumulate(
+                    np.where(first, np.arange(len(users)), 0))
+                history = counts[users] + cumulative - \
+                    np.where((start > 0)[:, None], cumulative[start - 1], 0)
+
+                history = Ledger._scores(history)
+                for t, no, yes in zip(transactions, history[:, 0].tolist(),
+                                      history[:, 1].tolist()):
+                    t.score = (no, yes)
+
+            np.add.at(counts, users, delta)
+
+        scores = Ledger._scores(counts)
+        for ledger_, c, no, yes in zip(ledgers, counts.tolist(),
+                                       scores[:, 0].tolist(),
+                                       scores[:, 1].tolist()):
+            ledger_.no.seen, ledger_.no.matched, \
+                ledger_.yes.seen, ledger_.yes.matched = c
+            ledger_.clear_changes()
+            ledger_.score = (no, yes)
+
+    @staticmethod
+    def _scores(counts):
+        """
+        (no, yes) scores from rows of counts, with the same gamma
+        smoothing as Counter
+        """
+        gamma = config.gamma
+        seen = counts[:, 0::2].astype(np.float64)
+        matched = counts[:, 1::2].astype(np.float64)
+        return (matched + gamma) / (seen + gamma * 2)
+
 
 class Transaction(ledger.Transaction):
+    __slots__ = ('gold',)
+
     def __init__(self, subject, annotation):
         super().__init__(subject, annotation)
 
@@ -265,6 +398,8 @@ class Transaction(ledger.Transaction):
 
 
 class Counter:
+    __slots__ = ('seen', 'matched')
+
     def __init__(self):
         self.seen = 0
         self.matched = 0
@@ -5,8 +5,10 @@
 from swap.caesar.control import ThreadedControl
 from swap.caesar.auth import Auth
 from swap.caesar.utils.requests import Requests
+from swap.caesar.utils.dispatcher import Dispatcher
 import swap.config as config
 
+import json
 import logging
 from flask import Flask, request, jsonify, Response
 from functools import wraps
@@ -81,20 +83,34 @@ def needs_auth(func):
 
 class API:
 
-    def __init__(self, control_thread):
+    def __init__(self, control_thread, dispatcher=None):
         self.app = Flask(__name__)
         self.control = control_thread
+        # Sends scores to caesar off the SWAP thread
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        self.dispatcher = dispatcher
 
         user = config.online_swap._auth_username
         token = config.online_swap._auth_key
         self._auth = Auth(user, token)
 
         self._recent_cl = []
+        self._recent_set = set()
 
-    def run(self):
+        # Body of the last /scores response,
+        # (view sequence, query string, body)
+        self._scores_cache = None
+
+        self._routes()
+
+    def _routes(self):
         self._route('/', 'status', self.status, ['GET'])
         self._route('/scores', 'scores', self.scores, ['GET'])
+        self._route('/metrics', 'metrics', self.metrics, ['GET'])
         self._route('/classify', 'classify', self.classify, ['POST'])
+
+    def run(self):
         self.app.run()
 
     def _route(self, route, name, func, methods=('GET')):
@@ -125,7 +141,7 @@ class API:
         if not self._is_recent_cl(data):
             logger.info('Classification not recently received')
             logger.debug('received data %s', str(data))
-            self.control.queue('classify', data, Requests.respond)
+            self.control.queue('classify', data, self.dispatcher.submit)
         else:
             logger.info('Filtering duplicate classification')
 
@@ -137,20 +153,88 @@ class API:
     @needs_auth
     def scores(self):
         """
-        Return current score export
+        Return the subject scores of the last published view, see
+        swap.utils.scoreview. Without parameters returns
+        {subject id: score} of every subject.
+
+        Query parameters:
+            since: only subjects that changed after this sequence
+                number, taken from the X-Sequence header of an
+                earlier response
+            offset, limit: page of the subjects, in the order SWAP
+                first saw them
+            format: 'jsonl' streams one score per line
+
+        With since, offset or limit the response is
+        {'sequence', 'total', 'offset', 'scores': [score]}.
+        The ETag is the view sequence, requests with a matching
+        If-None-Match get 304 Not Modified
         """
-        scores = self.control.scores()
+        view = self.control.view()
+        etag = str(view.sequence)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        args = request.args
+        since = args.get('since', None, type=int)
+        offset = max(args.get('offset', 0, type=int), 0)
+        limit = args.get('limit', None, type=int)
+        lines = args.get('format') == 'jsonl'
+
+        rows = view.rows(since)
+        total = len(rows)
+        if limit is not None:
+            rows = rows[offset:offset + max(limit, 0)]
+        else:
+            rows = rows[offset:]
 
-        return jsonify(scores.full_dict())
+        if lines:
+            def generate():
+                for record in view.records(rows):
+                    yield json.dumps(record) + '\n'
+            response = Response(generate(), mimetype='application/x-ndjson')
+        else:
+            key = (view.sequence, request.query_string)
+            cache = self._scores_cache
+            if cache is not None and cache[:2] == key:
+                body = cache[2]
+            else:
+                records = view.records(rows)
+                if since is None and offset == 0 and limit is None:
+                    data = {record['id']: record for record in records}
+                else:
+                    data = {'sequence': view.sequence, 'total': total,
+                            'offset': offset, 'scores': list(records)}
+                body = json.dumps(data)
+                self._scores_cache = key + (body,)
+            response = Response(body, mimetype='application/json')
+
+        response.set_etag(etag)
+        response.headers['X-Sequence'] = etag
+        return response
+
+    @needs_auth
+    def metrics(self):
+        """
+        Return queue depth and batch counters of the worker thread
+        """
+        metrics = self.control.metrics()
+        metrics['dispatch'] = self.dispatcher.metrics()
+        return jsonify(metrics)
 
     def _is_recent_cl(self, data):
         id_ = data['id']
-        if id_ in self._recent_cl:
+        if id_ in self._recent_set:
+            return True
+        if self.control is not None and self.control.seen(id_):
             return True
 
         self._recent_cl.append(id_)
+        self._recent_set.add(id_)
         if len(self._recent_cl) > 10:
-            self._recent_cl.pop(0)
+            self._recent_set.discard(self._recent_cl.pop(0))
         return False
 
 
@@ -3,12 +3,17 @@ import swap.control
 import swap.config as config
 from swap.utils.classification import Classification
 from swap.utils.parsers import ClassificationParser
+from swap.caesar.wal import WriteAheadLog
+from swap.utils.idset import IdSet
 from swap.db import DB
 
+import numpy as np
 import sys
+import time
 import threading
 import logging
-from queue import Queue
+from collections import OrderedDict
+from queue import Queue, Empty
 
 logger = logging.getLogger(__name__)
 
@@ -52,8 +57,90 @@ class OnlineControl(swap.control.Control):
         if config.database.name == 'swapDB':
             raise Exception('Refusing to use swapDB database in online mode')
             sys.exit(1)
+
+        self.wal = None
+        wal = config.online_swap.wal
+        if wal.directory is not None:
+            self.wal = WriteAheadLog(
+                wal.directory, wal.checkpoint_every, wal.keep, wal.fsync)
+
+        # Classification ids already received, see load_seen
+        self.seen = None
+        # Checkpoint copied but not written yet, see begin_checkpoint
+        self._checkpoint = None
+
         logger.debug('Initialized online controller')
 
+    def recover(self):
+        """
+        Restore SWAP from the latest checkpoint and the write-ahead
+        log instead of replaying every classification in the database
+
+        Returns
+        -------
+        bool
+            Whether SWAP was recovered
+        """
+        if self.wal is None:
+            return False
+
+        swap = self.wal.recover()
+        if swap is None:
+            return False
+
+        # Pick up gold labels that changed while offline
+        swap.set_gold_labels(self.get_gold_labels())
+        if config.back_update:
+            swap.process_changes()
+
+        self.swap = swap
+        return True
+
+    def checkpoint(self):
+        """
+        Write a checkpoint, if the write-ahead log is enabled
+        """
+        self.begin_checkpoint()
+        self.write_checkpoint()
+
+    def begin_checkpoint(self):
+        """
+        Copy SWAP for a checkpoint, written by write_checkpoint. Only
+        the copy needs SWAP to stay unchanged, see
+        WriteAheadLog.begin_checkpoint
+        """
+        if self.wal is None:
+            return
+
+        # Never drop a copied checkpoint
+        self.write_checkpoint()
+        self._checkpoint = self.wal.begin_checkpoint(self.swap)
+
+    def write_checkpoint(self):
+        """
+        Write the checkpoint copied by begin_checkpoint, if any
+        """
+        pending, self._checkpoint = self._checkpoint, None
+        if pending is not None:
+            self.wal.write_checkpoint(pending)
+
+    def load_seen(self):
+        """
+        Load the ids of every classification in the database into
+        memory, duplicates are then checked without a database query.
+        Also includes the classifications in the write-ahead log, which
+        may have been replayed without reaching the database
+        """
+        ids = [DB().classifications.ids(), DB().caesar.ids()]
+        if self.wal is not None:
+            logged = (record['classification_id']
+                      for record in self.wal.records())
+            ids.append(np.array([id_ for id_ in logged if id_ is not None],
+                                dtype=np.int64))
+        ids = np.concatenate(ids)
+        self.seen = IdSet(ids, bloom=config.online_swap.dedup.bloom)
+        logger.info('Loaded %d classification ids', len(self.seen))
+
     def subjects_changed(self):
         # return subjects whose scores have changed
         pass
@@ -75,15 +162,16 @@ class OnlineControl(swap.control.Control):
     def gen_cl(data):
         return Classification.generate(data)
 
-    @staticmethod
-    def cl_exists(cl):
+    def cl_exists(self, cl):
         def id_(cl):
             return cl['classification_id']
 
+        if self.seen is not None:
+            return id_(cl) in self.seen
+
         return DB().caesar.exists(id_(cl)) or \
             DB().classifications.exists(id_(cl))
 
-
     def classify(self, raw_cl):
         # Add classification from caesar
         data = self.parse_raw(raw_cl)
@@ -92,17 +180,89 @@ class OnlineControl(swap.control.Control):
         logger.debug('Checking if already received classification')
         if not self.cl_exists(data):
 
+            # Log before anything else sees the classification, so a
+            # crash after this point is recovered from the log
+            checkpoint = self.wal is not None and self.wal.append(data)
+
             logger.debug('Uploading classification to caesar db: %s',
                          str(data))
-            DB().caesar.insert(data)
+            if self.seen is not None:
+                # Already known to be new, skip the check of insert
+                DB().caesar.insert_many([data])
+                self.seen.add(data['classification_id'])
+            else:
+                DB().caesar.insert(data)
 
             logger.debug('Adding classification from network: %s',
                          str(cl))
             self.swap.classify(cl)
 
+            if checkpoint:
+                self.checkpoint()
+
             subject = self.swap.subjects.get(cl.subject)
             return subject
 
+    def classify_batch(self, raw_cls):
+        """
+        Add several classifications from caesar. Duplicates are checked
+        and new classifications stored with one database query per
+        collection, then classified in order
+
+        Parameters
+        ----------
+        raw_cls : list
+            Raw classifications from caesar
+
+        Returns
+        -------
+        list
+            Subject of each classification, None for classifications
+            already received. A checkpoint that became due is only
+            copied, the caller writes it with write_checkpoint
+        """
+        data = [self.parse_raw(raw_cl) for raw_cl in raw_cls]
+        ids = [item['classification_id'] for item in data]
+
+        logger.debug('Checking if already received %d classifications',
+                     len(ids))
+        if self.seen is not None:
+            seen = self.seen.existing(ids)
+        else:
+            seen = DB().caesar.existing(ids) | \
+                DB().classifications.existing(ids)
+
+        new = []
+        for i, item in enumerate(data):
+            if ids[i] not in seen:
+                seen.add(ids[i])
+                new.append(i)
+
+        # Log before storing or classifying, see classify
+        checkpoint = False
+        if self.wal is not None:
+            for i in new:
+                checkpoint = self.wal.append(data[i]) or checkpoint
+
+        if len(new) > 0:
+            logger.debug('Uploading %d classifications to caesar db',
+                         len(new))
+            DB().caesar.insert_many([data[i] for i in new])
+            if self.seen is not None:
+                for i in new:
+                    self.seen.add(ids[i])
+
+        subjects = [None] * len(data)
+        for i in new:
+            cl = self.gen_cl(data[i])
+            self.swap.classify(cl)
+            subjects[i] = self.swap.subjects.get(cl.subject)
+
+        if checkpoint:
+            self.begin_checkpoint()
+
+        return subjects
+
     def run(self, amount=None):
         def _amt(stats):
             return stats['first_classifications']
@@ -126,8 +286,18 @@ class Message:
 
 class ThreadedControl(threading.Thread):
 
-    def __init__(self, swap_=None, args=(), kwargs=None):
+    def __init__(self, swap_=None, args=(), kwargs=None, on_retire=None):
+        """
+        Parameters
+        ----------
+        swap_ : swap.swap.SWAP
+            (optional) SWAP to start from instead of replaying
+        on_retire : callable
+            (optional) Called with (subject id, classifications, score)
+            when a subject crosses config.thresholds, see SWAP.retired
+        """
         threading.Thread.__init__(self, args=(), kwargs=None)
+        self.on_retire = on_retire
 
         self._queue = Queue()
         self.exit = threading.Event()
@@ -136,10 +306,24 @@ class ThreadedControl(threading.Thread):
         self.control_lock = threading.Lock()
         self.control = OnlineControl()
 
+        self._metrics = {
+            'batches': 0,
+            'classifications': 0,
+            'duplicates': 0,
+            'responses': 0,
+            'last_batch': 0,
+            'max_batch': 0,
+            'max_queue_depth': 0,
+        }
+
         if swap_ is not None:
             self.control.setSWAP(swap_)
-        else:
+        elif not self.control.recover():
             self.control.run()
+            # Start the log from a full checkpoint
+            self.control.checkpoint()
+
+        self.control.swap.publish()
 
     def command(self, message):
         if message.command == 'classify':
@@ -149,47 +333,163 @@ class ThreadedControl(threading.Thread):
         logger.info('queueing %s %s %s', command, type(data), str(callback))
         self._queue.put(Message(command, data, callback))
 
+    def next_batch(self):
+        """
+        Wait for the next message, then take more messages from the
+        queue until config.online_swap.batch.size messages or
+        config.online_swap.batch.wait milliseconds
+
+        Returns
+        -------
+        list
+            Messages, in the order they were queued
+        """
+        limits = config.online_swap.batch
+        batch = [self._queue.get()]
+
+        depth = self._queue.qsize() + 1
+        self._metrics['max_queue_depth'] = \
+            max(self._metrics['max_queue_depth'], depth)
+
+        deadline = time.monotonic() + limits.wait / 1000
+        while len(batch) < limits.size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+
+        return [message for message in batch if message is not None]
+
     def classify(self, message):
-        classification = message.data
-        if classification is not None:
-            with self.control_lock:
-                logger.info('classifying')
-                subject = self.control.classify(classification)
+        self.classify_batch([message])
 
-                if subject is not None:
-                    logger.info('responding with subject %s score %.4f',
-                                str(subject.id), subject.score)
-                    message.callback(subject)
-                else:
-                    logger.info('Already classified, not responding')
-        else:
-            logger.error('Classification was None: %s', str(classification))
+    def classify_batch(self, messages):
+        """
+        Classify several messages together, then respond once for
+        every subject with its latest score
+        """
+        valid = []
+        for message in messages:
+            if message.data is None:
+                logger.error('Classification was None: %s', str(message.data))
+            else:
+                valid.append(message)
+
+        if len(valid) == 0:
+            return
 
-    def scores(self):
         with self.control_lock:
-            logger.info('generating score export')
-            scores = self.control.swap.score_export()
-            logger.info('done')
+            logger.info('classifying %d', len(valid))
+            subjects = self.control.classify_batch(
+                [message.data for message in valid])
 
-            return scores
+            responses = OrderedDict()
+            for message, subject in zip(valid, subjects):
+                if subject is None:
+                    logger.info('Already classified, not responding')
+                    self._metrics['duplicates'] += 1
+                    continue
+                key = (message.callback, subject.id)
+                responses.pop(key, None)
+                responses[key] = (message.callback, subject)
+
+            if len(responses) > 0:
+                self.control.swap.publish()
+
+            for callback, subject in responses.values():
+                logger.info('responding with subject %s score %.4f',
+                            str(subject.raw_id), subject.score)
+                if callback is not None:
+                    callback(subject)
+            self.retire()
+
+        # Write a checkpoint copied in classify_batch without holding
+        # the lock
+        self.control.write_checkpoint()
+
+        metrics = self._metrics
+        metrics['batches'] += 1
+        metrics['classifications'] += len(valid)
+        metrics['responses'] += len(responses)
+        metrics['last_batch'] = len(valid)
+        metrics['max_batch'] = max(metrics['max_batch'], len(valid))
+
+    def seen(self, classification_id):
+        """
+        Whether a classification was already received, False until
+        the worker has loaded the ids, see OnlineControl.load_seen
+        """
+        seen = self.control.seen
+        try:
+            return seen is not None and int(classification_id) in seen
+        except ValueError:
+            return False
+
+    def metrics(self):
+        """
+        Counters of the worker thread and the current queue depth
+
+        Returns
+        -------
+        dict
+        """
+        metrics = dict(self._metrics)
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['mean_batch'] = metrics['classifications'] / \
+            max(metrics['batches'], 1)
+        return metrics
+
+    def retire(self):
+        """
+        Report subjects that retired since the last classification
+        """
+        for id_, count, score in self.control.swap.retired():
+            logger.info('subject %s retired after %d classifications '
+                        'with score %.4f', str(id_), count, score)
+            if self.on_retire is not None:
+                self.on_retire(id_, count, score)
+
+    def view(self):
+        """
+        Last published scores. An immutable view, so reading it never
+        waits for or blocks classifications
+
+        Returns
+        -------
+        swap.utils.scoreview.ScoreView
+        """
+        return self.control.swap.view()
 
     def run(self):
         """
         Main thread for processing classifications
         """
+        if config.online_swap.dedup.enabled and self.control.seen is None:
+            with self.control_lock:
+                self.control.load_seen()
+
         # Ensure thread doesn't exit
         # Wait for classifications in queue
         while not self.exit.is_set():
 
-            message = self._queue.get()
-            if message is not None:
-                logger.debug('received message')
-                try:
-                    self.command(message)
-                except Exception as e:
-                    logger.error(e)
-                    raise e
-                    sys.exit(1)
+            messages = self.next_batch()
+            logger.debug('received %d messages', len(messages))
+            try:
+                classify = [message for message in messages
+                            if message.command == 'classify']
+                self.classify_batch(classify)
+
+                for message in messages:
+                    if message.command != 'classify':
+                        self.command(message)
+            except Exception as e:
+                logger.error(e)
+                raise e
+                sys.exit(1)
 
         logger.warning('thread exiting')
 
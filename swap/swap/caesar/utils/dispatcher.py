@@ -0,0 +1,258 @@
+################################################################
+# Sends subject scores to caesar off the SWAP worker thread
+
+"""
+    Dispatcher:
+        Queue of reductions to PUT to caesar, sent by a small pool of
+        threads sharing one persistent HTTP session. The SWAP worker
+        only builds the request body and queues it, so classification
+        throughput does not depend on caesar's latency.
+
+        Scores are held for config.online_swap.dispatch.interval
+        seconds, keyed by subject, and a newer score of the same
+        subject replaces the held one. Requests then scale with the
+        number of active subjects rather than the classification rate.
+
+        Failed requests are retried with exponential backoff. The
+        caesar authorization header is cached, and fetched again only
+        when caesar answers 401.
+"""
+
+import swap.config as config
+from swap.caesar.utils.address import Address
+from swap.caesar.utils.requests import Requests
+from swap.caesar.auth import AuthCaesar
+
+from collections import OrderedDict
+from queue import Queue
+import threading
+import time
+import requests
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """
+    Thread pool sending reductions to caesar
+    """
+
+    def __init__(self, address=None, workers=None, retries=None,
+                 backoff=None, timeout=None, interval=None, auth=None):
+        """
+        Parameters
+        ----------
+        address : str
+            (optional) URL to PUT reductions to, defaults to
+            Address.reducer()
+        workers, retries, backoff, timeout, interval
+            (optional) Override config.online_swap.dispatch
+        auth : callable
+            (optional) Returns the authorization headers, defaults to
+            AuthCaesar().auth
+        """
+        c = config.online_swap.dispatch
+
+        self.address = address
+        self.workers = c.workers if workers is None else workers
+        self.retries = c.retries if retries is None else retries
+        self.backoff = c.backoff if backoff is None else backoff
+        self.timeout = c.timeout if timeout is None else timeout
+        self.interval = c.interval if interval is None else interval
+        self._auth = auth
+
+        # Newest reduction of each subject waiting for the next flush
+        self._buffer = OrderedDict()
+        self._buffer_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._headers = None
+        self.session = None
+
+        self._metrics = {
+            'sent': 0,
+            'failed': 0,
+            'retries': 0,
+            'coalesced': 0,
+        }
+
+    def start(self):
+        """
+        Open the session and start the sending threads, called by the
+        first submit
+        """
+        with self._lock:
+            if len(self._threads) > 0:
+                return
+
+            if self.address is None:
+                self.address = Address.reducer()
+
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.workers)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+            self._stop.clear()
+            if self.interval > 0:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, daemon=True)
+                self._flusher.start()
+
+    def submit(self, subject):
+        """
+        Queue the current score of a subject. The request body is built
+        immediately, so later changes to the subject are not sent. A
+        score of the same subject still waiting to be sent is replaced
+
+        Parameters
+        ----------
+        subject : swap.agents.subject.Subject
+        """
+        if len(self._threads) == 0:
+            self.start()
+
+        body = Requests.reduction(subject)
+        if self.interval <= 0:
+            self._queue.put(body)
+            return
+
+        with self._buffer_lock:
+            if subject.raw_id in self._buffer:
+                self._metrics['coalesced'] += 1
+            self._buffer[subject.raw_id] = body
+
+    __call__ = submit
+
+    def flush(self):
+        """
+        Queue the held reductions for sending
+        """
+        with self._buffer_lock:
+            buffer = self._buffer
+            self._buffer = OrderedDict()
+
+        for body in buffer.values():
+            self._queue.put(body)
+
+    def join(self):
+        """
+        Send the held reductions and wait until every queued
+        reduction was sent or dropped
+        """
+        self.flush()
+        self._queue.join()
+
+    def stop(self):
+        """
+        Send what is queued, then stop the sending threads
+        """
+        self._stop.set()
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
+        if self.session is not None:
+            self.session.close()
+
+    def metrics(self):
+        """
+        Counters of sent, failed, retried and coalesced reductions,
+        and the number held and queued
+
+        Returns
+        -------
+        dict
+        """
+        metrics = dict(self._metrics)
+        metrics['pending'] = self._queue.unfinished_tasks
+        metrics['buffered'] = len(self._buffer)
+        return metrics
+
+    # ----------------------------------------------------------------
+
+    def headers(self, refresh=False):
+        """
+        Request headers with the cached authorization header
+        """
+        with self._lock:
+            if self._headers is None or refresh:
+                auth = self._auth or AuthCaesar().auth
+                headers = Requests.headers()
+                headers.update(auth())
+                self._headers = headers
+            return self._headers
+
+    def _count(self, key):
+        with self._lock:
+            self._metrics[key] += 1
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _run(self):
+        while True:
+            body = self._queue.get()
+            try:
+                if body is None:
+                    return
+                self.send(body)
+            except Exception as e:
+                logger.error(e)
+            finally:
+                self._queue.task_done()
+
+    def send(self, body):
+        """
+        PUT one reduction, retrying with backoff
+
+        Returns
+        -------
+        bool
+            Whether caesar accepted the reduction
+        """
+        delay = self.backoff
+        refresh = False
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self._count('retries')
+                time.sleep(delay)
+                delay *= 2
+
+            try:
+                r = self.session.put(
+                    self.address, json=body, timeout=self.timeout,
+                    headers=self.headers(refresh))
+            except requests.RequestException as e:
+                logger.warning('PUT to %s failed: %s', self.address, e)
+                continue
+
+            if r.status_code in [200, 203, 204]:
+                self._count('sent')
+                return True
+
+            logger.warning('PUT to %s returned %d',
+                           self.address, r.status_code)
+            # Retry server errors, throttling and expired tokens
+            refresh = r.status_code == 401
+            if r.status_code < 500 and r.status_code != 429 \
+                    and not refresh:
+                break
+
+        logger.error('Dropping reduction %s', str(body))
+        self._count('failed')
+        return False
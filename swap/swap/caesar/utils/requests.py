@@ -64,23 +64,13 @@ class Requests:
         """
         PUT subject score to Caesar
         """
-        c = config.online_swap
-
         address = Address.reducer()
-
-        body = {
-            'reduction': {
-                'subject_id': subject.id,
-                'data': {
-                    c.caesar.field: subject.score
-                }
-            }
-        }
+        body = cls.reduction(subject)
 
         print('responding!')
         # address='http://httpbin.org/put'
         logger.info('PUT to %s subject %d score %.4f to caesar',
-                    address, subject.id, subject.score)
+                    address, subject.raw_id, subject.score)
 
         headers = cls.headers()
         headers.update(AuthCaesar().auth())
@@ -89,6 +79,20 @@ class Requests:
 
         return r
 
+    @staticmethod
+    def reduction(subject):
+        """
+        Request body of a subject score reduction
+        """
+        return {
+            'reduction': {
+                'subject_id': subject.raw_id,
+                'data': {
+                    config.online_swap.caesar.field: subject.score
+                }
+            }
+        }
+
     @classmethod
     def config_caesar(cls, method='on'):
 
@@ -0,0 +1,284 @@
+################################################################
+# Write-ahead log and checkpoints for online SWAP
+
+"""
+    WriteAheadLog:
+        Keeps online SWAP recoverable without replaying the whole
+        database. Every accepted classification is appended to a log
+        segment as a json line, and every few thousand
+        classifications the SWAP is written to a checkpoint snapshot
+        (see swap.utils.snapshot) and a new log segment is started.
+
+        On restart the latest complete checkpoint is loaded and only
+        the classifications logged after it are replayed, so recovery
+        time depends on the time since the last checkpoint instead of
+        the size of the project.
+
+        A checkpoint is taken in two steps. begin_checkpoint copies
+        the SWAP in memory and starts the new log segment, and
+        write_checkpoint writes the copy to disk. Only the first step
+        needs the SWAP to stay unchanged.
+
+    Directory layout:
+
+        checkpoint-<seq>/   snapshot of SWAP after <seq> classifications
+        wal-<seq>.jsonl     classifications <seq> + 1, <seq> + 2, ...
+"""
+
+from swap.utils.classification import Classification
+import swap.utils.snapshot as snapshot
+
+import json
+import os
+import re
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fields of a raw classification kept in the log
+FIELDS = ['classification_id', 'user_id', 'session_id',
+          'subject_id', 'annotation']
+
+
+class WriteAheadLog:
+    """
+    Log of accepted classifications with periodic SWAP checkpoints
+    """
+
+    _checkpoint = re.compile(r'^checkpoint-([0-9]+)$')
+    _segment = re.compile(r'^wal-([0-9]+)\.jsonl$')
+
+    def __init__(self, directory, checkpoint_every=10000, keep=2,
+                 fsync=False):
+        """
+        Parameters
+        ----------
+        directory : str
+            Directory for log segments and checkpoints
+        checkpoint_every : int
+            Classifications between checkpoints
+        keep : int
+            Number of checkpoints kept, older checkpoints and their
+            log segments are removed
+        fsync : bool
+            Force every appended classification to disk
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self.keep = keep
+        self.fsync = fsync
+
+        # Classifications logged so far
+        self.seq = 0
+        # seq of the latest checkpoint
+        self.last_checkpoint = None
+        self._file = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _list(self, pattern):
+        """
+        seq numbers of the files matching pattern, in order
+        """
+        found = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def checkpoints(self):
+        """
+        seq numbers of the complete checkpoints, in order
+        """
+        return [seq for seq in self._list(self._checkpoint)
+                if snapshot.is_snapshot(self._path('checkpoint-%d' % seq))]
+
+    def segments(self):
+        """
+        seq numbers the log segments start after, in order
+        """
+        return self._list(self._segment)
+
+    # ----------------------------------------------------------------
+
+    def _open(self):
+        """
+        Start a new log segment after the current seq
+        """
+        self.close()
+        path = self._path('wal-%d.jsonl' % self.seq)
+
+        # Terminate a partly written last line before appending
+        partial = False
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                partial = file.read(1) != b'\n'
+
+        self._file = open(path, 'a')
+        if partial:
+            self._file.write('\n')
+
+    def append(self, data):
+        """
+        Log a classification
+
+        Parameters
+        ----------
+        data : dict
+            Raw classification, as passed to Classification.generate
+
+        Returns
+        -------
+        bool
+            Whether a checkpoint is due
+        """
+        if self._file is None:
+            self._open()
+
+        self.seq += 1
+        record = {key: data.get(key) for key in FIELDS}
+        record['seq'] = self.seq
+
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        return self.seq - (self.last_checkpoint or 0) >= \
+            self.checkpoint_every
+
+    def checkpoint(self, swap):
+        """
+        Write a checkpoint of swap and start a new log segment
+        """
+        self.write_checkpoint(self.begin_checkpoint(swap))
+
+    def begin_checkpoint(self, swap):
+        """
+        Copy swap for a checkpoint at the current seq and start a new
+        log segment. Classifications may be logged and swap changed
+        again as soon as this returns
+
+        Returns
+        -------
+        (int, dict)
+            seq and the snapshot.capture of swap, for write_checkpoint
+        """
+        state = snapshot.capture(swap)
+
+        seq = self.seq
+        self.last_checkpoint = seq
+        self._open()
+        return seq, state
+
+    def write_checkpoint(self, pending):
+        """
+        Write a checkpoint copied by begin_checkpoint to disk.
+
+        The snapshot is written to a temporary directory and renamed,
+        so an interrupted checkpoint is never loaded
+        """
+        seq, state = pending
+        name = 'checkpoint-%d' % seq
+        logger.info('Writing checkpoint %s', name)
+
+        tmp = self._path(name + '.tmp')
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        snapshot.write(state, tmp)
+
+        path = self._path(name)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+
+        self.prune()
+
+    def prune(self):
+        """
+        Remove checkpoints beyond the newest `keep`, and the log
+        segments only needed to recover from them
+        """
+        checkpoints = self.checkpoints()
+        if len(checkpoints) <= self.keep:
+            return
+
+        oldest = checkpoints[-self.keep]
+        for seq in checkpoints[:-self.keep]:
+            shutil.rmtree(self._path('checkpoint-%d' % seq))
+
+        segments = self.segments()
+        for i, seq in enumerate(segments):
+            # Segments that end before the oldest kept checkpoint
+            end = segments[i + 1] if i + 1 < len(segments) else None
+            if end is not None and end <= oldest:
+                os.remove(self._path('wal-%d.jsonl' % seq))
+
+    # ----------------------------------------------------------------
+
+    def records(self, after=0):
+        """
+        Logged classifications with a seq greater than after, in order.
+        A partly written last line, from a crash during append,
+        is skipped
+        """
+        segments = self.segments()
+        for i, start in enumerate(segments):
+            end = segments[i + 1] if i + 1 < len(segments) else None
+            if end is not None and end <= after:
+                continue
+
+            with open(self._path('wal-%d.jsonl' % start)) as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning('Skipping incomplete log record')
+                        continue
+
+                    if record['seq'] > after:
+                        yield record
+
+    def recover(self):
+        """
+        Load the latest checkpoint and replay the classifications
+        logged after it
+
+        Returns
+        -------
+        swap.swap.SWAP
+            Recovered SWAP, or None if there is no checkpoint
+        """
+        checkpoints = self.checkpoints()
+        if len(checkpoints) == 0:
+            return None
+
+        seq = checkpoints[-1]
+        logger.info('Recovering from checkpoint-%d', seq)
+        swap = snapshot.load(self._path('checkpoint-%d' % seq))
+
+        count = 0
+        self.seq = seq
+        for record in self.records(after=seq):
+            swap.classify(Classification.generate(record))
+            self.seq = record['seq']
+            count += 1
+
+        logger.info('Replayed %d logged classifications', count)
+        self.last_checkpoint = seq
+
+        # Continue in a new segment, the last one may end in
+        # a partly written line
+        self._open()
+        return swap
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
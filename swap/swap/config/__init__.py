@@ -36,11 +36,56 @@ gamma = 5
 # Retirement Thresholds
 mdr = 0.1
 fpr = 0.01
+# Online retirement thresholds (bogus, real) on subject scores, for
+# example from ScoreExport.thresholds. Subjects retire the first time
+# their score leaves the range, see SWAP.retired. None disables them
+thresholds = None
 
 # Methodology
 # Set this flag to true to use the back-updating transactional methodology
 # Setting this flag to false uses the traditional SWAP methodology
 back_update = False
+# With back_update, recalculate all scores at once in
+# SWAP.process_changes instead of notifying agents one by one,
+# see swap.engine.static
+batch_update = False
+
+
+# With back_update and batch_update, iterate the batch solver as
+# expectation maximization, so users also learn from the scores of
+# non gold subjects, see swap.engine.static.StaticSolver.em
+class em:
+    enabled = False
+    # Stop once no subject score changes by more than this
+    tolerance = 1e-6
+    max_iterations = 100
+
+
+# Subject ledger used by swap.agents.subject.Subject
+# 'chain' recalculates scores along the linked list of transactions
+# 'tree' keeps log likelihood ratios in a Fenwick tree
+subject_ledger = 'chain'
+
+# Keep the score after every classification in the user and subject
+# ledgers. False keeps only current scores and what recalculation
+# needs (see swap.agents.subject.LiteLedger), score exports then have
+# no retirement and SWAP.history_export is unavailable
+keep_history = True
+
+# Calculate subject scores in log odds, where every classification
+# adds its log likelihood ratio, instead of a / (a + b)
+log_odds = False
+
+# Engine used by swap.swap.SWAP
+# 'agents' keeps an agent, ledger and transactions for every user and subject
+# 'columnar' keeps everything in numpy columns, see swap.engine.columnar
+# 'multiclass' is columnar with annotations of more than two classes,
+# see swap.engine.multiclass
+engine = 'agents'
+
+# Number of annotation classes for the 'multiclass' engine, annotations
+# and gold labels are 0 .. classes - 1
+classes = 2
 
 # Operator used in controversial and consensus score calculation
 controversial_version = 'pow'
@@ -50,6 +95,9 @@ controversial_version = 'pow'
 class control:
     debug = False
     amount = 100000
+    # Replay classifications in this many processes, each
+    # processing separate connected components, see Control.replay
+    processes = 1
 
 
 # Database config options
@@ -94,6 +142,10 @@ class parser:
         value_separator = '.'
         true = [1]
         false = [0]
+        # Values of each class for the 'multiclass' engine, the
+        # annotation is the index of the list the value is in.
+        # Replaces true and false when set
+        classes = None
 
 
 class online_swap:
@@ -106,6 +158,47 @@ class online_swap:
 
     workflow = 2614
 
+    class wal:
+        # Directory for the write-ahead log and checkpoints of the
+        # online controller, None disables them. See swap.caesar.wal
+        directory = None
+        # Classifications between checkpoints
+        checkpoint_every = 10000
+        # Checkpoints kept on disk
+        keep = 2
+        # Force every logged classification to disk
+        fsync = False
+
+    class dedup:
+        # Keep the ids of received classifications in memory instead
+        # of querying the database for duplicates, see swap.utils.idset
+        enabled = True
+        # False positive rate of a bloom filter in front of the ids,
+        # None for no filter
+        bloom = None
+
+    class batch:
+        # Most classifications processed together by the online
+        # worker, see swap.caesar.control.ThreadedControl
+        size = 100
+        # Longest wait in milliseconds for more classifications
+        # after the first one of a batch
+        wait = 50
+
+    class dispatch:
+        # Threads sending scores to caesar, see
+        # swap.caesar.utils.dispatcher
+        workers = 4
+        # Retries of a failed request before it is dropped
+        retries = 3
+        # Seconds before the first retry, doubled after each one
+        backoff = .5
+        # Seconds to wait for caesar to answer
+        timeout = 10
+        # Seconds scores are held before sending, only the newest
+        # score of a subject is sent. 0 sends every score right away
+        interval = .5
+
     class caesar:
         # Address configuration for accessing caesar
         host = 'caesar-staging.zooniverse.org'
@@ -15,8 +15,10 @@ from swap.swap import SWAP
 from swap.db import DB
 from swap.utils.classification import Classification
 from swap.utils.golds import GoldGetter
+from swap.utils.components import partition
 from swap.db import Query
 
+import multiprocessing
 import progressbar
 import logging
 logger = logging.getLogger(__name__)
@@ -60,11 +62,19 @@ class Control:
             amount = DB().classifications.get_stats()
             amount = amount['first_classifications']
 
-        self.init_swap()
-
         # get classifications
         cursor = self.get_classifications()
 
+        if self.swap is None and config.control.processes > 1 and \
+                config.engine == 'agents':
+            classifications = self.collect(cursor, amount)
+            # Workers already processed changes of their components
+            self.swap = self.replay(classifications, config.control.processes)
+            logger.info('done')
+            return
+
+        self.init_swap()
+
         # loop over classification cursor to process
         # classifications one at a time
         logger.info('Start: SWAP Processing %d classifications', amount)
@@ -90,6 +100,84 @@ class Control:
             self.swap.process_changes()
         logger.info('done')
 
+    @staticmethod
+    def collect(cursor, amount):
+        """
+        Read every classification from the cursor
+
+        Returns
+        -------
+        [Classification]
+            Classifications in the order returned by the db
+        """
+        logger.info('Loading %d classifications', amount)
+
+        classifications = []
+        with progressbar.ProgressBar(max_value=amount) as bar:
+            for cl in cursor:
+                classifications.append(Classification.generate(cl))
+                bar.update(len(classifications) - 1)
+
+                if config.control.debug and \
+                        len(classifications) > config.control.amount:
+                    break
+
+        return classifications
+
+    def replay(self, classifications, processes):
+        """
+        Process classifications in a pool of processes
+
+        Classifications are split into groups of whole connected
+        components of the user - subject graph, see
+        swap.utils.components. Components share no users or subjects,
+        so each group is run through its own SWAP in a worker, keeping
+        the classification order within the group, and the results
+        are merged into one SWAP.
+
+        With config.back_update the workers also process the changes
+        of their group. Scores of one component never depend on another,
+        so the merged SWAP needs no further processing.
+
+        Workers inherit config from this process, so the pool always
+        uses the fork start method, whatever the platform default.
+
+        Returns
+        -------
+        SWAP
+            SWAP with every classification and gold label
+        """
+        golds = self.get_gold_labels()
+        groups = partition(classifications, processes)
+
+        logger.info('Start: SWAP Processing %d classifications in %d '
+                    'groups with %d processes',
+                    len(classifications), len(groups), processes)
+
+        def tasks():
+            covered = set()
+            for group in groups:
+                subjects = set(cl.subject for cl in group)
+                covered |= subjects
+                yield ({id_: gold for id_, gold in golds.items()
+                        if id_ in subjects}, group)
+
+            # Gold labels of subjects nobody classified
+            yield ({id_: gold for id_, gold in golds.items()
+                    if id_ not in covered}, [])
+
+        swap = SWAP()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes) as pool:
+            with progressbar.ProgressBar(max_value=len(groups) + 1) as bar:
+                bar.update(0)
+                for n, other in enumerate(
+                        pool.imap_unordered(_replay, tasks())):
+                    swap.merge(other)
+                    bar.update(n + 1)
+
+        return swap
+
     def _delegate(self, cl):
         """
         Passes classification to SWAP
@@ -171,6 +259,24 @@ class Control:
         self.gold_getter.reset()
 
 
+def _replay(task):
+    """
+    Run one group of classifications through a new SWAP,
+    used by Control.replay in the worker processes
+    """
+    golds, classifications = task
+
+    swap = SWAP()
+    swap.set_gold_labels(golds, with_bar=False)
+    for cl in classifications:
+        swap.classify(cl)
+
+    if config.back_update:
+        swap.process_changes()
+
+    return swap
+
+
 class MetaDataControl(Control):
     """ Calls SWAP to process classifications for specific meta data splits
     """
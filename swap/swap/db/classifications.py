@@ -18,6 +18,7 @@ import swap.config as config
 from collections import OrderedDict
 from pymongo import IndexModel, ASCENDING
 
+import numpy as np
 import sys
 import csv
 import logging
@@ -160,7 +161,6 @@ class Classifications(Collection):
         return stats.find().sort('_id', -1).limit(1).next()
 
     def exists(self, classification_id):
-        print(self.collection)
         logger.debug(
             'Checking if classification %d already in \'%s\'',
             classification_id, self._collection_name())
@@ -170,6 +170,42 @@ class Classifications(Collection):
         logger.debug('exists: %s', str(exists))
         return exists
 
+    def ids(self):
+        """
+        Every classification id in the collection
+
+        Returns
+        -------
+        np.array
+        """
+        logger.info('Loading classification ids from \'%s\'',
+                    self._collection_name())
+        cursor = self.collection.find(
+            {}, {'classification_id': 1, '_id': 0})
+        return np.fromiter(
+            (item['classification_id'] for item in cursor), dtype=np.int64)
+
+    def existing(self, classification_ids):
+        """
+        Classification ids already in the collection, in one query
+
+        Parameters
+        ----------
+        classification_ids : list
+
+        Returns
+        -------
+        set
+        """
+        if len(classification_ids) == 0:
+            return set()
+
+        logger.debug('Checking %d classifications in \'%s\'',
+                     len(classification_ids), self._collection_name())
+        match = {'classification_id': {'$in': list(classification_ids)}}
+        cursor = self.collection.find(match, {'classification_id': 1})
+        return {item['classification_id'] for item in cursor}
+
     def insert(self, classification):
         id_ = classification['classification_id']
         if not self.exists(id_):
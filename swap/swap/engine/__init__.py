@@ -0,0 +1,2 @@
+################################################################
+# Alternative array-backed SWAP engines
@@ -0,0 +1,704 @@
+################################################################
+# Columnar SWAP engine, keeps users, subjects and classifications
+# in parallel typed arrays instead of agent and ledger objects
+
+"""
+    ColumnarSWAP:
+        Array backed implementation of swap.swap.SWAP. Every user,
+        subject and classification is a row in a set of parallel numpy
+        columns (int32 indices, int8 annotations and gold labels,
+        float64 scores), so a replay costs a few bytes per
+        classification instead of two linked Transaction objects.
+
+        Select it with SWAP(engine='columnar') or by setting
+        config.engine = 'columnar'
+"""
+
+from swap.swap import SWAP
+from swap.agents.agent import Stat, MultiStat
+from swap.utils.scores import ScoreExport, Score
+from swap.utils.history import HistoryExport, Ragged
+from swap.utils.classification import Classification
+from swap.utils.index import Index
+from swap.utils.idset import IdSet
+from swap.utils.scoreview import ScoreTable
+from swap.engine.static import segments, saturated_cumsum, \
+    log_likelihood_ratios
+
+import swap.config as config
+
+import numpy as np
+from scipy.special import expit
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Column:
+    """
+    Growable typed array. Capacity doubles whenever it runs out,
+    so appending is amortized O(1)
+    """
+
+    def __init__(self, dtype, fill=0, capacity=1024):
+        self.dtype = np.dtype(dtype)
+        self.fill = fill
+        self._data = np.full(capacity, fill, dtype=self.dtype)
+        self._size = 0
+
+    @classmethod
+    def from_array(cls, array, dtype, fill=0):
+        """
+        Column holding the values of an existing array. The array is
+        used as is when it has the right type, for example a copy on
+        write memory map, and is only copied once the column grows
+        """
+        column = cls(dtype, fill, capacity=1)
+        array = np.asarray(array)
+        if len(array) == 0:
+            return column
+
+        # Subarray dtypes keep their extra dimensions in the array shape
+        if array.dtype != column.dtype.base:
+            array = array.astype(column.dtype.base)
+        column._data = array
+        column._size = len(array)
+        return column
+
+    def _reserve(self, size):
+        capacity = len(self._data)
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity *= 2
+
+        data = np.full(capacity, self.fill, dtype=self.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def append(self, value):
+        """
+        Append a value, returns its index in the column
+        """
+        self._reserve(self._size + 1)
+        self._data[self._size] = value
+        self._size += 1
+
+        return self._size - 1
+
+    @property
+    def array(self):
+        """
+        Numpy view of the filled part of the column
+        """
+        return self._data[:self._size]
+
+    def __getitem__(self, i):
+        return self.array[i]
+
+    def __setitem__(self, i, value):
+        self.array[i] = value
+
+    def __len__(self):
+        return self._size
+
+
+def calculate(prior, annotation, u0, u1):
+    """
+    Bayesian update of a subject score, same arithmetic as
+    swap.agents.subject.Transaction.calculate
+
+    Parameters
+    ----------
+    prior : float
+        Subject score before this classification
+    annotation : int
+        0 or 1
+    u0, u1 : float
+        User confusion matrix scores
+    """
+    if annotation == 1:
+        a = prior * u1
+        b = (1 - prior) * (1 - u0)
+    elif annotation == 0:
+        a = prior * (1 - u1)
+        b = (1 - prior) * u0
+    else:
+        raise ValueError('annotation must be 0 or 1, not %s' %
+                         str(annotation))
+
+    try:
+        return a / (a + b)
+    except ZeroDivisionError as e:
+        logger.error(e)
+        return prior
+
+
+def array_stat(values):
+    """
+    swap.agents.agent.Stat of a column, calculated by numpy
+    """
+    return Stat.from_values(float(np.mean(values)), float(np.median(values)),
+                            float(np.std(values)))
+
+
+class ColumnarSWAP(SWAP):
+    """
+    Columnar implementation of SWAP. Exposes the same classify,
+    set_gold_labels, process_changes, score_export and history_export
+    surface as swap.swap.SWAP and produces the same scores.
+    """
+
+    def __init__(self, engine=None):
+        # pylint: disable=W0231
+        # Raw id <-> row interning tables
+        self._user_index = Index()
+        self._subject_index = Index()
+
+        # (user, subject) pairs already classified, see _seen_keys
+        self._seen = None
+
+        # User columns, confusion matrix counters indexed by gold label
+        self._user_seen = (Column(np.int32), Column(np.int32))
+        self._user_matched = (Column(np.int32), Column(np.int32))
+        self._user_count = Column(np.int32)
+
+        # Subject columns
+        self._subject_gold = Column(np.int8, fill=-1)
+        self._subject_score = Column(np.float64)
+        self._subject_count = Column(np.int32)
+        # Classifications and score when the subject retired,
+        # see _retire
+        self._subject_retired = Column(np.int32, fill=-1)
+        self._subject_retired_score = Column(np.float64, fill=np.nan)
+        # Rows of subjects that retired since the last call to retired
+        self._retired = []
+
+        # Classification columns, one row per classification in the
+        # order they were received
+        self._cl_user = Column(np.int32)
+        self._cl_subject = Column(np.int32)
+        self._cl_annotation = Column(np.int8)
+        self._cl_score = Column(np.float64)
+
+        self.users = BureauView(self, UserView)
+        self.subjects = BureauView(self, SubjectView)
+
+    def __getnewargs__(self):
+        return ('columnar',)
+
+    def __getstate__(self):
+        # Duplicate keys are rebuilt from the columns when needed
+        state = self.__dict__.copy()
+        state['_seen'] = None
+        return state
+
+    # ----------------------------------------------------------------
+
+    def _user(self, id_, make_new=True):
+        index = self._user_index.get(id_, make_new)
+        if index is None or index < len(self._user_count):
+            return index
+
+        for column in self._user_seen + self._user_matched:
+            column.append(0)
+        self._user_count.append(0)
+
+        return index
+
+    def _subject(self, id_, make_new=True):
+        index = self._subject_index.get(id_, make_new)
+        if index is None or index < len(self._subject_count):
+            return index
+
+        self._subject_gold.append(-1)
+        self._subject_score.append(config.p0)
+        self._subject_count.append(0)
+        self._subject_retired.append(-1)
+        self._subject_retired_score.append(np.nan)
+
+        return index
+
+    def _seen_keys(self):
+        """
+        (user << 32) | subject key of every classification, in an
+        IdSet built from the classification columns on first use
+        """
+        if self._seen is None:
+            keys = self._cl_user.array.astype(np.int64) << 32
+            keys |= self._cl_subject.array
+            self._seen = IdSet(keys, merge_ratio=.125)
+        return self._seen
+
+    def _user_score(self, user):
+        """
+        Confusion matrix (u0, u1) of a single user
+        """
+        gamma = config.gamma
+
+        def formula(label):
+            matched = int(self._user_matched[label][user])
+            seen = int(self._user_seen[label][user])
+            return (matched + gamma) / (seen + gamma * 2)
+
+        return (formula(0), formula(1))
+
+    def _user_scores(self):
+        """
+        Confusion matrices of all users as arrays (u0, u1)
+        """
+        gamma = config.gamma
+
+        def formula(label):
+            matched = self._user_matched[label].array
+            seen = self._user_seen[label].array
+            return (matched + gamma) / (seen + gamma * 2)
+
+        return (formula(0), formula(1))
+
+    def _retire(self, rows):
+        """
+        Retire the subjects in rows whose score is outside
+        config.thresholds, same as swap.agents.subject.Ledger.retire
+        """
+        if config.thresholds is None:
+            return
+
+        bogus, real = config.thresholds
+        score = self._subject_score.array[rows]
+        retired = self._subject_retired.array
+
+        rows = rows[(retired[rows] < 0) & ((score < bogus) | (score > real))]
+        retired[rows] = self._subject_count.array[rows]
+        self._subject_retired_score.array[rows] = \
+            self._subject_score.array[rows]
+        self._retired.extend(rows.tolist())
+
+    def _retire_one(self, row, score):
+        """
+        Scalar _retire for a single new subject score
+        """
+        if config.thresholds is None or self._subject_retired[row] >= 0:
+            return
+
+        bogus, real = config.thresholds
+        if score < bogus or score > real:
+            self._subject_retired[row] = self._subject_count[row]
+            self._subject_retired_score[row] = score
+            self._retired.append(row)
+
+    def _count(self, users, annotations, golds, sign):
+        """
+        Add (sign=1) or remove (sign=-1) classifications from the
+        user confusion matrix counters
+        """
+        for label in (0, 1):
+            mask = golds == label
+            np.add.at(self._user_seen[label].array, users[mask], sign)
+
+            mask &= annotations == label
+            np.add.at(self._user_matched[label].array, users[mask], sign)
+
+    # ----------------------------------------------------------------
+
+    def classify(self, cl, subject=None, user=None):
+        """
+            Process a classification
+
+            Parameters
+            ----------
+            cl : swap.utils.classification.Classification, dict
+                Classification to be processed
+            subject : boolean
+                Deprecated
+            user : boolean
+                Deprecated
+        """
+        if not isinstance(cl, Classification):
+            cl = Classification.generate(cl)
+
+        if subject is not None or user is not None:
+            raise DeprecationWarning(
+                'controlling subject and user are ' +
+                'no longer supported')
+
+        s = self._subject(cl.subject)
+        u = self._user(cl.user)
+
+        if not self._seen_keys().add((u << 32) | s):
+            return
+
+        annotation = int(cl.annotation)
+
+        if config.back_update:
+            score = np.nan
+        else:
+            score = self._classify_score(s, u, annotation)
+            self._subject_score[s] = score
+
+        self._cl_user.append(u)
+        self._cl_subject.append(s)
+        self._cl_annotation.append(annotation)
+        self._cl_score.append(score)
+
+        self._user_count[u] += 1
+        self._subject_count[s] += 1
+
+        if not config.back_update:
+            self._retire_one(s, score)
+
+        self._count_one(u, annotation, self._subject_gold[s])
+
+    def _classify_score(self, s, u, annotation):
+        """
+        New score of subject s after user u classifies it, without
+        back_update
+        """
+        prior = float(self._subject_score[s])
+        return calculate(prior, annotation, *self._user_score(u))
+
+    def _count_one(self, u, annotation, gold):
+        """
+        Add one classification to the confusion matrix counters of
+        user u
+        """
+        if gold in (0, 1):
+            self._user_seen[gold][u] += 1
+            if annotation == gold:
+                self._user_matched[gold][u] += 1
+
+    def process_changes(self):
+        """
+        Recalculate every user confusion matrix from the current gold
+        labels, then every subject score from the final user scores.
+
+        Gives the same result as swap.swap.SWAP.process_changes,
+        but each step is a vectorized pass over the columns
+        """
+        users = self._cl_user.array
+        subjects = self._cl_subject.array
+        annotations = self._cl_annotation.array
+
+        logger.info('processing user score changes')
+        for column in self._user_seen + self._user_matched:
+            column.array[:] = 0
+        golds = self._subject_gold.array[subjects]
+        self._count(users, annotations, golds, 1)
+
+        logger.info('processing subject score changes')
+        u0, u1 = self._user_scores()
+        llr = log_likelihood_ratios(annotations == 1, u0[users], u1[users])
+
+        # Score after every classification, a running sum of log
+        # likelihood ratios within each subject, see StaticSolver.
+        # Degenerate user matrices are handled like calculate
+        p0 = config.p0
+        logodds, (order, starts, counts) = saturated_cumsum(
+            llr, subjects, len(self._subject_index))
+        logodds += np.log(p0) - np.log1p(-p0)
+
+        scores = self._cl_score.array
+        scores[:] = expit(logodds)
+
+        has = np.flatnonzero(counts)
+        prior = self._subject_score.array
+        prior[:] = p0
+        prior[has] = scores[order[starts[has] + counts[has] - 1]]
+        self._retire(has)
+        logger.info('done')
+
+    def set_gold_labels(self, golds, with_bar=True):
+        """
+            Defines the subjects explicitly that should be
+            treated as gold standards. Only subjects whose label
+            actually changes are touched.
+
+            Parameters
+            ----------
+            golds : dict
+                (subject id : gold label) Mapping of subject to its gold label
+        """
+        logger.info('Processing gold labels')
+        indexes = [self._subject(id_) for id_ in golds]
+
+        current = self._subject_gold.array.copy()
+        new = np.full(len(current), -1, dtype=current.dtype)
+        new[indexes] = list(golds.values())
+
+        changed = np.nonzero(new != current)[0]
+        self._subject_gold.array[:] = new
+
+        if len(changed) == 0:
+            return
+
+        # Move the affected classifications to their new
+        # confusion matrix counters
+        subjects = self._cl_subject.array
+        rows = np.nonzero(np.isin(subjects, changed))[0]
+        users = self._cl_user.array[rows]
+        annotations = self._cl_annotation.array[rows]
+
+        self._count(users, annotations, current[subjects[rows]], -1)
+        self._count(users, annotations, new[subjects[rows]], 1)
+
+    @property
+    def golds(self):
+        """
+        Compile a list of all the subject -> gold mappings being used
+
+        Returns
+        -------
+        dict
+            {subject id: gold label}
+        """
+        golds = self._subject_gold.array
+        ids = self._subject_index.ids()
+        return {ids[i]: int(golds[i]) for i in np.nonzero(golds >= 0)[0]}
+
+    # ----------------------------------------------------------------
+
+    def score_export(self, history=None):
+        """
+        Generate object containing subject score data
+
+        Returns
+        -------
+        swap.utils.scores.ScoreExport
+            ScoreExport
+        """
+        if history is None and config.keep_history:
+            history = self.history_export()
+
+        logger.info('Generating score export')
+        scores = {}
+        ids = self._subject_index.ids()
+        score = self._subject_score.array.tolist()
+        retired = self._subject_retired_score.array.tolist()
+        for i in np.nonzero(self._subject_count.array)[0]:
+            id_ = ids[i]
+            p = None if np.isnan(retired[i]) else retired[i]
+            scores[id_] = Score(id_, None, score[i], p)
+
+        logger.debug('done')
+        return ScoreExport(scores, history=history)
+
+    def retired(self):
+        """
+        Subjects that retired since the last call, see SWAP.retired
+
+        Yields
+        ------
+        (subject id, classifications, score)
+        """
+        rows = self._retired
+        self._retired = []
+
+        ids = self._subject_index.ids()
+        for i in rows:
+            yield (ids[i], int(self._subject_retired[i]),
+                   float(self._subject_retired_score[i]))
+
+    def publish(self):
+        """
+        Publish the current subject scores, see SWAP.publish. Compares
+        every chunk of published scores with the columns and copies
+        the chunks that changed
+        """
+        table = getattr(self, '_score_table', None)
+        if table is None:
+            table = self._score_table = ScoreTable()
+
+        table.sync(self._subject_score.array,
+                   self._subject_retired_score.array,
+                   self._subject_count.array > 0,
+                   self._subject_gold.array)
+        self._view = table.view(self._subject_index)
+        return self._view
+
+    def history_export(self):
+        """
+        Generate object containing subject score history
+
+        Returns
+        -------
+        swap.utils.history.HistoryExport
+            HistoryExport
+        """
+        logger.info('Generating history export')
+        order, starts, counts = segments(
+            self._cl_subject.array, len(self._subject_index))
+        has = np.flatnonzero(counts)
+        counts = counts[has]
+
+        # Each subject's trace is the prior followed by the scores of
+        # its classifications in order, gathered into one flat array
+        offsets = np.zeros(len(has) + 1, dtype=np.int64)
+        np.cumsum(counts + 1, out=offsets[1:])
+        rows = np.ones(offsets[-1], dtype=bool)
+        rows[offsets[:-1]] = False
+
+        values = np.full(offsets[-1], config.p0)
+        values[rows] = self._cl_score.array[order]
+
+        ids = self._subject_index.ids()
+        ids = [ids[i] for i in has]
+        golds = self._subject_gold.array[has]
+
+        logger.debug('done')
+        return HistoryExport(ids, golds, Ragged.from_arrays(values, offsets))
+
+    def debug_str(self):
+        s = ''
+        for u in self.users:
+            s += 'user %s score %.4f %.4f classifications %d\n' % \
+                (str(self.users.raw_id(u.id)), *u.score, len(u.ledger))
+        for a in self.subjects:
+            s += 'subject %s gold %d score %.4f classifications %d\n' % \
+                (str(self.subjects.raw_id(a.id)), a.gold, a.score,
+                 len(a.ledger))
+        return s
+
+    def __len__(self):
+        return len(self._cl_user)
+
+
+class BureauView:
+    """
+    Read only stand-in for a swap.agents.bureau.Bureau, lets code
+    written against the agent engine iterate over users and subjects.
+    Like a Bureau with an index, agents use their row number as id
+    while get, has and idset take raw ids
+    """
+
+    def __init__(self, swap, view_type):
+        self.swap = swap
+        self.agent_type = view_type
+
+    @property
+    def index(self):
+        return self.agent_type.table(self.swap)
+
+    def get(self, agent_id, make_new=True):
+        index = self.agent_type.lookup(self.swap, agent_id, make_new)
+        if index is not None:
+            return self.agent_type(self.swap, index)
+
+    def agent(self, agent_id):
+        return self.agent_type(self.swap, agent_id)
+
+    def raw_id(self, agent_id):
+        return self.index.id(agent_id)
+
+    def has(self, agent_id):
+        return agent_id in self.index
+
+    def idset(self):
+        return set(self.index.ids())
+
+    def stats(self):
+        return self.agent_type.stats(self.swap)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.agent_type(self.swap, i)
+
+    def __contains__(self, item):
+        return self.has(item)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class AgentView:
+    """
+    Lightweight read only view of one row of the user or subject columns
+    """
+
+    def __init__(self, swap, row):
+        self.swap = swap
+        self.row = row
+        self.ledger = LedgerView(self)
+
+    @property
+    def id(self):
+        return self.row
+
+    @property
+    def raw_id(self):
+        return self.table(self.swap).id(self.row)
+
+    def __str__(self):
+        return 'id: %s score: %s' % (str(self.id), str(self.score))
+
+
+class LedgerView:
+    """
+    Stand-in for an agent ledger, only knows its size and score
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    @property
+    def score(self):
+        return self.agent.score
+
+    def __len__(self):
+        return int(self.agent.count)
+
+
+class UserView(AgentView):
+    class_name = 'user'
+
+    @staticmethod
+    def table(swap):
+        return swap._user_index
+
+    @staticmethod
+    def lookup(swap, id_, make_new):
+        return swap._user(id_, make_new)
+
+    @property
+    def score(self):
+        return self.swap._user_score(self.row)
+
+    @property
+    def count(self):
+        return self.swap._user_count[self.row]
+
+    @staticmethod
+    def stats(swap):
+        u0, u1 = swap._user_scores()
+        return MultiStat().add(0, array_stat(u0)).add(1, array_stat(u1))
+
+
+class SubjectView(AgentView):
+    class_name = 'subject'
+
+    @staticmethod
+    def table(swap):
+        return swap._subject_index
+
+    @staticmethod
+    def lookup(swap, id_, make_new):
+        return swap._subject(id_, make_new)
+
+    @property
+    def score(self):
+        return float(self.swap._subject_score[self.row])
+
+    @property
+    def gold(self):
+        return int(self.swap._subject_gold[self.row])
+
+    @property
+    def count(self):
+        return self.swap._subject_count[self.row]
+
+    def isgold(self):
+        return self.gold in [0, 1]
+
+    @staticmethod
+    def stats(swap):
+        return array_stat(swap._subject_score.array)
@@ -0,0 +1,302 @@
+################################################################
+# Multi-class SWAP engine, users carry a K x K confusion matrix and
+# subjects a posterior over K classes
+
+"""
+    MultiClassSWAP:
+        Columnar SWAP for workflows with more than two answers.
+        Annotations and gold labels are classes 0 .. K - 1, with
+        K = config.classes. Every user has a K x K matrix of
+        counts[gold, annotation] on gold subjects, smoothed the same way
+        as the binary counters into P(annotation | true class). Every
+        subject has a posterior over the K classes, updated with the
+        column of the user's matrix for the annotation it gave.
+
+        All classes are updated together in one numpy pass, instead of
+        running one binary SWAP per class. Class 0 is the class without
+        an object of interest, the subject score used for exports and
+        retirement is the probability of any other class. With K = 2
+        this gives the same scores as swap.engine.columnar.ColumnarSWAP.
+
+        Select it with SWAP(engine='multiclass') or by setting
+        config.engine = 'multiclass'
+"""
+
+from swap.agents.agent import MultiStat
+from swap.engine.columnar import ColumnarSWAP, Column, BureauView, \
+    UserView, array_stat
+from swap.engine.static import segment_cumsum
+from swap.utils.classification import Classification
+
+import swap.config as config
+
+import numpy as np
+from scipy.special import softmax
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def priors(classes):
+    """
+    Prior of every class. The classes other than 0 share config.p0
+
+    Parameters
+    ----------
+    classes : int
+        Number of classes
+    """
+    prior = np.full(classes, config.p0 / (classes - 1))
+    prior[0] = 1 - config.p0
+    return prior
+
+
+def interesting(posterior):
+    """
+    Subject score of posteriors, the probability of any class but 0
+
+    Parameters
+    ----------
+    posterior : np.array
+        (..., K) posteriors
+    """
+    return posterior[..., 1:].sum(axis=-1)
+
+
+class MultiClassSWAP(ColumnarSWAP):
+    """
+    Columnar SWAP with K x K user confusion matrices and K class
+    subject posteriors. Has the same surface as ColumnarSWAP, subject
+    scores are the probability of any class but 0, see interesting.
+    """
+
+    def __init__(self, engine=None):
+        super().__init__(engine)
+
+        classes = config.classes
+        if classes < 2:
+            raise ValueError('Need at least 2 classes, not %s' % str(classes))
+        self.classes = classes
+
+        # Replaces the binary seen and matched counters,
+        # counts[gold, annotation] of every user
+        del self._user_seen
+        del self._user_matched
+        self._user_confusion = Column(np.dtype((np.int32, (classes,) * 2)))
+
+        self._subject_posterior = Column(np.dtype((np.float64, (classes,))))
+        # Subject posterior after every classification
+        self._cl_posterior = Column(np.dtype((np.float64, (classes,))))
+
+        self.users = BureauView(self, MultiClassUserView)
+
+    def __getnewargs__(self):
+        return ('multiclass',)
+
+    # ----------------------------------------------------------------
+
+    def _user(self, id_, make_new=True):
+        index = self._user_index.get(id_, make_new)
+        if index is None or index < len(self._user_count):
+            return index
+
+        self._user_confusion.append(0)
+        self._user_count.append(0)
+
+        return index
+
+    def _subject(self, id_, make_new=True):
+        index = self._subject_index.get(id_, make_new)
+        if index is None or index < len(self._subject_count):
+            return index
+
+        super()._subject(id_, make_new)
+        self._subject_posterior.append(priors(self.classes))
+
+        return index
+
+    def _user_score(self, user):
+        """
+        Confusion matrix of a single user,
+        P(annotation | true class) as matrix[gold, annotation]
+        """
+        return self._confusion(self._user_confusion[user])
+
+    def _user_scores(self):
+        """
+        Confusion matrices of all users, (users, K, K)
+        """
+        return self._confusion(self._user_confusion.array)
+
+    @staticmethod
+    def _confusion(counts):
+        gamma = config.gamma
+        classes = counts.shape[-1]
+        seen = counts.sum(axis=-1, keepdims=True)
+        return (counts + gamma) / (seen + gamma * classes)
+
+    def _count(self, users, annotations, golds, sign):
+        """
+        Add (sign=1) or remove (sign=-1) classifications from the
+        user confusion matrices
+        """
+        mask = (golds >= 0) & (golds < self.classes)
+        np.add.at(self._user_confusion.array,
+                  (users[mask], golds[mask], annotations[mask]), sign)
+
+    # ----------------------------------------------------------------
+
+    def classify(self, cl, subject=None, user=None):
+        """
+            Process a classification
+
+            Parameters
+            ----------
+            cl : swap.utils.classification.Classification, dict
+                Classification to be processed
+            subject : boolean
+                Deprecated
+            user : boolean
+                Deprecated
+        """
+        if not isinstance(cl, Classification):
+            cl = Classification.generate(cl)
+        annotation = int(cl.annotation)
+        if not 0 <= annotation < self.classes:
+            raise ValueError('annotation must be in 0 .. %d, not %s' %
+                             (self.classes - 1, str(annotation)))
+
+        n = len(self)
+        super().classify(cl, subject, user)
+        if len(self) == n:
+            return
+
+        if config.back_update:
+            self._cl_posterior.append(np.nan)
+        else:
+            s = self._cl_subject[n]
+            self._cl_posterior.append(self._subject_posterior[s])
+
+    def _classify_score(self, s, u, annotation):
+        posterior = self._subject_posterior[s] * \
+            self._user_score(u)[:, annotation]
+        total = posterior.sum()
+        if total == 0:
+            logger.error('Posterior of subject %d sums to 0', s)
+            return float(self._subject_score[s])
+
+        self._subject_posterior[s] = posterior / total
+        return float(interesting(self._subject_posterior[s]))
+
+    def _rescore(self, likelihood):
+        """
+        Posterior after each of a subject's classifications in order,
+        from their likelihoods, the same update as _classify_score
+        """
+        posterior = priors(self.classes)
+        posteriors = np.empty(likelihood.shape)
+        for i, row in enumerate(likelihood):
+            update = posterior * row
+            total = update.sum()
+            # Every class left is ruled out, leave posterior unchanged
+            if total > 0:
+                posterior = update / total
+            posteriors[i] = posterior
+
+        return posteriors
+
+    def _count_one(self, u, annotation, gold):
+        if 0 <= gold < self.classes:
+            self._user_confusion[u][gold, annotation] += 1
+
+    def process_changes(self):
+        """
+        Recalculate every user confusion matrix from the current gold
+        labels, then every subject posterior from the final user
+        confusion matrices, all classes at once
+        """
+        users = self._cl_user.array
+        subjects = self._cl_subject.array
+        annotations = self._cl_annotation.array
+
+        logger.info('processing user score changes')
+        self._user_confusion.array[:] = 0
+        golds = self._subject_gold.array[subjects]
+        self._count(users, annotations, golds, 1)
+
+        logger.info('processing subject score changes')
+        # P(annotation | class) of every classification, (n, K)
+        likelihood = self._user_scores()[users, :, annotations]
+        zero = (likelihood == 0).any(axis=1)
+        with np.errstate(divide='ignore'):
+            loglikelihood = np.log(np.where(zero[:, None], 1., likelihood))
+
+        # Posterior after every classification, a running sum of log
+        # likelihoods within each subject for every class at once
+        logp, (order, starts, counts) = segment_cumsum(
+            loglikelihood, subjects, len(self._subject_index))
+        with np.errstate(divide='ignore'):
+            logp += np.log(priors(self.classes))
+
+        posteriors = self._cl_posterior.array
+        posteriors[:] = softmax(logp, axis=1)
+
+        # A likelihood of 0 rules a class out, which the log sums
+        # can't express. Those subjects are scored one
+        # classification at a time instead
+        for s in np.unique(subjects[zero]):
+            rows = order[starts[s]:starts[s] + counts[s]]
+            posteriors[rows] = self._rescore(likelihood[rows])
+
+        has = np.flatnonzero(counts)
+        prior = np.tile(priors(self.classes), (len(counts), 1))
+        prior[has] = posteriors[order[starts[has] + counts[has] - 1]]
+
+        self._cl_score.array[:] = interesting(posteriors)
+        self._subject_posterior.array[:] = prior
+        self._subject_score.array[:] = interesting(prior)
+        self._retire(np.flatnonzero(counts))
+        logger.info('done')
+
+    # ----------------------------------------------------------------
+
+    def posterior_export(self):
+        """
+        Current posterior of every classified subject
+
+        Returns
+        -------
+        dict
+            {subject id: np.array of K class probabilities}
+        """
+        ids = self._subject_index.ids()
+        posterior = self._subject_posterior.array
+        return {ids[i]: posterior[i].copy()
+                for i in np.nonzero(self._subject_count.array)[0]}
+
+    def debug_str(self):
+        s = ''
+        for u in self.users:
+            s += 'user %s confusion %s classifications %d\n' % \
+                (str(self.users.raw_id(u.id)),
+                 np.array2string(u.score, precision=4), len(u.ledger))
+        for a in self.subjects:
+            s += 'subject %s gold %d posterior %s classifications %d\n' % \
+                (str(self.subjects.raw_id(a.id)), a.gold,
+                 np.array2string(self._subject_posterior[a.id], precision=4),
+                 len(a.ledger))
+        return s
+
+
+class MultiClassUserView(UserView):
+
+    @staticmethod
+    def stats(swap):
+        """
+        Statistics of P(annotation = k | class k) for every class k
+        """
+        confusion = swap._user_scores()
+        stats = MultiStat()
+        for k in range(swap.classes):
+            stats.add(k, array_stat(confusion[:, k, k]))
+        return stats
@@ -0,0 +1,527 @@
+################################################################
+# Batch solver for the static (back_update) methodology
+
+"""
+    StaticSolver:
+        Recalculates every user confusion matrix and every subject
+        score in one pass. Classifications are held in a sparse
+        user x subject incidence matrix, so the user counters are two
+        sparse matrix-vector products against the gold labels. Each
+        subject score is the prior times the product of the likelihood
+        ratios of its classifications, computed as a segmented
+        cumulative sum in log-odds space.
+
+        With config.em.enabled, StaticSolver.em iterates the solver:
+        user confusion matrices are also learned from the current
+        scores of non gold subjects, until the scores converge.
+
+    process_agents:
+        Runs the solver over an agent based swap.swap.SWAP and writes
+        the results back into its ledgers. Used by
+        SWAP.process_changes when config.back_update and
+        config.batch_update are both set.
+"""
+
+import swap.config as config
+
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def segments(keys, size):
+    """
+    Group rows by key, keeping their original order within each group
+
+    Parameters
+    ----------
+    keys : np.array
+        Group key of every row
+    size : int
+        Number of groups
+
+    Returns
+    -------
+    (order, starts, counts)
+        order sorts rows by group, row order[starts[k] + i] is the i-th
+        row of group k
+    """
+    order = np.argsort(keys, kind='stable')
+    counts = np.bincount(keys, minlength=size)
+    starts = np.cumsum(counts) - counts
+
+    return order, starts, counts
+
+
+def segment_cumsum(values, keys, size, groups=None):
+    """
+    Running sum of values within each group, in one pass over all rows.
+    The sums run over all rows, so values must be finite: an infinite
+    value would turn the sums of every later group into nan, see
+    saturated_cumsum
+
+    Parameters
+    ----------
+    values : np.array
+        Value of every row, extra axes are summed separately
+    keys : np.array
+        Group key of every row
+    size : int
+        Number of groups
+    groups : tuple
+        (optional) result of segments, if already known
+
+    Returns
+    -------
+    (sums, (order, starts, counts))
+        sums[i] is the sum of the values of row i and the rows before
+        it in its group, the second item is the result of segments
+    """
+    if groups is None:
+        groups = segments(keys, size)
+    order, starts, counts = groups
+
+    # Cumulative sum over all rows, minus the running total at
+    # the start of each group
+    total = np.cumsum(values[order], axis=0)
+    zero = np.zeros((1,) + total.shape[1:])
+    offset = np.concatenate((zero, total))[starts]
+
+    sums = np.empty(total.shape)
+    sums[order] = total - np.repeat(offset, counts, axis=0)
+
+    return sums, (order, starts, counts)
+
+
+def saturated_cumsum(llr, keys, size):
+    """
+    Running log odds of every group from the log likelihood ratios of
+    its rows, like segment_cumsum, with the degenerate cases of
+    swap.agents.subject.Transaction.calculate: a nan ratio (0 / 0)
+    leaves the log odds unchanged, and from the first infinite ratio
+    of a group on its log odds stay saturated with that sign
+
+    Returns
+    -------
+    (sums, (order, starts, counts))
+        as segment_cumsum
+    """
+    groups = segments(keys, size)
+    finite = np.isfinite(llr)
+    sums, _ = segment_cumsum(np.where(finite, llr, 0.), keys, size, groups)
+
+    infinite = np.isinf(llr)
+    if infinite.any():
+        seen, _ = segment_cumsum(infinite.astype(np.float64),
+                                 keys, size, groups)
+        first = infinite & (seen == 1)
+        sign, _ = segment_cumsum(np.where(first, np.sign(llr), 0.),
+                                 keys, size, groups)
+        saturated = sign != 0
+        sums[saturated] = np.inf * sign[saturated]
+
+    return sums, groups
+
+
+def log_likelihood_ratios(yes, u0, u1):
+    """
+    Log likelihood ratio of classifications annotated 1 (yes) or 0,
+    by users with confusion matrix scores u0 and u1, see
+    StaticSolver.subject_scores. Saturated scores give infinite
+    ratios, and nan for 0 / 0, see saturated_cumsum
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(yes,
+                        np.log(u1) - np.log1p(-u0),
+                        np.log1p(-u1) - np.log(u0))
+
+
+class StaticSolver:
+    """
+    Sparse batch solver for the back_update methodology
+    """
+
+    def __init__(self, users, subjects, annotations, shape):
+        """
+        Parameters
+        ----------
+        users : np.array
+            User index of every classification
+        subjects : np.array
+            Subject index of every classification
+        annotations : np.array
+            Annotation (0 or 1) of every classification. Within a
+            subject, classifications must be in the order they
+            were made
+        shape : (int, int)
+            Number of users, number of subjects
+        """
+        self.users = np.asarray(users, dtype=np.int64)
+        self.subjects = np.asarray(subjects, dtype=np.int64)
+        self.annotations = np.asarray(annotations, dtype=np.int8)
+        self.shape = shape
+
+        ones = np.ones(len(self.users))
+        yes = (self.annotations == 1).astype(np.float64)
+        index = (self.users, self.subjects)
+
+        # Every classification, and only the ones annotated 1
+        self.seen = sparse.csr_matrix((ones, index), shape=shape)
+        self.yes = sparse.csr_matrix((yes, index), shape=shape)
+
+    def user_counts(self, golds):
+        """
+        Confusion matrix counters of every user
+
+        Parameters
+        ----------
+        golds : np.array
+            Gold label of every subject, -1 if not gold. A second
+            axis holds one set of gold labels per trial, see
+            swap.engine.trials
+
+        Returns
+        -------
+        (seen, matched)
+            Tuples of integer arrays indexed by gold label
+        """
+        golds = np.asarray(golds)
+        g0 = (golds == 0).astype(np.float64)
+        g1 = (golds == 1).astype(np.float64)
+
+        seen = (self.seen @ g0, self.seen @ g1)
+        matched = ((self.seen - self.yes) @ g0, self.yes @ g1)
+
+        def integer(arrays):
+            return tuple(np.rint(a).astype(np.int64) for a in arrays)
+
+        return integer(seen), integer(matched)
+
+    @staticmethod
+    def user_scores(seen, matched):
+        """
+        Confusion matrix scores (u0, u1) from the user counters
+        """
+        gamma = config.gamma
+        return tuple((matched[label] + gamma) / (seen[label] + gamma * 2)
+                     for label in (0, 1))
+
+    def subject_logodds(self, u0, u1, p0=None):
+        """
+        Subject score in log odds after every classification,
+        in classification order. See subject_scores
+        """
+        if p0 is None:
+            p0 = config.p0
+
+        u0 = u0[self.users]
+        u1 = u1[self.users]
+        # Broadcast over the trials axis, if any
+        yes = (self.annotations == 1).reshape((-1,) + (1,) * (u0.ndim - 1))
+
+        llr = log_likelihood_ratios(yes, u0, u1)
+
+        logodds, _ = saturated_cumsum(llr, self.subjects, self.shape[1])
+        logodds += np.log(p0) - np.log1p(-p0)
+
+        return logodds
+
+    def subject_scores(self, u0, u1, p0=None, logodds=None):
+        """
+        Subject score after every classification, and the final
+        score of every subject
+
+        The score after the n-th classification of a subject is
+
+            logit(p_n) = logit(p0) + sum of log likelihood ratios
+
+        where the likelihood ratio of a classification is
+        u1 / (1 - u0) when annotated 1 and (1 - u1) / u0 when
+        annotated 0, the same update as
+        swap.agents.subject.Transaction.calculate.
+
+        Parameters
+        ----------
+        u0, u1 : np.array
+            Confusion matrix scores of every user
+        p0 : float
+            Prior, defaults to config.p0
+        logodds : np.array
+            (optional) result of subject_logodds, if already known
+
+        Returns
+        -------
+        (history, scores)
+            history is the score after each classification in
+            classification order, scores is indexed by subject
+        """
+        if p0 is None:
+            p0 = config.p0
+        if logodds is None:
+            logodds = self.subject_logodds(u0, u1, p0)
+
+        history = expit(logodds)
+        order, starts, counts = segments(self.subjects, self.shape[1])
+
+        scores = np.full((self.shape[1],) + history.shape[1:], p0)
+        has = counts > 0
+        scores[has] = history[order[starts[has] + counts[has] - 1]]
+
+        return history, scores
+
+    def solve(self, golds, p0=None):
+        """
+        Run the full static recalculation
+
+        Returns
+        -------
+        dict
+            seen, matched, u0, u1, logodds, history and scores arrays
+        """
+        seen, matched = self.user_counts(golds)
+        u0, u1 = self.user_scores(seen, matched)
+        logodds = self.subject_logodds(u0, u1, p0)
+        history, scores = self.subject_scores(u0, u1, p0, logodds)
+
+        return {'seen': seen, 'matched': matched, 'u0': u0, 'u1': u1,
+                'logodds': logodds, 'history': history, 'scores': scores}
+
+    def em(self, golds, p0=None, tolerance=None, max_iterations=None):
+        """
+        Expectation maximization over the static solver.
+
+        Starts from solve, where users only learn from gold subjects.
+        Every iteration then counts each classification of a non gold
+        subject towards both confusion matrix counters, weighted by
+        the subject's current score, recalculates the user scores and
+        then the final subject scores. Gold subjects keep counting
+        towards their gold label only. Stops when no subject score
+        changes by more than tolerance, or after max_iterations.
+
+        Only the final subject scores are needed between iterations,
+        a sum of log likelihood ratios, so each iteration is a few
+        sparse matrix vector products. The score history is only
+        calculated once at the end.
+
+        Parameters
+        ----------
+        golds : np.array
+            Gold label of every subject, -1 if not gold. Trials are
+            not supported
+        p0 : float
+            Prior, defaults to config.p0
+        tolerance : float
+            Defaults to config.em.tolerance
+        max_iterations : int
+            Defaults to config.em.max_iterations
+
+        Returns
+        -------
+        dict
+            Same as solve, seen and matched are the weighted counters
+            the user scores were calculated from. Adds weights, the
+            (q0, q1) weight of every subject towards each label,
+            converged, and iterations with the largest score change
+            and run time of every iteration
+        """
+        if p0 is None:
+            p0 = config.p0
+        if tolerance is None:
+            tolerance = config.em.tolerance
+        if max_iterations is None:
+            max_iterations = config.em.max_iterations
+
+        golds = np.asarray(golds)
+        result = self.solve(golds, p0)
+
+        gold = (golds == 0) | (golds == 1)
+        truth = (golds == 1).astype(np.float64)
+        prior = np.log(p0) - np.log1p(-p0)
+
+        seen = self.seen
+        no = self.seen - self.yes
+        # Per subject sums over its classifications
+        yes_t = self.yes.T.tocsr()
+        no_t = no.T.tocsr()
+
+        result['weights'] = ((golds == 0).astype(np.float64), truth)
+
+        scores = result['scores']
+        iterations = []
+        converged = False
+        while len(iterations) < max_iterations:
+            start = time.perf_counter()
+
+            q1 = np.where(gold, truth, scores)
+            q0 = 1 - q1
+            counts = ((seen @ q0, seen @ q1), (no @ q0, self.yes @ q1))
+            u0, u1 = self.user_scores(*counts)
+
+            llr1 = np.log(u1) - np.log1p(-u0)
+            llr0 = np.log1p(-u1) - np.log(u0)
+            new = expit(prior + yes_t @ llr1 + no_t @ llr0)
+
+            change = float(np.max(np.abs(new - scores), initial=0))
+            scores = new
+
+            iterations.append({'change': change,
+                               'seconds': time.perf_counter() - start})
+            logger.info('em iteration %d change %.3g %.3fs',
+                        len(iterations), change, iterations[-1]['seconds'])
+
+            if change <= tolerance:
+                converged = True
+                break
+
+        if not converged:
+            logger.warning('em did not converge in %d iterations',
+                           len(iterations))
+
+        if len(iterations) > 0:
+            logodds = self.subject_logodds(u0, u1, p0)
+            history, scores = self.subject_scores(u0, u1, p0, logodds)
+            result.update({'seen': counts[0], 'matched': counts[1],
+                           'weights': (q0, q1), 'u0': u0, 'u1': u1,
+                           'logodds': logodds, 'history': history,
+                           'scores': scores})
+
+        result['converged'] = converged
+        result['iterations'] = iterations
+        return result
+
+
+def collect(swap):
+    """
+    Collect the classifications of an agent based SWAP from its
+    subject ledgers
+
+    Returns
+    -------
+    (users, subjects, (u, s, a), transactions)
+        users and subjects are lists of agents, u and s index into
+        them. u, s, a and transactions have one entry per
+        classification, in classification order within each subject
+    """
+    logger.info('collecting classifications')
+    users = list(swap.users)
+    subjects = list(swap.subjects)
+    user_index = {user.id: i for i, user in enumerate(users)}
+
+    u = []
+    s = []
+    a = []
+    transactions = []
+    for i, subject in enumerate(subjects):
+        # Ledger transactions are stored in the order they were added
+        for t in subject.ledger:
+            u.append(user_index[t.id])
+            s.append(i)
+            a.append(t.annotation)
+            transactions.append(t)
+
+    return users, subjects, (u, s, a), transactions
+
+
+def _write_em_users(users, subjects, result, user_scores):
+    """
+    Write the weighted counters of StaticSolver.em into the user
+    ledgers. With config.keep_history, every user transaction gets the
+    score of the counters up to and including it, in ledger order
+    """
+    seen = result['seen']
+    matched = result['matched']
+    q0, q1 = (q.tolist() for q in result['weights'])
+    rows = {subject.id: i for i, subject in enumerate(subjects)}
+    gamma = config.gamma
+
+    def score(matched, seen):
+        return (matched + gamma) / (seen + gamma * 2)
+
+    history = config.keep_history
+    for i, user in enumerate(users):
+        ledger = user.ledger
+        counts = [0., 0., 0., 0.]
+        for t in ledger:
+            if t.changed:
+                t.commit_change()
+            if history:
+                j = rows[t.id]
+                counts[0] += q0[j]
+                counts[2] += q1[j]
+                if t.annotation == 0:
+                    counts[1] += q0[j]
+                elif t.annotation == 1:
+                    counts[3] += q1[j]
+                t.score = (score(counts[1], counts[0]),
+                           score(counts[3], counts[2]))
+
+        for label, counter in ((0, ledger.no), (1, ledger.yes)):
+            counter.seen = float(seen[label][i])
+            counter.matched = float(matched[label][i])
+
+        ledger.clear_changes()
+        ledger.score = user_scores[i]
+
+
+def process_agents(swap):
+    """
+    Static recalculation of an agent based SWAP. Collects the
+    classifications from the subject ledgers, solves them with
+    StaticSolver and writes the scores back into every ledger.
+
+    Same result as the notify / recalculate cascade in
+    swap.swap.SWAP.process_changes when config.back_update is set,
+    user ledgers are recalculated the same way as in that cascade.
+    With config.em.enabled the scores come from StaticSolver.em
+    instead, and user ledgers get its weighted counters, see
+    _write_em_users.
+
+    Parameters
+    ----------
+    swap : swap.swap.SWAP
+    """
+    users, subjects, (u, s, a), transactions = collect(swap)
+    golds = np.array([subject.gold for subject in subjects])
+
+    logger.info('solving %d classifications', len(transactions))
+    solver = StaticSolver(u, s, a, (len(users), len(subjects)))
+    if config.em.enabled:
+        result = solver.em(golds)
+    else:
+        result = solver.solve(golds)
+
+    logger.info('processing user score changes')
+    # One score tuple per user, shared by its transactions
+    user_scores = list(zip(result['u0'].tolist(), result['u1'].tolist()))
+    if config.em.enabled:
+        _write_em_users(users, subjects, result, user_scores)
+    else:
+        # Counters and running scores of every changed transaction,
+        # the counters end up the same as the solver's
+        swap.users.agent_type.recalculate([user.ledger for user in users])
+
+    history = config.keep_history
+    logger.info('processing subject score changes')
+    if history:
+        history = result['history'].tolist()
+        logodds = result['logodds'].tolist()
+        for n, t in enumerate(transactions):
+            t.change = t.user_score = user_scores[u[n]]
+            t.score = history[n]
+            t.logodds = logodds[n]
+    else:
+        for n, t in enumerate(transactions):
+            t.change = t.user_score = user_scores[u[n]]
+
+    scores = result['scores'].tolist()
+    for i, subject in enumerate(subjects):
+        subject.ledger.commit(scores[i])
+
+    swap.users.clear_changes()
+    swap.subjects.clear_changes()
+
+    logger.info('done')
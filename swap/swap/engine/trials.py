@@ -0,0 +1,200 @@
+################################################################
+# Evaluate many gold label sets against the same classifications
+
+"""
+    TrialSolver:
+        StaticSolver over K gold label sets at once. User confusion
+        matrices become (users, K) arrays and subject scores
+        (subjects, K) arrays, so the classifications are traversed
+        once per batch of trials instead of once per trial.
+
+    Trials:
+        Runs gold label sets through a SWAP in batches and produces a
+        ScoreExport for each, as the swaptools experiments do with
+        set_gold_labels, process_changes and score_export.
+"""
+
+import swap.config as config
+from swap.engine.static import StaticSolver, collect
+from swap.utils.scores import Score, ScoreExport
+
+import numpy as np
+from scipy.special import expit
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TrialSolver(StaticSolver):
+    """
+    Batch solver for K trials, each with its own gold labels
+    """
+
+    def __init__(self, users, subjects, annotations, shape):
+        super().__init__(users, subjects, annotations, shape)
+
+        # Transposed per annotation, for the subject sums. Explicit
+        # zeros are dropped so they never multiply an infinite log
+        # likelihood ratio
+        self._yes_t = self.yes.T.tocsr()
+        self._yes_t.eliminate_zeros()
+        self._no_t = (self.seen - self.yes).T.tocsr()
+        self._no_t.eliminate_zeros()
+
+    def scores(self, golds, p0=None):
+        """
+        Final score of every subject in every trial
+
+        The subject score only depends on the sum of the log
+        likelihood ratios of its classifications, so it is two sparse
+        products against the per user ratios instead of a cumulative
+        sum over every classification in every trial.
+
+        Parameters
+        ----------
+        golds : np.array
+            (subjects, K) gold labels, -1 if not gold in that trial
+        p0 : float
+            Prior, defaults to config.p0
+
+        Returns
+        -------
+        np.array
+            (subjects, K) scores
+        """
+        if p0 is None:
+            p0 = config.p0
+
+        seen, matched = self.user_counts(golds)
+        u0, u1 = self.user_scores(seen, matched)
+
+        with np.errstate(divide='ignore'):
+            llr_yes = np.log(u1) - np.log1p(-u0)
+            llr_no = np.log1p(-u1) - np.log(u0)
+
+        logodds = self._yes_t @ llr_yes + self._no_t @ llr_no
+        logodds += np.log(p0) - np.log1p(-p0)
+
+        return expit(logodds)
+
+
+class Trials:
+    """
+    Evaluate gold label sets against the classifications in a SWAP
+
+    With config.back_update, trials are solved batch_size at a time
+    by TrialSolver. Otherwise subject scores depend on the order
+    golds and classifications arrived in, so each trial is run
+    through the SWAP itself.
+    """
+
+    def __init__(self, swap, batch_size=64, real_golds=None):
+        """
+        Parameters
+        ----------
+        swap : swap.swap.SWAP
+            Agent based SWAP with every classification loaded
+        batch_size : int
+            Number of trials solved together
+        real_golds : dict
+            (optional) Real gold labels used to label the score
+            exports. Fetched from the database once when needed
+        """
+        self.swap = swap
+        self.batch_size = batch_size
+        self.real_golds = real_golds
+
+        self.solver = None
+        self.ids = None
+        self._index = None
+        self._classified = None
+
+    def _init_solver(self):
+        users, subjects, (u, s, a), _ = collect(self.swap)
+        shape = (len(users), len(subjects))
+        self.solver = TrialSolver(u, s, a, shape)
+
+        raw_id = self.swap.subjects.raw_id
+        self.ids = [raw_id(subject.id) for subject in subjects]
+        self._index = {id_: i for i, id_ in enumerate(self.ids)}
+        self._classified = np.bincount(s, minlength=shape[1]) > 0
+
+    def gold_matrix(self, gold_sets):
+        """
+        (subjects, K) gold labels of K gold sets. Gold labels of
+        subjects without classifications are ignored
+        """
+        golds = np.full((len(self.ids), len(gold_sets)), -1, dtype=np.int8)
+        for k, gold_set in enumerate(gold_sets):
+            for id_, gold in gold_set.items():
+                i = self._index.get(id_)
+                if i is not None:
+                    golds[i, k] = gold
+
+        return golds
+
+    def scores(self, gold_sets):
+        """
+        Final score of every subject in every trial,
+        see TrialSolver.scores
+        """
+        if self.solver is None:
+            self._init_solver()
+
+        return self.solver.scores(self.gold_matrix(gold_sets))
+
+    def score_export(self, scores):
+        """
+        ScoreExport of one trial
+
+        Parameters
+        ----------
+        scores : np.array
+            Score of every subject, one column of Trials.scores
+        """
+        if self.real_golds is None:
+            self.real_golds = ScoreExport.get_real_golds()
+
+        scores = scores.tolist()
+        data = {}
+        for i in np.flatnonzero(self._classified):
+            id_ = self.ids[i]
+            gold = self.real_golds.get(id_, -1)
+            data[id_] = Score(id_, gold, scores[i])
+
+        return ScoreExport(data, new_golds=False)
+
+    def run(self, gold_sets):
+        """
+        Evaluate gold label sets
+
+        Parameters
+        ----------
+        gold_sets : iterable
+            Gold label dicts {subject id: gold label}. Consumed
+            batch_size at a time, so it may be a generator
+
+        Yields
+        ------
+        (golds, swap.utils.scores.ScoreExport)
+            One per gold set, in order
+        """
+        gold_sets = iter(gold_sets)
+
+        if not config.back_update:
+            for golds in gold_sets:
+                self.swap.set_gold_labels(golds)
+                self.swap.process_changes()
+                yield golds, self.swap.score_export()
+            return
+
+        while True:
+            batch = list(itertools.islice(gold_sets, self.batch_size))
+            if len(batch) == 0:
+                return
+
+            logger.info('Solving %d trials', len(batch))
+            scores = self.scores(batch)
+            for k, golds in enumerate(batch):
+                yield golds, self.score_export(scores[:, k])
@@ -1,6 +1,7 @@
 ################################################################
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 
 def plot_user(swap, fname):
@@ -68,7 +69,7 @@ def plot_tracks(data, title, fname, dpi=300, scale='log'):
             break
 
         ax.plot(
-            [0.01] + history,
+            np.concatenate(([0.01], history)),
             range(len(history) + 1),
             "-",
             color=cmap[gold],
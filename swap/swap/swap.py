@@ -14,14 +14,17 @@ from swap.agents.agent import Stats
 from swap.agents.subject import Subject
 from swap.agents.user import User
 from swap.utils.scores import ScoreExport, Score
-from swap.utils.history import History, HistoryExport
+from swap.utils.history import HistoryExport, Ragged
 from swap.utils.classification import Classification
+from swap.utils.index import Index
+from swap.utils.scoreview import ScoreTable
 
 from swap.db import DB
 
 import swap.config as config
 
 import progressbar
+import math
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,10 +41,39 @@ class SWAP:
         (hereafter Marshall et al. 2016) for algorithm explanation.
     """
 
-    def __init__(self):
+    def __new__(cls, engine=None):
+        """
+            Pick the SWAP engine. SWAP(engine='columnar') returns a
+            swap.engine.columnar.ColumnarSWAP and
+            SWAP(engine='multiclass') a
+            swap.engine.multiclass.MultiClassSWAP instead of the agent
+            based implementation. Defaults to config.engine
+        """
+        if engine is None:
+            engine = config.engine
+
+        if cls is SWAP and engine == 'columnar':
+            from swap.engine.columnar import ColumnarSWAP
+            cls = ColumnarSWAP
+        elif cls is SWAP and engine == 'multiclass':
+            from swap.engine.multiclass import MultiClassSWAP
+            cls = MultiClassSWAP
+        elif engine not in ['agents', 'columnar', 'multiclass']:
+            raise ValueError('Unknown SWAP engine %s' % str(engine))
+
+        return super().__new__(cls)
+
+    def __getnewargs__(self):
+        # Make sure unpickling restores the same engine
+        return ('agents',)
+
+    def __init__(self, engine=None):
         """
             Initialize SWAP instance
             Args:
+                engine: (optional) 'agents', 'columnar' or 'multiclass',
+                defaults to config.engine
+
                 p0: Prior probability real - in general this is derived
                 empirically by considering the occurence frequency of
                 interesting objects that are expertly identified within a
@@ -57,8 +89,10 @@ class SWAP:
         """
 
         # initialize bureaus to manage user / subject agents
-        self.users = Bureau(User)
-        self.subjects = Bureau(Subject)
+        # Agents use dense integer ids, raw ids are translated by
+        # the index of each bureau
+        self.users = Bureau(User, Index())
+        self.subjects = Bureau(Subject, Index())
 
         # Directive to update - if True, then a volunteer agent's posterior
         # probability of containing an interesting object will be updated
@@ -103,6 +137,8 @@ class SWAP:
 
         subject = self.subjects.get(cl.subject)
         user = self.users.get(cl.user)
+        # Agents only know each other by their dense ids
+        cl = Classification(user.id, subject.id, cl.annotation)
 
         if not config.back_update:
             user.ledger.recalculate()
@@ -160,8 +196,16 @@ class SWAP:
 
         Then any subject agent which is connected to a user whose score has
         changed recalculates its score.
+
+        With config.back_update and config.batch_update set, every score
+        is instead recalculated at once by swap.engine.static
         """
 
+        if config.back_update and config.batch_update:
+            from swap.engine.static import process_agents
+            process_agents(self)
+            return
+
         with_bar = config.back_update
 
         # TODO make sure notify_agents is called on each ledger
@@ -258,29 +302,67 @@ class SWAP:
             This function is for defining all subjects that are
             gold on initialization
 
+            Only subjects whose label actually changes are touched, and
+            each affected user is notified once of all its changes
+
             Parameters
             ----------
             golds : dict
                 (subject id : gold label) Mapping of subject to its gold label
         """
-        # Removes gold label from all subjects not in the golds list
         logger.info('Processing gold labels')
+
+        # Diff against the gold labels currently in use. Removes gold
+        # labels from subjects not in the golds list
+        current = self.golds
+        changes = {id_: -1 for id_ in current if id_ not in golds}
+        for id_, gold in golds.items():
+            if current.get(id_, -1) != gold:
+                changes[id_] = gold
+
         if with_bar:
-            bar = progressbar.ProgressBar(max_value=len(self.subjects))
-        for subject in self.subjects:
-            if subject.id not in golds:
-                subject.set_gold_label(-1, self.subjects, self.users)
+            bar = progressbar.ProgressBar(max_value=len(changes))
+
+        # Assigns the new gold labels, grouping the subjects by the
+        # users that classified them. Also tells the Bureau to make a
+        # new subject agent if it doesn't exist yet
+        notify = {}
+        for id_, gold in changes.items():
+            subject = self.subjects.get(id_, make_new=True)
+            subject.set_gold_label(
+                gold, self.subjects, self.users, notify=False)
+            self.subjects.mark_changed(subject.id)
+
+            for t in subject.ledger:
+                notify.setdefault(t.id, []).append(subject)
 
             if with_bar:
                 bar.update(bar.value + 1)
-        # Assigns the new gold label to subjects in the list
-        # Also tells the Bureau to make a new subject agent if it
-        # doesn't exist yet
-        for id_, gold in golds.items():
-            subject = self.subjects.get(id_, make_new=True)
-            subject.set_gold_label(gold, self.subjects, self.users)
 
-        # self.process_changes()
+        for user_id, subjects in notify.items():
+            self.users.agent(user_id).ledger.notify_golds(subjects)
+
+        logger.debug('%d gold labels changed, notified %d users',
+                     len(changes), len(notify))
+
+    def merge(self, other):
+        """
+        Move the users and subjects of another SWAP into this one
+
+        Both must have been built from disjoint sets of users and
+        subjects, for example separate connected components of the
+        classifications (see swap.utils.components)
+
+        Parameters
+        ----------
+        other : SWAP
+            SWAP to merge, left empty
+        """
+        users = self.users.merge_ids(other.users)
+        subjects = self.subjects.merge_ids(other.subjects)
+
+        self.users.merge(other.users, users, subjects)
+        self.subjects.merge(other.subjects, subjects, users)
 
     @property
     def golds(self):
@@ -295,7 +377,7 @@ class SWAP:
         data = {}
         for subject in self.subjects:
             if subject.isgold():
-                data[subject.id] = subject.gold
+                data[self.subjects.raw_id(subject.id)] = subject.gold
 
         return data
 
@@ -364,7 +446,7 @@ class SWAP:
         swap.utils.scores.ScoreExport
             ScoreExport
         """
-        if history is None:
+        if history is None and config.keep_history:
             history = self.history_export()
 
         logger.info('Generating score export')
@@ -372,13 +454,79 @@ class SWAP:
         for subject in self.subjects:
             if len(subject.ledger) == 0:
                 continue
-            id_ = subject.id
+            id_ = self.subjects.raw_id(subject.id)
             score = subject.score
-            scores[id_] = Score(id_, None, score)
+            retired = subject.ledger.retired
+            if retired is not None:
+                retired = retired[1]
+            scores[id_] = Score(id_, None, score, retired)
 
         logger.debug('done')
         return ScoreExport(scores, history=history)
 
+    def retired(self):
+        """
+        Subjects that retired since the last call, in the order they
+        retired. Scores are checked against config.thresholds as they
+        are calculated, so no export is needed
+
+        Yields
+        ------
+        (subject id, classifications, score)
+            Number of classifications the subject had and its score
+            when it crossed the thresholds
+        """
+        for agent_id in self.subjects.retired():
+            subject = self.subjects.agent(agent_id)
+            yield (self.subjects.raw_id(agent_id), *subject.ledger.retired)
+
+    def publish(self):
+        """
+        Publish the current subject scores for readers on other
+        threads, see swap.utils.scoreview. Only subjects that changed
+        since the last publish are copied. Call from the thread that
+        changes this SWAP
+
+        Returns
+        -------
+        swap.utils.scoreview.ScoreView
+        """
+        changed = self.subjects.score_changes()
+        table = getattr(self, '_score_table', None)
+        if table is None or changed is None:
+            table = self._score_table = ScoreTable()
+            changed = [subject.id for subject in self.subjects]
+
+        rows = sorted(changed)
+        scores = []
+        retired = []
+        classified = []
+        golds = []
+        for row in rows:
+            subject = self.subjects.agent(row)
+            ledger = subject.ledger
+            scores.append(ledger._score)
+            retired.append(math.nan if ledger.retired is None
+                           else ledger.retired[1])
+            classified.append(len(ledger.transactions) > 0)
+            golds.append(subject.gold)
+
+        table.update(rows, scores, retired, classified, golds)
+        self._view = table.view(self.subjects.index)
+        return self._view
+
+    def view(self):
+        """
+        Subject scores of the last publish, safe to read from any
+        thread without a lock
+
+        Returns
+        -------
+        swap.utils.scoreview.ScoreView
+            None if the scores were never published
+        """
+        return getattr(self, '_view', None)
+
     def history_export(self):
         """
         Genearte object containing subject score history
@@ -388,31 +536,34 @@ class SWAP:
         swap.utils.history.HistoryExport
             HistoryExport
         """
+        if not config.keep_history:
+            raise ValueError('Score history is not kept with '
+                             'config.keep_history off')
+
         logger.info('Generating history export')
-        history = {}
+        ids = []
+        golds = []
+        scores = Ragged()
         for subject in self.subjects:
             if len(subject.ledger) == 0:
                 continue
 
-            # Generate list of subject scores
-            scores = [config.p0]
-            for t in sorted(subject.ledger, key=lambda t: t.order):
-                scores.append(t.score)
-
-            # Create History object
-            id_ = subject.id
-            history[id_] = History(id_, subject.gold, scores)
+            # Subject scores are appended to one flat array
+            ids.append(self.subjects.raw_id(subject.id))
+            golds.append(subject.gold)
+            scores.append([config.p0] + subject.ledger.history())
 
         logger.debug('done')
-        return HistoryExport(history)
+        return HistoryExport(ids, golds, scores)
 
     def debug_str(self):
         s = ''
         for u in self.users:
-            s += 'user %s\n' % str(u.id)
+            s += 'user %s\n' % str(self.users.raw_id(u.id))
             s += '%s\n' % str(u.ledger)
         for a in self.subjects:
-            s += 'subject %s gold %d\n' % (str(a.id), a.gold)
+            s += 'subject %s gold %d\n' % \
+                (str(self.subjects.raw_id(a.id)), a.gold)
             s += '%s\n' % str(a.ledger)
         return s
 
@@ -16,6 +16,7 @@
         An interface to generate roc curves from multiple SWAP exports
 """
 
+import swap.config as config
 import swap.plots as plots
 
 from swap.utils.scores import ScoreExport
@@ -23,6 +24,7 @@ from swap.swap import SWAP
 from swap.control import Control
 from swap.ui.ui import Interface
 from swap.ui.utils import load_pickle, write_log
+import swap.utils.snapshot as snapshot
 
 import os
 import csv
@@ -49,8 +51,8 @@ class SWAPInterface(Interface):
 
         parser.add_argument(
             '--save', nargs=1,
-            metavar='file',
-            help='save swap to file')
+            metavar='directory',
+            help='save swap to a snapshot directory')
 
         parser.add_argument(
             '--save-scores', nargs=1,
@@ -60,12 +62,33 @@ class SWAPInterface(Interface):
         parser.add_argument(
             '--load', nargs=1,
             metavar='file',
-            help='Load a pickled SWAP object')
+            help='Load a SWAP snapshot directory or a pickled object')
 
         parser.add_argument(
             '--run', action='store_true',
             help='Run the SWAP algorithm')
 
+        parser.add_argument(
+            '--processes', nargs=1,
+            metavar='n',
+            help='Replay classifications in n processes, splitting them' +
+                 ' into independent groups of users and subjects')
+
+        parser.add_argument(
+            '--lite', action='store_true',
+            help='Only keep current scores, not the score history.' +
+                 ' Uses less memory, but no trace plots or retirement')
+
+        parser.add_argument(
+            '--batch', action='store_true',
+            help='With back_update, recalculate all scores at once' +
+                 ' with the static batch solver')
+
+        parser.add_argument(
+            '--em', action='store_true',
+            help='Run static swap until the scores converge, users also' +
+                 ' learn from the scores of non gold subjects')
+
         parser.add_argument(
             '--train', nargs=1,
             metavar='n',
@@ -266,6 +289,20 @@ class SWAPInterface(Interface):
         """
         control = self.getControl()
 
+        if args.processes:
+            config.control.processes = int(args.processes[0])
+
+        if args.lite:
+            config.keep_history = False
+
+        if args.batch:
+            config.batch_update = True
+
+        if args.em:
+            config.back_update = True
+            config.batch_update = True
+            config.em.enabled = True
+
         # Random test/train split
         if args.train:
             train = int(args.train[0])
@@ -341,7 +378,8 @@ class SWAPInterface(Interface):
         with open(fname, 'w') as csvfile:
             writer = csv.writer(csvfile)
             for user in swap.users:
-                writer.writerow((user.id, *user.score, len(user.ledger)))
+                writer.writerow(
+                    (user.raw_id, *user.score, len(user.ledger)))
         logger.debug('done')
 
     # def scores_from_csv(self, fname):
@@ -377,6 +415,17 @@ class SWAPInterface(Interface):
         return s
 
     def save(self, obj, fname, manifest=None):
+        if fname is None:
+            return
+
+        # SWAP objects are saved as snapshot directories
+        if isinstance(obj, SWAP):
+            snapshot.save(obj, fname)
+            if manifest:
+                with open(os.path.join(fname, 'manifest.txt'), 'w') as file:
+                    file.write(manifest)
+            return
+
         if manifest != '' and manifest is not None:
             m_fname = fname.split('.')
             m_fname = m_fname[:-1]
@@ -387,6 +436,15 @@ class SWAPInterface(Interface):
 
         super().save(obj, fname)
 
+    @staticmethod
+    def load(fname):
+        """
+        Load a SWAP snapshot directory, or a pickled object
+        """
+        if snapshot.is_snapshot(fname):
+            return snapshot.load(fname)
+        return load_pickle(fname)
+
     @staticmethod
     def getControl():
         """
@@ -68,6 +68,12 @@ class UI:
             '--noback', action='store_true',
             help='Run swap without back_update mode (dynamic swap)')
 
+        parser.add_argument(
+            '--engine', nargs=1,
+            choices=['agents', 'columnar', 'multiclass'],
+            help='SWAP engine, agent objects, numpy columns or '
+                 'numpy columns with more than two classes')
+
         parser.add_argument(
             '--config-file', nargs=1,
             metavar='path_to_config_override',
@@ -106,6 +112,9 @@ class UI:
         elif args.noback:
             config.back_update = False
 
+        if args.engine:
+            config.engine = args.engine[0]
+
         if args.config_file:
             config.import_config(args.config_file[0])
 
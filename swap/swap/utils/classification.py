@@ -1,4 +1,5 @@
 
+import sys
 import logging
 logger = logging.getLogger(__name__)
 
@@ -46,7 +47,12 @@ class Classification:
 
         user = cl['user_id']
         if user is None:
+            # Anonymous users are identified by their session string.
+            # Intern it so every classification, agent and transaction
+            # from that session shares one string object
             user = cl['session_id']
+            if type(user) is str:
+                user = sys.intern(user)
 
         subject = cl['subject_id']
         annotation = cl['annotation']
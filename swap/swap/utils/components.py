@@ -0,0 +1,150 @@
+################################################################
+# Connected components of the user - subject classification graph
+
+"""
+    SWAP scores only interact through shared users and subjects, so
+    each connected component of the bipartite user - subject graph
+    can be processed independently of the others.
+
+    UnionFind:
+        Disjoint sets over dense integers
+
+    components:
+        Component label of every classification in a stream
+
+    partition:
+        Splits classifications into balanced groups of whole
+        components, keeping the classification order in each group
+"""
+
+from swap.utils.index import Index
+
+import heapq
+
+
+class UnionFind:
+    """
+    Disjoint set forest with union by size and path halving
+    """
+
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def add(self):
+        """
+        Add a new singleton set, returns its element
+        """
+        n = len(self.parent)
+        self.parent.append(n)
+        self.size.append(1)
+        return n
+
+    def find(self, n):
+        """
+        Representative element of the set containing n
+        """
+        parent = self.parent
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    def union(self, a, b):
+        """
+        Merge the sets containing a and b, returns the representative
+        of the merged set
+        """
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return a
+
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+        return a
+
+    def __len__(self):
+        return len(self.parent)
+
+
+def components(classifications):
+    """
+    Label the connected component of every classification
+
+    Parameters
+    ----------
+    classifications : [swap.utils.classification.Classification]
+
+    Returns
+    -------
+    list
+        Component label of each classification. Labels are dense
+        integers, numbered in order of first appearance
+    """
+    sets = UnionFind()
+    # Users and subjects share one node space
+    nodes = Index()
+
+    def node(id_):
+        n = nodes.get(id_)
+        if n == len(sets):
+            sets.add()
+        return n
+
+    edges = []
+    for cl in classifications:
+        user = node(('user', cl.user))
+        sets.union(user, node(('subject', cl.subject)))
+        edges.append(user)
+
+    labels = {}
+    result = []
+    for user in edges:
+        root = sets.find(user)
+        result.append(labels.setdefault(root, len(labels)))
+
+    return result
+
+
+def partition(classifications, groups):
+    """
+    Split classifications into groups of whole components
+
+    Components are placed largest first into the group with the
+    fewest classifications so far. Classifications keep their
+    original order within each group.
+
+    Parameters
+    ----------
+    classifications : [swap.utils.classification.Classification]
+    groups : int
+        Maximum number of groups
+
+    Returns
+    -------
+    [[Classification]]
+        Non empty groups, largest first
+    """
+    labels = components(classifications)
+
+    sizes = {}
+    for label in labels:
+        sizes[label] = sizes.get(label, 0) + 1
+
+    heap = [(0, n) for n in range(groups)]
+    assign = {}
+    for label in sorted(sizes, key=lambda label: -sizes[label]):
+        size, n = heapq.heappop(heap)
+        assign[label] = n
+        heapq.heappush(heap, (size + sizes[label], n))
+
+    result = [[] for _ in range(groups)]
+    for cl, label in zip(classifications, labels):
+        result[assign[label]].append(cl)
+
+    result = [group for group in result if len(group) > 0]
+    return sorted(result, key=len, reverse=True)
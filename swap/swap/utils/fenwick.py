@@ -0,0 +1,100 @@
+################################################################
+# Fenwick (binary indexed) tree of floats
+
+import math
+
+
+class FenwickTree:
+    """
+    Keeps running sums of a growing list of finite values.
+
+    Changing a value, appending a value and reading a prefix sum or
+    the total are O(log n). Changes are applied to the nodes as
+    deltas, so the nodes are rebuilt from the values after every n
+    changes to keep rounding errors from building up
+    """
+
+    def __init__(self):
+        # 1-based tree, _tree[0] is unused
+        self._tree = [0.]
+        self._values = []
+        # Changes since the nodes were last rebuilt
+        self._changes = 0
+
+    def append(self, value):
+        """
+        Add a new value to the end of the list
+        """
+        check(value)
+        self._values.append(value)
+
+        i = len(self._tree)
+        low = i - (i & -i)
+        # Node i holds the sum of values (low, i]
+        self._tree.append(math.fsum(self._values[low:i]))
+
+    def set(self, index, value):
+        """
+        Change the value at index (0-based)
+        """
+        check(value)
+        delta = value - self._values[index]
+        if delta == 0:
+            return
+
+        self._values[index] = value
+        self._changes += 1
+        if self._changes > len(self._values):
+            self.rebuild()
+            return
+
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def rebuild(self):
+        """
+        Recalculate every node from the values, O(n)
+        """
+        tree = [0.] + self._values
+        for i in range(1, len(tree)):
+            j = i + (i & -i)
+            if j < len(tree):
+                tree[j] += tree[i]
+
+        self._tree = tree
+        self._changes = 0
+
+    def prefix(self, n):
+        """
+        Sum of the first n values
+        """
+        s = 0.
+        while n > 0:
+            s += self._tree[n]
+            n -= n & -n
+        return s
+
+    @property
+    def total(self):
+        """
+        Sum of all values
+        """
+        return self.prefix(len(self._values))
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+def check(value):
+    # inf - inf in a delta would turn every sum it reaches into nan
+    if not math.isfinite(value):
+        raise ValueError('Fenwick tree values must be finite, not %s' %
+                         str(value))
@@ -1,6 +1,112 @@
 
 from swap.utils.scores import ScoreIterator
 
+import numpy as np
+
+
+class Ragged:
+    """
+    Rows of different lengths stored as one flat array and the
+    offsets where each row starts (CSR layout). Row i is
+    values[offsets[i]:offsets[i + 1]], and rows are numpy views
+    into the flat array rather than copies
+    """
+
+    def __init__(self, dtype=np.float64, capacity=1024):
+        self._values = np.empty(capacity, dtype=dtype)
+        self._size = 0
+        self._offsets = [0]
+
+    @classmethod
+    def from_arrays(cls, values, offsets):
+        """
+        Ragged array over existing flat values and offsets,
+        without copying them
+        """
+        ragged = cls(capacity=0)
+        ragged._values = np.asarray(values)
+        ragged._size = len(ragged._values)
+        ragged._offsets = np.asarray(offsets, dtype=np.int64)
+        return ragged
+
+    def append(self, row):
+        """
+        Append a row, returns its index
+        """
+        if not isinstance(self._offsets, list):
+            self._offsets = self._offsets.tolist()
+
+        row = np.asarray(row, dtype=self._values.dtype)
+        size = self._size + len(row)
+
+        capacity = max(len(self._values), 1)
+        if size > capacity:
+            while capacity < size:
+                capacity *= 2
+            values = np.empty(capacity, dtype=self._values.dtype)
+            values[:self._size] = self._values[:self._size]
+            self._values = values
+
+        self._values[self._size:size] = row
+        self._size = size
+        self._offsets.append(size)
+
+        return len(self._offsets) - 2
+
+    @property
+    def values(self):
+        """
+        Flat array of every row, in order
+        """
+        return self._values[:self._size]
+
+    @property
+    def offsets(self):
+        """
+        Start of every row in values, followed by the total length
+        """
+        if isinstance(self._offsets, list):
+            self._offsets = np.array(self._offsets, dtype=np.int64)
+        return self._offsets
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def row(self, i):
+        offsets = self.offsets
+        return self.values[offsets[i]:offsets[i + 1]]
+
+    def first(self, mask):
+        """
+        Position in each row of its first element where mask is true
+
+        Parameters
+        ----------
+        mask : np.array
+            bool array the same length as values
+
+        Returns
+        -------
+        np.array
+            Index into values of the first true element of each row,
+            or -1 for rows without one
+        """
+        offsets = self.offsets
+        hits = np.flatnonzero(mask)
+
+        # First hit at or after the start of each row
+        first = np.searchsorted(hits, offsets[:-1])
+        result = np.full(len(self), -1, dtype=np.int64)
+
+        found = first < len(hits)
+        found[found] = hits[first[found]] < offsets[1:][found]
+        result[found] = hits[first[found]]
+
+        return result
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
 
 class History:
 
@@ -12,8 +118,8 @@ class History:
             Subject it
         gold : int
             Subject gold label 1, 0, or -1
-        scores : list
-            List of score history for subject [0.2, 0.1, ...]
+        scores : np.array, list
+            Score history for subject [0.2, 0.1, ...]
         """
         self.id = id_
         self.gold = gold
@@ -21,18 +127,59 @@ class History:
 
 
 class HistoryExport:
+    """
+    Score history of every subject. Histories are kept as one
+    swap.utils.history.Ragged array, and History objects are views
+    into it built on access
+    """
 
-    def __init__(self, history):
+    def __init__(self, ids, golds, scores):
         """
         Parameters
         ----------
-        history : dict
-            Mapping of Subject History to subject id
+        ids : list
+            Subject ids, one per row of scores
+        golds : list, np.array
+            Subject gold labels, one per row of scores
+        scores : Ragged
+            Score history of each subject, starting with the prior
         """
-        self.history = history
+        self.ids = ids
+        self.golds = np.asarray(golds)
+        self.scores = scores
+        self._index = {id_: i for i, id_ in enumerate(ids)}
+
+    def _history(self, i):
+        return History(self.ids[i], int(self.golds[i]), self.scores.row(i))
+
+    @property
+    def history(self):
+        """
+        Mapping of subject id to History
+        """
+        return {id_: self._history(i) for i, id_ in enumerate(self.ids)}
 
     def get(self, id_):
-        return self.history[id_]
+        return self._history(self._index[id_])
+
+    def retired(self, bogus, real):
+        """
+        First score in each subject's history outside the (bogus, real)
+        retirement thresholds
+
+        Returns
+        -------
+        dict
+            {subject id: score}, only for subjects that retire
+        """
+        values = self.scores.values
+        first = self.scores.first((values < bogus) | (values > real))
+
+        retired = {}
+        for i in np.flatnonzero(first >= 0):
+            retired[self.ids[i]] = float(values[first[i]])
+
+        return retired
 
     def traces(self):
 
@@ -46,3 +193,6 @@ class HistoryExport:
         def func(history):
             return (history.id, history.gold, history.scores)
         return ScoreIterator(self.history, func)
+
+    def __len__(self):
+        return len(self.ids)
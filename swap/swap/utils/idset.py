@@ -0,0 +1,213 @@
+################################################################
+# Compact in-memory set of integer ids
+
+"""
+    IdSet:
+        Set of integer ids, such as the classification ids online SWAP
+        has already received. Most ids are kept in one sorted int64
+        array, 8 bytes per id instead of the ~70 of a python set, and
+        ids added since the last merge in a small python set. Lookups
+        check the recent set, then binary search the array.
+
+        Reads need no lock: the array and the recent set are replaced,
+        never changed in place, so a reader always sees every id added
+        before it started.
+
+    BloomFilter:
+        Optional front to IdSet. Ids that were never added are
+        rejected without searching the array.
+"""
+
+import numpy as np
+import math
+import threading
+
+MASK = (1 << 64) - 1
+# Multipliers of the two hashes combined by the bloom filter
+HASH_1 = 0x9E3779B97F4A7C15
+HASH_2 = 0xC2B2AE3D27D4EB4F
+
+
+def unique(ids):
+    """
+    Sorted unique int64 ids
+    """
+    ids = np.sort(np.asarray(ids, dtype=np.int64))
+    if len(ids) == 0:
+        return ids
+
+    keep = np.empty(len(ids), dtype=bool)
+    keep[0] = True
+    np.not_equal(ids[1:], ids[:-1], out=keep[1:])
+    return ids[keep]
+
+
+class BloomFilter:
+    """
+    Bloom filter of integers, over a bit array of a power of 2 size
+    """
+
+    def __init__(self, capacity, error=.01):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Number of ids it is sized for
+        error : float
+            False positive rate at capacity
+        """
+        capacity = max(int(capacity), 1)
+        bits = -capacity * math.log(error) / math.log(2) ** 2
+        self._shift = 64 - max(int(math.ceil(math.log2(bits))), 3)
+        size = 1 << (64 - self._shift)
+
+        self.capacity = capacity
+        self.error = error
+        self.hashes = max(int(round(size / capacity * math.log(2))), 1)
+        self._bits = np.zeros(size // 8, dtype=np.uint8)
+
+    def _positions(self, id_):
+        h1 = (id_ * HASH_1) & MASK
+        h2 = ((id_ * HASH_2) & MASK) | 1
+        return [((h1 + i * h2) & MASK) >> self._shift
+                for i in range(self.hashes)]
+
+    def add(self, id_):
+        for p in self._positions(int(id_)):
+            self._bits[p >> 3] |= 1 << (p & 7)
+
+    def add_many(self, ids):
+        """
+        Add an array of ids at once
+        """
+        ids = np.asarray(ids, dtype=np.int64).view(np.uint64)
+        bits = np.zeros(len(self._bits) * 8, dtype=bool)
+        with np.errstate(over='ignore'):
+            h1 = ids * np.uint64(HASH_1)
+            h2 = ids * np.uint64(HASH_2) | np.uint64(1)
+            for i in range(self.hashes):
+                bits[(h1 + np.uint64(i) * h2) >> np.uint64(self._shift)] = 1
+
+        self._bits |= np.packbits(bits, bitorder='little')
+
+    def __contains__(self, id_):
+        bits = self._bits
+        for p in self._positions(int(id_)):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class IdSet:
+    """
+    Set of integer ids, see module docstring
+    """
+
+    def __init__(self, ids=(), bloom=None, merge_every=4096, merge_ratio=0):
+        """
+        Parameters
+        ----------
+        ids : iterable
+            Initial ids
+        bloom : float
+            (optional) False positive rate of a bloom filter in front
+            of the array, None for no filter
+        merge_every : int
+            Recent ids kept in the python set before they are merged
+            into the sorted array
+        merge_ratio : float
+            (optional) Also keep up to this fraction of the array size
+            in the python set, so a set that only grows is merged
+            O(log n) times instead of once every merge_every ids
+        """
+        if not isinstance(ids, np.ndarray):
+            ids = np.fromiter(ids, dtype=np.int64)
+        self._sorted = unique(ids)
+        self._recent = set()
+        self._lock = threading.Lock()
+
+        self.merge_every = merge_every
+        self.merge_ratio = merge_ratio
+        self.bloom_error = bloom
+        self.bloom = None
+        if bloom is not None:
+            self.bloom = self._bloom(self._sorted)
+
+    def _bloom(self, ids):
+        bloom = BloomFilter(max(2 * len(ids), 1 << 16), self.bloom_error)
+        bloom.add_many(ids)
+        return bloom
+
+    def add(self, id_):
+        """
+        Add an id
+
+        Returns
+        -------
+        bool
+            Whether the id was new
+        """
+        id_ = int(id_)
+        with self._lock:
+            if id_ in self:
+                return False
+
+            if self.bloom is not None:
+                self.bloom.add(id_)
+            self._recent.add(id_)
+
+            if len(self._recent) >= max(
+                    self.merge_every, self.merge_ratio * len(self._sorted)):
+                self._merge()
+        return True
+
+    def _merge(self):
+        recent = np.fromiter(self._recent, dtype=np.int64,
+                             count=len(self._recent))
+        merged = unique(np.concatenate([self._sorted, recent]))
+
+        if self.bloom is not None and len(merged) > self.bloom.capacity:
+            self.bloom = self._bloom(merged)
+
+        # Publish the merged array before dropping the recent set,
+        # see __contains__
+        self._sorted = merged
+        self._recent = set()
+
+    def existing(self, ids):
+        """
+        The ids already in the set
+
+        Parameters
+        ----------
+        ids : list
+
+        Returns
+        -------
+        set
+        """
+        recent = self._recent
+        array = self._sorted
+        query = np.asarray(ids, dtype=np.int64)
+
+        i = np.searchsorted(array, query)
+        found = np.zeros(len(query), dtype=bool)
+        inside = i < len(array)
+        found[inside] = array[i[inside]] == query[inside]
+
+        return {id_ for id_, hit in zip(ids, found.tolist())
+                if hit or id_ in recent}
+
+    def __contains__(self, id_):
+        id_ = int(id_)
+        if self.bloom is not None and id_ not in self.bloom:
+            return False
+        if id_ in self._recent:
+            return True
+
+        array = self._sorted
+        i = int(array.searchsorted(id_))
+        return i < len(array) and int(array[i]) == id_
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
@@ -0,0 +1,112 @@
+################################################################
+# Interning table between raw ids and dense integer indices
+
+from collections.abc import Sequence
+from itertools import islice
+
+
+class Index:
+    """
+    Bidirectional mapping between raw ids (panoptes user ids,
+    session strings, subject ids) and dense integers 0, 1, 2, ...
+
+    SWAP keeps one Index for users and one for subjects. Agents,
+    ledgers and transactions only ever see the dense integers, raw
+    ids are translated back when data leaves SWAP (score and history
+    exports, gold labels, the online interface)
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._ids = []
+
+    def get(self, id_, make_new=True):
+        """
+        Dense index of a raw id
+
+        Parameters
+        ----------
+        id_
+            Raw id
+        make_new : bool
+            Assign the next index if the id is new, otherwise
+            return None for unknown ids
+        """
+        try:
+            return self._index[id_]
+        except KeyError:
+            if not make_new:
+                return None
+
+        index = len(self._ids)
+        self._index[id_] = index
+        self._ids.append(id_)
+
+        return index
+
+    def id(self, index):
+        """
+        Raw id of a dense index
+        """
+        return self._ids[index]
+
+    def ids(self):
+        """
+        All raw ids, ordered by index, as a read-only IdView. O(1),
+        nothing is copied
+
+        Returns
+        -------
+        IdView
+        """
+        return IdView(self)
+
+    def __contains__(self, id_):
+        return id_ in self._index
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class IdView(Sequence):
+    """
+    Read-only view of the raw ids of an Index, ordered by index, as
+    they were when the view was made. An Index only ever appends ids,
+    so the view shares its list without copying and ids added later
+    never show up in it
+    """
+
+    __slots__ = ('_index', '_ids', '_size')
+
+    def __init__(self, index):
+        self._index = index._index
+        self._ids = index._ids
+        self._size = len(index._ids)
+
+    def get(self, id_):
+        """
+        Dense index of a raw id, None if it is not in the view
+        """
+        index = self._index.get(id_)
+        if index is None or index >= self._size:
+            return None
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._ids[:self._size][index]
+
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('id index out of range')
+        return self._ids[index]
+
+    def __iter__(self):
+        return islice(self._ids, self._size)
+
+    def __contains__(self, id_):
+        return self.get(id_) is not None
+
+    def __len__(self):
+        return self._size
@@ -223,6 +223,13 @@ class AnnotationParser(Parser):
         if key is not None:
             value = self._navigate(value, key, sep)
 
+        classes = self.config.classes
+        if classes is not None:
+            for label, values in enumerate(classes):
+                if value in values:
+                    return label
+            return None
+
         if value in self.config.true:
             return 1
         if value in self.config.false:
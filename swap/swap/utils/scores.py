@@ -290,15 +290,10 @@ class ScoreExport:
         logger.debug('finding subject retired scores')
         bogus, real = self.thresholds
 
+        retired = history_export.retired(bogus, real)
         for score in self.scores.values():
-            history = history_export.get(score.id)
-
-            # print(score.id)
-            for p in history.scores:
-                if p < bogus or p > real:
-                    # print(p, bogus, real)
-                    score.retired = p
-                    break
+            if score.id in retired:
+                score.retired = retired[score.id]
         logger.debug('done')
 
     def __len__(self):
@@ -0,0 +1,293 @@
+################################################################
+# Copy on write views of subject scores for concurrent readers
+
+"""
+    Online SWAP applies classifications on one worker thread while
+    other threads answer score requests. Instead of sharing a lock,
+    the worker publishes immutable views of the subject scores, and
+    readers only ever touch a published view.
+
+    ScoreTable:
+        Subject scores kept by the writer in fixed size chunks. A
+        chunk is copied the first time it is written after being
+        published, so publishing is O(chunks) and an update only
+        copies the chunks it touches. Every subject row carries the
+        sequence number of the view it last changed in, so readers
+        can ask for the changes since a view they already have.
+
+    ScoreView:
+        Consistent, immutable view of the subject scores at one
+        point in time, with the subject ids as they were when it was
+        published. Safe to read from any thread without a lock.
+"""
+
+from swap.utils.scores import ScoreExport, Score
+
+import numpy as np
+
+# Chunk rows
+SCORE = 0
+# Score when the subject retired, nan if it has not
+RETIRED = 1
+# 1 if the subject has classifications
+CLASSIFIED = 2
+# Gold label of the subject
+GOLD = 3
+# Sequence number of the view the subject last changed in
+SEQUENCE = 4
+
+# Rows compared to find changed subjects
+VALUES = 4
+
+
+class ScoreTable:
+    """
+    Writer side of the published scores, only used by one thread
+    """
+
+    def __init__(self, chunk_size=1024):
+        self.chunk_size = chunk_size
+        self._chunks = []
+        # Chunks written since the last view, the others are shared
+        # with published views and must be copied before writing
+        self._owned = set()
+        self._size = 0
+        self.version = 0
+        # Last version any subject changed in
+        self.sequence = 0
+
+    def _chunk(self):
+        chunk = np.zeros((5, self.chunk_size))
+        chunk[RETIRED] = np.nan
+        chunk[GOLD] = -1
+        return chunk
+
+    def _writable(self, c):
+        if c not in self._owned:
+            self._chunks[c] = self._chunks[c].copy()
+            self._owned.add(c)
+        return self._chunks[c]
+
+    def _grow(self, size):
+        while len(self._chunks) * self.chunk_size < size:
+            self._owned.add(len(self._chunks))
+            self._chunks.append(self._chunk())
+        self._size = max(self._size, size)
+
+    def _write(self, c, columns, values):
+        """
+        Write values to columns of chunk c, only copying the chunk
+        and bumping the sequence of columns whose values changed
+        """
+        old = self._chunks[c][:VALUES, columns]
+        changed = (old != values) & ~(np.isnan(old) & np.isnan(values))
+        changed = changed.any(axis=0)
+        if not changed.any():
+            return
+
+        columns = columns[changed]
+        chunk = self._writable(c)
+        chunk[:VALUES, columns] = values[:, changed]
+        chunk[SEQUENCE, columns] = self.version + 1
+        self.sequence = self.version + 1
+
+    def update(self, rows, scores, retired, classified, golds):
+        """
+        Write the scores of some subjects
+
+        Parameters
+        ----------
+        rows : np.array
+            Subject rows, dense subject ids
+        scores, retired, classified, golds : np.array
+            Score, retired score (nan if not retired), whether
+            the subject has classifications and gold label,
+            one per row
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self._grow(int(rows.max()) + 1)
+
+        values = np.stack([scores, retired, classified, golds]) \
+            .astype(np.float64)
+        chunks = rows // self.chunk_size
+        for c in np.unique(chunks):
+            mask = chunks == c
+            self._write(c, rows[mask] - c * self.chunk_size, values[:, mask])
+
+    def sync(self, scores, retired, classified, golds):
+        """
+        Write the scores of every subject, only copying the chunks
+        that changed
+
+        Parameters
+        ----------
+        scores, retired, classified, golds : np.array
+            One entry per subject, see update
+        """
+        size = len(scores)
+        self._grow(size)
+
+        values = np.stack([scores, retired, classified, golds]) \
+            .astype(np.float64)
+        for c in range(len(self._chunks)):
+            start = c * self.chunk_size
+            end = min(start + self.chunk_size, size)
+            if end <= start:
+                break
+
+            self._write(c, np.arange(end - start), values[:, start:end])
+
+    def view(self, index):
+        """
+        Publish the current scores
+
+        Parameters
+        ----------
+        index : swap.utils.index.Index
+            Subject index. The view keeps a snapshot of its ids, see
+            Index.ids, and never reads the index again
+
+        Returns
+        -------
+        ScoreView
+        """
+        self._owned = set()
+        self.version += 1
+        return ScoreView(tuple(self._chunks), index.ids(), self._size,
+                         self.chunk_size, self.version, self.sequence)
+
+
+class ScoreView:
+    """
+    Immutable subject scores at the time they were published
+    """
+
+    def __init__(self, chunks, ids, size, chunk_size, version,
+                 sequence=0):
+        self._chunks = chunks
+        # swap.utils.index.IdView of the subject ids of the rows
+        self._ids = ids
+        self._size = size
+        self.chunk_size = chunk_size
+        # Increases with every published view
+        self.version = version
+        # Version of the last change in this view, unchanged between
+        # views without changes
+        self.sequence = sequence
+
+        # Joined chunks, built on first use
+        self._arrays = None
+
+    def _row(self, row):
+        c, i = divmod(row, self.chunk_size)
+        return self._chunks[c][:, i]
+
+    def get(self, id_):
+        """
+        Score of a subject
+
+        Returns
+        -------
+        (score, retired)
+            retired is None if the subject did not retire. None if
+            the subject had no classifications when published
+        """
+        # Rows added to the index after publishing are not in _ids
+        row = self._ids.get(id_)
+        if row is None or row >= self._size:
+            return None
+
+        values = self._row(row)
+        if not values[CLASSIFIED]:
+            return None
+
+        retired = values[RETIRED]
+        return (float(values[SCORE]),
+                None if np.isnan(retired) else float(retired))
+
+    def arrays(self):
+        """
+        Rows of every subject, joined into one (5, subjects) array
+        """
+        if self._arrays is None:
+            if len(self._chunks) == 0:
+                arrays = np.zeros((5, 0))
+            else:
+                arrays = np.concatenate(self._chunks, axis=1)
+            self._arrays = arrays[:, :self._size]
+        return self._arrays
+
+    def rows(self, since=None):
+        """
+        Rows of the subjects with classifications
+
+        Parameters
+        ----------
+        since : int
+            (optional) Only subjects that changed after this sequence
+            number
+
+        Returns
+        -------
+        np.array
+        """
+        values = self.arrays()
+        mask = values[CLASSIFIED] != 0
+        if since is not None:
+            mask &= values[SEQUENCE] > since
+        return np.flatnonzero(mask)
+
+    def records(self, rows):
+        """
+        Yields
+        ------
+        dict
+            Score.dict() of each row, see swap.utils.scores.Score
+        """
+        values = self.arrays()[:, rows]
+        scores, retired, golds = (values[SCORE].tolist(),
+                                  values[RETIRED].tolist(),
+                                  values[GOLD].astype(int).tolist())
+
+        for i, row in enumerate(rows.tolist()):
+            r = retired[i]
+            yield {'id': self._ids[row], 'gold': golds[i],
+                   'p': scores[i], 'retired': None if r != r else r}
+
+    def __iter__(self):
+        """
+        Yields
+        ------
+        (subject id, score, retired) of every subject with
+        classifications
+        """
+        for record in self.records(self.rows()):
+            yield (record['id'], record['p'], record['retired'])
+
+    def score_export(self, new_golds=True):
+        """
+        swap.utils.scores.ScoreExport of the view. Retirement is the
+        online retirement, see SWAP.retired, history is not available
+
+        Parameters
+        ----------
+        new_golds : bool
+            Fetch gold labels from the database instead of using the
+            gold labels SWAP had when the view was published
+
+        Returns
+        -------
+        swap.utils.scores.ScoreExport
+        """
+        scores = {}
+        for record in self.records(self.rows()):
+            id_ = record['id']
+            scores[id_] = Score(id_, record['gold'], record['p'],
+                                record['retired'])
+
+        return ScoreExport(scores, new_golds=new_golds)
+
+    def __len__(self):
+        return len(self.rows())
@@ -0,0 +1,638 @@
+################################################################
+# Columnar on-disk snapshots of SWAP state
+
+"""
+    A snapshot is a directory with one .npy file per column, the raw
+    user and subject ids as json, and a json manifest with the format
+    version, engine, counts and the config the scores were calculated
+    with. Columns are memory mapped when loading.
+
+    Layout, one row per user, subject and classification:
+
+        manifest.json
+        users.json          raw user ids in row order
+        subjects.json       raw subject ids in row order
+        user_counts.npy     (users, 4) no seen, no matched,
+                            yes seen, yes matched
+        subject_gold.npy    gold label
+        subject_score.npy   current score
+        subject_retired.npy classifications when the subject retired,
+                            -1 if it has not, see SWAP.retired
+        subject_retired_score.npy
+                            score when the subject retired
+        cl_user.npy         user row
+        cl_subject.npy      subject row. Agent snapshots group rows by
+                            subject in the order they were classified,
+                            columnar snapshots keep the arrival order
+        cl_annotation.npy   annotation
+        cl_score.npy        subject score after the classification
+
+    Multiclass snapshots replace user_counts with user_confusion.npy,
+    (users, K, K) counts[gold, annotation], and add
+    subject_posterior.npy and cl_posterior.npy, the (K,) class
+    posterior of the subject now and after each classification.
+
+    Agent based snapshots also store the remaining ledger and
+    transaction state (user scores, committed and pending changes,
+    transaction order in the user ledgers and the bureau change
+    queues), so a loaded SWAP continues exactly where it was saved.
+
+    save:
+        Write a SWAP to a snapshot directory
+
+    capture, write:
+        The two halves of save. capture copies the state of a SWAP in
+        memory, write writes the copy to disk without touching the
+        SWAP, so a caller can change it again in the meantime
+
+    load:
+        Read a SWAP from a snapshot directory
+
+    Snapshot:
+        Lazy access to the columns of a snapshot, for example to read
+        subject scores without rebuilding every agent
+"""
+
+from swap.swap import SWAP
+from swap.agents.user import User, Transaction as UserTransaction
+from swap.agents.subject import Subject, Transaction as SubjectTransaction
+import swap.config as config
+
+import numpy as np
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 'swap-snapshot'
+VERSION = 1
+
+# Config the scores in a snapshot depend on
+CONFIG = ['p0', 'gamma', 'back_update', 'log_odds', 'subject_ledger',
+          'keep_history']
+
+# Agent flags
+STALE = 1
+DIRTY = 2
+NOTIFY = 4
+# TreeLedger transaction scores match the tree
+HISTORY = 8
+
+# Classification flags, transaction is in the changed list of the
+# subject or the user ledger
+SUBJECT_CHANGED = 1
+USER_CHANGED = 2
+
+# User transaction gold label that was not committed yet
+NO_GOLD = -2
+
+
+def is_snapshot(path):
+    """
+    Whether path is a snapshot directory
+    """
+    return os.path.isfile(os.path.join(path, 'manifest.json'))
+
+
+def save(swap, path):
+    """
+    Write a SWAP to a snapshot directory. The manifest is written
+    last, so an interrupted save is not mistaken for a snapshot
+
+    Parameters
+    ----------
+    swap : swap.swap.SWAP
+        Agent based, columnar or multiclass SWAP
+    path : str
+        Directory, created if it doesn't exist
+    """
+    write(capture(swap), path)
+
+
+def capture(swap):
+    """
+    Copy of everything save writes of a SWAP, see write
+
+    Parameters
+    ----------
+    swap : swap.swap.SWAP
+        Agent based, columnar or multiclass SWAP
+
+    Returns
+    -------
+    dict
+    """
+    from swap.engine.columnar import ColumnarSWAP
+    from swap.engine.multiclass import MultiClassSWAP
+
+    if isinstance(swap, MultiClassSWAP):
+        engine = 'multiclass'
+        users, subjects, arrays = _columnar_columns(swap)
+    elif isinstance(swap, ColumnarSWAP):
+        engine = 'columnar'
+        users, subjects, arrays = _columnar_columns(swap)
+    else:
+        engine = 'agents'
+        users, subjects, arrays = _agent_columns(swap)
+
+    return {'engine': engine, 'users': users, 'subjects': subjects,
+            'arrays': arrays,
+            'config': {key: getattr(config, key) for key in CONFIG}}
+
+
+def write(state, path):
+    """
+    Write a copy made by capture to a snapshot directory, see save
+    """
+    users = state['users']
+    subjects = state['subjects']
+    arrays = state['arrays']
+
+    logger.info('Saving snapshot to %s', path)
+    os.makedirs(path, exist_ok=True)
+
+    manifest_path = os.path.join(path, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for name, ids in (('users', users), ('subjects', subjects)):
+        with open(os.path.join(path, name + '.json'), 'w') as file:
+            json.dump(list(ids), file)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+
+    manifest = {
+        'format': FORMAT,
+        'version': VERSION,
+        'engine': state['engine'],
+        'users': len(users),
+        'subjects': len(subjects),
+        'classifications': len(arrays['cl_user']),
+        'config': state['config'],
+        'columns': {name: [array.dtype.str, list(array.shape)]
+                    for name, array in arrays.items()},
+    }
+
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    logger.info('done')
+
+
+def load(path):
+    """
+    Read a SWAP from a snapshot directory
+
+    Returns
+    -------
+    swap.swap.SWAP
+        SWAP of the engine the snapshot was saved from
+    """
+    return Snapshot(path).swap()
+
+
+class Snapshot:
+    """
+    Snapshot directory. Columns and ids are only read when first
+    used, columns as read only memory maps
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, 'manifest.json')) as file:
+            manifest = json.load(file)
+
+        if manifest.get('format') != FORMAT:
+            raise ValueError('%s is not a SWAP snapshot' % path)
+        if manifest['version'] > VERSION:
+            raise ValueError(
+                'Snapshot version %d is newer than supported version %d' %
+                (manifest['version'], VERSION))
+
+        self.manifest = manifest
+        self._columns = {}
+        self._ids = {}
+
+    @property
+    def engine(self):
+        return self.manifest['engine']
+
+    @property
+    def config(self):
+        return self.manifest['config']
+
+    def column(self, name, mmap_mode='r'):
+        """
+        Memory mapped column
+        """
+        key = (name, mmap_mode)
+        if key not in self._columns:
+            fname = os.path.join(self.path, name + '.npy')
+            self._columns[key] = np.load(fname, mmap_mode=mmap_mode)
+        return self._columns[key]
+
+    def has(self, name):
+        """
+        Whether the snapshot has a column, columns added in later
+        releases are missing from older snapshots
+        """
+        return name in self.manifest['columns']
+
+    def ids(self, name):
+        """
+        Raw ids of 'users' or 'subjects' in row order
+        """
+        if name not in self._ids:
+            with open(os.path.join(self.path, name + '.json')) as file:
+                self._ids[name] = json.load(file)
+        return self._ids[name]
+
+    def scores(self):
+        """
+        Current score of every classified subject
+
+        Returns
+        -------
+        dict
+            {subject id: score}
+        """
+        counts = np.bincount(self.column('cl_subject'),
+                             minlength=self.manifest['subjects'])
+        scores = self.column('subject_score')
+        ids = self.ids('subjects')
+
+        return {ids[i]: float(scores[i]) for i in np.flatnonzero(counts)}
+
+    def check_config(self):
+        """
+        Warn about config that differs from the snapshot
+        """
+        for key, value in self.config.items():
+            current = getattr(config, key)
+            if current != value:
+                logger.warning('Snapshot was saved with %s=%s, config has %s',
+                               key, str(value), str(current))
+
+    def swap(self):
+        """
+        Rebuild the SWAP stored in this snapshot
+        """
+        logger.info('Loading %s snapshot from %s', self.engine, self.path)
+        self.check_config()
+
+        if self.engine in ('columnar', 'multiclass'):
+            swap = _load_columnar(self)
+        else:
+            swap = _load_agents(self)
+
+        logger.info('done')
+        return swap
+
+
+def _pair(value):
+    return (np.nan, np.nan) if value is None else value
+
+
+def _pairs(array):
+    """
+    List of tuples of the rows of an (n, 2) column, with None for nan
+    """
+    values = list(zip(array[:, 0].tolist(), array[:, 1].tolist()))
+    for i in np.flatnonzero(np.isnan(array[:, 0])).tolist():
+        values[i] = None
+    return values
+
+
+def _retired(value):
+    return (-1, np.nan) if value is None else value
+
+
+def _scalar(value):
+    return np.nan if value is None else value
+
+
+def _scalars(array):
+    """
+    List of the values in a column, with None for nan
+    """
+    values = array.tolist()
+    for i in np.flatnonzero(np.isnan(array)).tolist():
+        values[i] = None
+    return values
+
+
+def _agent_flags(bureau, agent):
+    dirty, notify = bureau.pending(agent.id)
+    flags = STALE if agent.ledger.stale else 0
+    flags |= DIRTY if dirty else 0
+    flags |= NOTIFY if notify else 0
+    flags |= HISTORY if getattr(agent.ledger, '_history', False) else 0
+    return flags
+
+
+def _agent_columns(swap):
+    """
+    Columns of an agent based SWAP
+    """
+    users = list(swap.users)
+    subjects = list(swap.subjects)
+    user_rows = {user.id: i for i, user in enumerate(users)}
+
+    user_counts = [(user.ledger.no.seen, user.ledger.no.matched,
+                    user.ledger.yes.seen, user.ledger.yes.matched)
+                   for user in users]
+
+    cl = {name: [] for name in [
+        'cl_user', 'cl_subject', 'cl_annotation', 'cl_score',
+        'cl_logodds', 'cl_user_score', 'cl_user_change', 'cl_user_order',
+        'cl_gold', 'cl_gold_change', 'cl_user_tscore', 'cl_flags']}
+
+    for i, subject in enumerate(subjects):
+        changed = set(subject.ledger.changed)
+        for t in subject.ledger:
+            user = users[user_rows[t.id]]
+            u = user.ledger.transactions[subject.id]
+
+            flags = SUBJECT_CHANGED if t.id in changed else 0
+            flags |= USER_CHANGED if subject.id in user.ledger.changed else 0
+
+            cl['cl_user'].append(user_rows[t.id])
+            cl['cl_subject'].append(i)
+            cl['cl_annotation'].append(t.annotation)
+            cl['cl_score'].append(_scalar(t.score))
+            cl['cl_logodds'].append(_scalar(t.logodds))
+            cl['cl_user_score'].append(_pair(t.user_score))
+            cl['cl_user_change'].append(_pair(t.change))
+            cl['cl_user_order'].append(u.order)
+            cl['cl_gold'].append(NO_GOLD if u.gold is None else u.gold)
+            cl['cl_gold_change'].append(u.change)
+            cl['cl_user_tscore'].append(_pair(u.score))
+            cl['cl_flags'].append(flags)
+
+    dtypes = {
+        'cl_user': np.int32, 'cl_subject': np.int32, 'cl_annotation': np.int8,
+        'cl_user_order': np.int32, 'cl_gold': np.int8,
+        'cl_gold_change': np.int8, 'cl_flags': np.int8}
+
+    pairs = ['cl_user_score', 'cl_user_change', 'cl_user_tscore']
+
+    arrays = {}
+    for name, values in cl.items():
+        array = np.array(values, dtype=dtypes.get(name, np.float64))
+        if name in pairs:
+            array = array.reshape(-1, 2)
+        arrays[name] = array
+
+    arrays.update({
+        # Float, users of an em run have weighted counters
+        'user_counts': np.array(user_counts,
+                                dtype=np.float64).reshape(-1, 4),
+        'user_score': np.array(
+            [_pair(user.ledger._score) for user in users],
+            dtype=np.float64).reshape(-1, 2),
+        'user_flags': np.array(
+            [_agent_flags(swap.users, user) for user in users], np.int8),
+        'subject_gold': np.array(
+            [subject.gold for subject in subjects], np.int8),
+        'subject_score': np.array(
+            [_scalar(subject.ledger._score) for subject in subjects],
+            np.float64),
+        'subject_flags': np.array(
+            [_agent_flags(swap.subjects, subject) for subject in subjects],
+            np.int8),
+        'subject_retired': np.array(
+            [_retired(subject.ledger.retired)[0] for subject in subjects],
+            np.int32),
+        'subject_retired_score': np.array(
+            [_retired(subject.ledger.retired)[1] for subject in subjects],
+            np.float64),
+    })
+
+    ids = ([swap.users.raw_id(user.id) for user in users],
+           [swap.subjects.raw_id(subject.id) for subject in subjects])
+
+    return ids[0], ids[1], arrays
+
+
+def _load_agents(snapshot):
+    """
+    Rebuild an agent based SWAP
+    """
+    swap = SWAP('agents')
+
+    def column(name):
+        return snapshot.column(name).tolist()
+
+    def pairs(name):
+        return _pairs(snapshot.column(name))
+
+    def scalars(name):
+        return _scalars(snapshot.column(name))
+
+    def add(bureau, agent_type, ids):
+        agents = []
+        for raw_id in ids:
+            agent = agent_type(bureau.index.get(raw_id))
+            bureau._add(agent)
+            agents.append(agent)
+        return agents
+
+    users = add(swap.users, User, snapshot.ids('users'))
+    subjects = add(swap.subjects, Subject, snapshot.ids('subjects'))
+
+    for user, counts, score in zip(
+            users, column('user_counts'), pairs('user_score')):
+        ledger = user.ledger
+        ledger.no.seen, ledger.no.matched, \
+            ledger.yes.seen, ledger.yes.matched = counts
+        ledger._score = score
+
+    for subject, gold, score in zip(
+            subjects, column('subject_gold'), scalars('subject_score')):
+        subject._gold = gold
+        subject.ledger._score = score
+
+    if snapshot.has('subject_retired'):
+        for subject, n, score in zip(
+                subjects, column('subject_retired'),
+                column('subject_retired_score')):
+            if n >= 0:
+                subject.ledger.retired = (n, score)
+
+    rows = zip(column('cl_user'), column('cl_subject'),
+               column('cl_annotation'), scalars('cl_score'),
+               scalars('cl_logodds'), pairs('cl_user_score'),
+               pairs('cl_user_change'), column('cl_flags'))
+
+    for u, s, annotation, score, logodds, user_score, change, flags in rows:
+        ledger = subjects[s].ledger
+        # Attributes are set directly, the constructor
+        # would recalculate them
+        t = SubjectTransaction.__new__(SubjectTransaction)
+        t.id = u
+        t.annotation = annotation
+        t.order = len(ledger.transactions)
+        t.score = score
+        t.change = change
+        t.user_score = user_score
+        t.logodds = logodds
+        t.left = t.right = None
+        ledger.transactions[u] = t
+        if flags & SUBJECT_CHANGED:
+            ledger.changed.append(u)
+
+    # User ledgers are filled in the order their
+    # transactions were added
+    cl_user = snapshot.column('cl_user')
+    order = np.lexsort((snapshot.column('cl_user_order'), cl_user))
+    rows = zip(cl_user[order].tolist(),
+               snapshot.column('cl_subject')[order].tolist(),
+               snapshot.column('cl_annotation')[order].tolist(),
+               snapshot.column('cl_gold')[order].tolist(),
+               snapshot.column('cl_gold_change')[order].tolist(),
+               _pairs(snapshot.column('cl_user_tscore')[order]),
+               snapshot.column('cl_flags')[order].tolist())
+
+    for u, s, annotation, gold, change, score, flags in rows:
+        ledger = users[u].ledger
+        t = UserTransaction.__new__(UserTransaction)
+        t.id = s
+        t.annotation = annotation
+        t.order = len(ledger.transactions)
+        t.score = score
+        t.change = change
+        t.gold = None if gold == NO_GOLD else gold
+        ledger.transactions[s] = t
+        if flags & USER_CHANGED:
+            ledger.changed.append(s)
+
+    for agent in subjects:
+        agent.ledger.relink()
+
+    for bureau, agents, flags in (
+            (swap.users, users, column('user_flags')),
+            (swap.subjects, subjects, column('subject_flags'))):
+        bureau.clear_changes()
+        bureau.rebuild_stats()
+        for agent, flag in zip(agents, flags):
+            agent.ledger.stale = bool(flag & STALE)
+            if hasattr(agent.ledger, '_history'):
+                agent.ledger._history = bool(flag & HISTORY)
+            if flag & DIRTY:
+                bureau.mark_dirty(agent.id)
+            if flag & NOTIFY:
+                bureau.mark_notify(agent.id)
+
+    return swap
+
+
+def _columnar_columns(swap):
+    """
+    Columns of a columnar or multiclass SWAP, copied since the
+    engine keeps changing them. The ids are views, which never change
+    """
+    if hasattr(swap, '_user_confusion'):
+        arrays = {
+            'user_confusion': swap._user_confusion.array,
+            'subject_posterior': swap._subject_posterior.array,
+            'cl_posterior': swap._cl_posterior.array,
+        }
+    else:
+        seen = swap._user_seen
+        matched = swap._user_matched
+        user_counts = np.stack([seen[0].array, matched[0].array,
+                                seen[1].array, matched[1].array], axis=1)
+        arrays = {
+            'user_counts': user_counts.astype(np.int64).reshape(-1, 4),
+        }
+
+    arrays.update({
+        'subject_gold': swap._subject_gold.array,
+        'subject_score': swap._subject_score.array,
+        'cl_user': swap._cl_user.array,
+        'cl_subject': swap._cl_subject.array,
+        'cl_annotation': swap._cl_annotation.array,
+        'cl_score': swap._cl_score.array,
+        'subject_retired': swap._subject_retired.array,
+        'subject_retired_score': swap._subject_retired_score.array,
+    })
+
+    arrays = {name: array.copy() for name, array in arrays.items()}
+    return swap._user_index.ids(), swap._subject_index.ids(), arrays
+
+
+def _load_columnar(snapshot):
+    """
+    Rebuild a columnar or multiclass SWAP. Columns are copy on write
+    memory maps until they are modified
+    """
+    from swap.engine.columnar import Column
+
+    swap = SWAP(snapshot.engine)
+
+    for raw_id in snapshot.ids('users'):
+        swap._user_index.get(raw_id)
+    for raw_id in snapshot.ids('subjects'):
+        swap._subject_index.get(raw_id)
+
+    def column(name):
+        return snapshot.column(name, mmap_mode='c')
+
+    if snapshot.engine == 'multiclass':
+        # Number of classes of the snapshot, not the config
+        def classes(name, dtype):
+            array = column(name)
+            return Column.from_array(
+                array, np.dtype((dtype, array.shape[1:])))
+
+        swap._user_confusion = classes('user_confusion', np.int32)
+        swap._subject_posterior = classes('subject_posterior', np.float64)
+        swap._cl_posterior = classes('cl_posterior', np.float64)
+        swap.classes = swap._user_confusion.dtype.shape[-1]
+    else:
+        _load_user_counts(swap, column('user_counts'))
+
+    cl_user = column('cl_user')
+    cl_subject = column('cl_subject')
+    n_users = snapshot.manifest['users']
+    n_subjects = snapshot.manifest['subjects']
+
+    swap._user_count = Column.from_array(
+        np.bincount(cl_user, minlength=n_users), np.int32)
+    swap._subject_count = Column.from_array(
+        np.bincount(cl_subject, minlength=n_subjects), np.int32)
+    swap._subject_gold = Column.from_array(
+        column('subject_gold'), np.int8, fill=-1)
+    swap._subject_score = Column.from_array(
+        column('subject_score'), np.float64)
+    if snapshot.has('subject_retired'):
+        swap._subject_retired = Column.from_array(
+            column('subject_retired'), np.int32, fill=-1)
+        swap._subject_retired_score = Column.from_array(
+            column('subject_retired_score'), np.float64, fill=np.nan)
+    else:
+        for _ in range(n_subjects):
+            swap._subject_retired.append(-1)
+            swap._subject_retired_score.append(np.nan)
+
+    swap._cl_user = Column.from_array(cl_user, np.int32)
+    swap._cl_subject = Column.from_array(cl_subject, np.int32)
+    swap._cl_annotation = Column.from_array(column('cl_annotation'), np.int8)
+    swap._cl_score = Column.from_array(column('cl_score'), np.float64)
+
+    return swap
+
+
+def _load_user_counts(swap, counts):
+    """
+    Binary confusion matrix counters of a columnar SWAP
+    """
+    for label in (0, 1):
+        swap._user_seen[label]._data = np.ascontiguousarray(
+            counts[:, label * 2], dtype=np.int32)
+        swap._user_matched[label]._data = np.ascontiguousarray(
+            counts[:, label * 2 + 1], dtype=np.int32)
+    for c in swap._user_seen + swap._user_matched:
+        c._size = len(counts)
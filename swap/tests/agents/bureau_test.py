@@ -8,8 +8,10 @@ from swap.agents.bureau import AgentIterator
 from swap.agents.agent import Agent
 from swap.agents.user import User
 from swap.agents.subject import Subject
+from swap.utils.index import Index
 
 import unittest
+from unittest.mock import MagicMock, patch
 
 
 class TestBureau:
@@ -129,6 +131,106 @@ class TestBureau:
         [u.ledger.recalculate() for u in b]
         b.stats()
 
+    def test_add_sets_ledger_bureau(self):
+        b = Bureau(User)
+        agent = User(0)
+        b.add(agent)
+
+        assert agent.ledger.bureau is b
+
+    def test_change_marks_dirty(self):
+        b = Bureau(Subject)
+        [b.add(Subject(i)) for i in range(5)]
+        b.process_changes()
+        assert b.calculate_changes() == 0
+
+        b.get(3).ledger.update(0)
+        assert b._dirty == {3}
+        assert b.calculate_changes() == 1
+
+    def test_process_changes_only_dirty(self):
+        b = Bureau(Subject)
+        [b.add(Subject(i)) for i in range(5)]
+        b.process_changes()
+
+        ledgers = {agent.id: agent.ledger for agent in b}
+        with patch.object(type(ledgers[2]), 'recalculate',
+                          autospec=True) as recalculate:
+            b.mark_dirty(2)
+            b.process_changes()
+
+        recalculate.assert_called_once_with(ledgers[2])
+        assert b._dirty == set()
+
+    def test_score_change_marks_notify(self):
+        b = Bureau(User)
+        agent = User(0)
+        b.add(agent)
+
+        agent.ledger.score = (0.5, 0.5)
+        assert b._notify == set()
+
+        agent.ledger.score = (0.2, 0.5)
+        assert b._notify == {0}
+
+    def test_notify_changes_only_queued(self):
+        b = Bureau(User)
+        [b.add(User(i)) for i in range(5)]
+        ledgers = {agent.id: agent.ledger for agent in b}
+        with patch.object(type(ledgers[4]), 'notify_agents',
+                          autospec=True) as notify_agents:
+            b.mark_notify(4)
+            b.notify_changes(None)
+
+        notify_agents.assert_called_once_with(ledgers[4], b, None)
+        assert b._notify == set()
+
+    def test_remove_clears_queues(self):
+        b = Bureau(User)
+        b.add(User(0))
+        b.mark_dirty(0)
+        b.mark_notify(0)
+        b.remove(0)
+
+        assert b._dirty == set()
+        assert b._notify == set()
+
+    def test_index_dense_ids(self):
+        b = Bureau(User, Index())
+        a = b.get('not-logged-in-abc')
+        c = b.get(100)
+
+        assert a.id == 0
+        assert c.id == 1
+        assert b.get('not-logged-in-abc') is a
+        assert b.agent(1) is c
+        assert b.raw_id(1) == 100
+        assert c.raw_id == 100
+        assert b.idset() == {'not-logged-in-abc', 100}
+
+    def test_index_add_raw(self):
+        b = Bureau(User, Index())
+        b.get(5)
+        agent = User(7)
+        b.add(agent)
+
+        assert agent.id == 1
+        assert agent.ledger.id == 1
+        assert 7 in b
+        assert agent in b
+        assert b.get(7) is agent
+
+    def test_index_has_remove(self):
+        b = Bureau(User, Index())
+        b.get('u')
+
+        assert b.has('u')
+        assert not b.has('v')
+        assert 'v' not in b.index
+
+        b.remove('u')
+        assert not b.has('u')
+
     # ---------EXPORT TEST------------------------------
     @pytest.mark.skip()
     def test_export_contents(self):
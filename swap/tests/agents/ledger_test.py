@@ -5,6 +5,7 @@ from swap.agents.ledger import Ledger, Transaction, StaleException
 from swap.agents.subject import Ledger as SLedger
 from swap.agents.subject import Transaction as STransaction
 from swap.agents.subject import Subject
+from swap.agents.subject import TreeLedger, LiteLedger
 from swap.agents.user import User
 from swap.agents.user import Ledger as ULedger
 from swap.agents.user import Transaction as UTransaction
@@ -15,6 +16,8 @@ import swap.config as config
 
 from unittest.mock import MagicMock, patch
 
+import math
+import random
 import pytest
 
 
@@ -79,12 +82,12 @@ class TestLedger:
     def test_update(self):
         le = Ledger(0)
         t0 = Transaction(mocksubject(0), 0)
-        t0.notify = MagicMock()
 
-        le.add(t0)
-        le.update(0)
+        with patch.object(Transaction, 'notify') as notify:
+            le.add(t0)
+            le.update(0)
 
-        t0.notify.assert_not_called
+        notify.assert_not_called()
 
     def test_update_registers_change(self):
         le = Ledger(0)
@@ -260,14 +263,13 @@ class TestSubjectLedger:
         t1 = STransaction(mockuser(1), 0)
         t2 = STransaction(mockuser(2), 0)
 
-        t1.notify = MagicMock()
+        with patch.object(STransaction, 'notify'):
+            le.add(t0)
+            le.add(t1)
+            le.add(t2)
 
-        le.add(t0)
-        le.add(t1)
-        le.add(t2)
-
-        le.clear_changes()
-        le.update(1)
+            le.clear_changes()
+            le.update(1)
 
         print(le.changed)
         assert le.first_change == t1
@@ -364,6 +366,157 @@ class TestSubjectLedger:
         assert mock.call_count == 0
 
 
+class TestTreeLedger:
+    def test_add_calculates(self):
+        le = TreeLedger(0)
+        t = STransaction(mockuser(0, (.25, .8)), 1)
+        le.add(t)
+
+        assert le.score == pytest.approx(.096 / .756)
+        assert t.score == pytest.approx(.096 / .756)
+
+    def test_matches_chain(self):
+        chain = SLedger(0)
+        tree = TreeLedger(0)
+        users = [mockuser(i, (.2 + i / 20, .9 - i / 30)) for i in range(10)]
+        for i, user in enumerate(users):
+            chain.add(STransaction(user, int(i % 3 == 0)))
+            tree.add(STransaction(user, int(i % 3 == 0)))
+
+        assert tree.score == pytest.approx(chain.score)
+        assert tree.history() == pytest.approx(chain.history())
+
+    def test_update_middle(self):
+        chain = SLedger(0)
+        tree = TreeLedger(0)
+        users = [mockuser(i, (.6, .7)) for i in range(10)]
+        for i, user in enumerate(users):
+            chain.add(STransaction(user, i % 2))
+            tree.add(STransaction(user, i % 2))
+
+        for le in (chain, tree):
+            le.transactions[4].notify(mockuser(4, (.9, .9)))
+            le.update(4)
+            le.recalculate()
+
+        assert tree.score == pytest.approx(chain.score)
+        assert tree.history() == pytest.approx(chain.history())
+
+    @patch('swap.config.back_update', True)
+    def test_back_update_history(self):
+        tree = TreeLedger(0)
+        tree.add(STransaction(mockuser(0, (.25, .8)), 1))
+        tree.add(STransaction(mockuser(1, (.25, .8)), 0))
+        tree.recalculate()
+
+        p = .096 / .756
+        history = tree.history()
+        assert history[0] == pytest.approx(p)
+        assert history[1] == pytest.approx(p * .2 / (p * .2 + (1 - p) * .25))
+        assert tree.score == pytest.approx(history[1])
+
+    def test_empty_is_prior(self):
+        tree = TreeLedger(0)
+        assert tree.recalculate() == pytest.approx(config.p0)
+
+    def test_saturated(self):
+        tree = TreeLedger(0)
+        yes = STransaction(mockuser(0, (1., 1.)), 1)
+        no = STransaction(mockuser(1, (1., 1.)), 0)
+        tree.add(yes)
+        tree.add(no)
+        # Clipped, the contradicting users cancel instead of inf - inf
+        assert tree.recalculate() == pytest.approx(config.p0)
+
+        yes.notify(mockuser(0, (.6, .7)))
+        tree.update(0)
+        tree.recalculate()
+        history = tree.history()
+        assert history[0] == pytest.approx(.084 / (.084 + .88 * .4))
+        assert 0 < history[1] < 1e-300
+        assert tree.score == history[1]
+
+
+class TestLiteLedger:
+    def test_add_calculates(self):
+        le = LiteLedger(0)
+        t = STransaction(mockuser(0, (.25, .8)), 1)
+        le.add(t)
+
+        assert le.score == pytest.approx(.096 / .756)
+        assert t.score is None
+
+    def test_update_middle(self):
+        chain = SLedger(0)
+        lite = LiteLedger(0)
+        users = [mockuser(i, (.6, .7)) for i in range(10)]
+        for i, user in enumerate(users):
+            chain.add(STransaction(user, i % 2))
+            lite.add(STransaction(user, i % 2))
+
+        for le in (chain, lite):
+            le.transactions[4].notify(mockuser(4, (.9, .9)))
+            le.update(4)
+            le.recalculate()
+
+        assert lite.score == pytest.approx(chain.score)
+        assert lite.total == pytest.approx(
+            sum(t.likelihood() for t in lite))
+
+    def test_saturated(self):
+        lite = LiteLedger(0)
+        lite.add(STransaction(mockuser(0, (1., 1.)), 1))
+        lite.add(STransaction(mockuser(1, (1., 1.)), 0))
+        # Clipped, the contradicting users cancel instead of inf - inf
+        assert lite.recalculate() == pytest.approx(config.p0)
+
+        lite.commit(1.)
+        assert math.isfinite(lite.total)
+        assert lite.total == 0.
+
+    def test_resum(self):
+        lite = LiteLedger(0)
+        users = [mockuser(i, (.6, .7)) for i in range(3)]
+        for i, user in enumerate(users):
+            lite.add(STransaction(user, i % 2))
+
+        r = random.Random(0)
+        for n in range(4):
+            lite.transactions[n % 3].notify(
+                mockuser(n % 3, (r.random(), r.random())))
+            lite.update(n % 3)
+            lite.recalculate()
+
+        # Summed again after the fourth change
+        assert lite._changes == 0
+        assert lite.total == math.fsum(t.likelihood() for t in lite)
+
+    def test_no_history(self):
+        with pytest.raises(ValueError):
+            LiteLedger(0).history()
+
+    def test_empty_is_prior(self):
+        assert LiteLedger(0).recalculate() == pytest.approx(config.p0)
+
+
+class TestSlots:
+    def test_transactions(self):
+        for t in (STransaction(mockuser(0), 0),
+                  UTransaction(mocksubject(0), 0)):
+            assert not hasattr(t, '__dict__')
+
+    def test_ledgers(self):
+        for le in (SLedger(0), TreeLedger(0), LiteLedger(0), ULedger(0)):
+            assert not hasattr(le, '__dict__')
+
+    def test_agents(self):
+        for agent in (Subject(0), User(0)):
+            assert not hasattr(agent, '__dict__')
+
+    def test_counter(self):
+        assert not hasattr(Counter(), '__dict__')
+
+
 class TestSubjectTransaction:
     def test_init(self):
         t = STransaction(mockuser(0), 0)
@@ -423,6 +576,38 @@ class TestSubjectTransaction:
         t = STransaction(mockuser(0, (.25, .8)), 0)
         assert t.calculate(.12) - .024 / .244 < 1e-10
 
+    @patch('swap.config.log_odds', True)
+    def test_calculate_logodds(self):
+        t = STransaction(mockuser(0, (.25, .8)), 1)
+        assert t.calculate(.12) == pytest.approx(.096 / .756)
+        assert t.logodds == pytest.approx(math.log(.096 / .66))
+
+        t = STransaction(mockuser(0, (.25, .8)), 0)
+        assert t.calculate(.12) == pytest.approx(.024 / .244)
+
+    @patch('swap.config.log_odds', True)
+    def test_calculate_logodds_chains(self):
+        t0 = STransaction(mockuser(0, (.25, .8)), 1)
+        t1 = STransaction(mockuser(1, (.25, .8)), 1)
+        t1.left = t0
+
+        t0.calculate()
+        t1.calculate()
+
+        assert t1.get_prior_logodds() == t0.logodds
+        assert t1.logodds == pytest.approx(
+            math.log(.12 / .88) + 2 * math.log(.8 / .75))
+
+    @patch('swap.config.log_odds', True)
+    def test_calculate_logodds_saturated(self):
+        t = STransaction(mockuser(0, (1., 1.)), 1)
+        assert t.calculate(.12) == 1.
+        assert t.logodds == math.inf
+
+        t = STransaction(mockuser(0, (1., 0.)), 1)
+        t.calculate(.12)
+        assert t.score == pytest.approx(.12)
+
 
 class TestUserLedger:
 
@@ -532,6 +717,56 @@ class TestUserLedger:
 
         assert le.recalculate() == (0.5, 0.5)
 
+    @pytest.mark.parametrize('keep_history', [True, False])
+    def test_recalculate_batch(self, keep_history):
+        def build():
+            ledgers = []
+            for u in range(6):
+                le = ULedger(u)
+                for i in range(u * 3):
+                    subject = mocksubject(i, [-1, 0, 1][(i + u) % 3])
+                    le.add(UTransaction(subject, (i * u) % 2))
+                ledgers.append(le)
+            return ledgers
+
+        def change(ledgers):
+            # Gold labels change in and out of both labels
+            for le in ledgers:
+                for t in le:
+                    subject = mocksubject(t.id, [1, -1, 0][t.id % 3])
+                    le.notify_golds([subject])
+
+        with patch('swap.config.keep_history', keep_history):
+            a = build()
+            b = build()
+            for ledgers in (a, b):
+                ledgers.append(ULedger(len(ledgers)))
+
+            ULedger.recalculate_batch(a)
+            for le in b:
+                le.recalculate()
+            change(a)
+            change(b)
+            ULedger.recalculate_batch(a)
+            for le in b:
+                le.recalculate()
+
+        for la, lb in zip(a, b):
+            assert la.score == lb.score
+            assert (la.no.seen, la.no.matched, la.yes.seen, la.yes.matched) \
+                == (lb.no.seen, lb.no.matched, lb.yes.seen, lb.yes.matched)
+            assert la.changed == []
+            for t in la:
+                assert t.gold == lb.get(t.id).gold
+                assert t.score == lb.get(t.id).score
+
+    def test_recalculate_batch_empty(self):
+        le = ULedger(0)
+        ULedger.recalculate_batch([le])
+        ULedger.recalculate_batch([])
+
+        assert le.score == (0.5, 0.5)
+
     # def test_calculate(self):
     #     le = ULedger(0)
     #     le.no = 5
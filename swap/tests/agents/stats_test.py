@@ -3,10 +3,13 @@
 
 from swap.agents.agent import Stat
 from swap.agents.agent import MultiStat
+from swap.agents.agent import RunningStat
 # from swap.agents.agent import Stats
 from swap.agents.agent import Accuracy
 import statistics
+import random
 
+import pytest
 import unittest
 
 
@@ -69,6 +72,60 @@ class Test_Multistat:
         assert 1 in m.export()
 
 
+class Test_RunningStat:
+
+    def test_matches_stat(self):
+        r = random.Random(0)
+        data = [r.random() for _ in range(1001)]
+        running = RunningStat()
+        for x in data:
+            running.add(x)
+
+        stat = Stat(data)
+        assert running.mean == pytest.approx(stat.mean)
+        assert running.stdev == pytest.approx(stat.stdev)
+        assert running.median == pytest.approx(stat.median, abs=1 / 4096)
+
+    def test_remove(self):
+        r = random.Random(1)
+        data = [r.random() for _ in range(500)]
+        running = RunningStat()
+        for x in data:
+            running.add(x)
+
+        # Replace half the values
+        for i in range(0, 500, 2):
+            running.remove(data[i])
+            data[i] = r.random() ** 3
+            running.add(data[i])
+
+        stat = Stat(data)
+        assert len(running) == 500
+        assert running.mean == pytest.approx(stat.mean)
+        assert running.stdev == pytest.approx(stat.stdev)
+        assert running.median == pytest.approx(stat.median, abs=1 / 4096)
+
+    def test_remove_all(self):
+        running = RunningStat()
+        running.add(.3)
+        running.add(.5)
+        running.remove(.3)
+        running.remove(.5)
+
+        assert len(running) == 0
+        assert running.mean == 0
+        assert sum(running.counts) == 0
+
+    def test_bounds(self):
+        running = RunningStat(bins=10)
+        for x in (0., 1., 1.):
+            running.add(x)
+
+        assert running.counts[0] == 1
+        assert running.counts[-1] == 2
+        assert running.median == pytest.approx(1, abs=.1)
+
+
 class Test_Accuracy(unittest.TestCase):
 
     def test_add(self):
@@ -8,9 +8,14 @@ from swap.db import DB
 from swap.db.db import Collection
 from swap.db.classifications import Classifications
 from swap.utils.golds import GoldGetter
+from swap.swap import SWAP
+from swap.utils.classification import Classification
+from swap.utils.idset import IdSet
 
+import base64
 import json
 import os
+import numpy as np
 
 from unittest.mock import MagicMock, patch
 
@@ -133,3 +138,278 @@ class TestCaesarApp:
         api._is_recent_cl({'id': 1})
         assert api._is_recent_cl({'id': 1}) is True
         assert api._recent_cl == [1]
+
+
+class TestThreadedRetire:
+
+    @patch('swap.config.database.name', 'swapDBtest')
+    @patch('swap.config.thresholds', (.02, .6))
+    def test_on_retire(self):
+        swap = SWAP()
+        swap.set_gold_labels({i: i % 2 for i in range(40)})
+        for user in range(3):
+            for i in range(40):
+                swap.classify(Classification(user, i, i % 2))
+        list(swap.retired())
+
+        retired = []
+        thread = control.ThreadedControl(
+            swap, on_retire=lambda *args: retired.append(args))
+        for user in range(3):
+            swap.classify(Classification(user, 'a', 1))
+        thread.retire()
+
+        assert [id_ for id_, _, _ in retired] == ['a']
+        assert retired[0][1] == 2
+
+
+class TestThreadedScores:
+
+    @patch('swap.config.database.name', 'swapDBtest')
+    @patch('swap.utils.scores.ScoreExport.get_real_golds',
+           MagicMock(return_value={}))
+    def test_scores_without_lock(self):
+        swap = SWAP()
+        for user in range(3):
+            swap.classify(Classification(user, 'a', 1))
+
+        thread = control.ThreadedControl(swap)
+        with thread.control_lock:
+            scores = thread.view().score_export(new_golds=False)
+        assert scores.scores['a'].p == swap.subjects.get('a').score
+
+    @patch('swap.config.database.name', 'swapDBtest')
+    def test_classify_publishes(self):
+        swap = SWAP()
+        thread = control.ThreadedControl(swap)
+        thread.control.classify_batch = lambda data: [
+            swap.classify(cl) or swap.subjects.get(cl.subject)
+            for cl in data]
+        before = swap.view()
+
+        message = MagicMock(data=Classification(0, 'a', 1))
+        thread.classify(message)
+
+        assert before.get('a') is None
+        assert swap.view().get('a') == (swap.subjects.get('a').score, None)
+        message.callback.assert_called_once()
+
+
+def raw_classification(id_, subject=10532146, user=1437100, value=1):
+    data = dict(_json)
+    data.update({'id': str(id_), 'subject_id': subject, 'user_id': user,
+                 'annotations': {'T1': [{'task': 'T1', 'value': value}]}})
+    return data
+
+
+@patch('swap.config.back_update', False)
+@patch('swap.config.database.name', 'swapDBtest')
+@patch('swap.config.parser.annotation.task', 'T1')
+@patch('swap.config.parser.annotation.true', [1])
+@patch('swap.config.parser.annotation.false', [0])
+class TestBatch:
+
+    @patch.object(Classifications, 'insert_many')
+    @patch.object(Classifications, 'existing')
+    def test_control_classify_batch(self, existing, insert_many):
+        existing.side_effect = lambda ids: {2} & set(ids)
+        DB._reset()
+        oc = control.OnlineControl()
+        oc.setSWAP(SWAP())
+
+        raw = [raw_classification(1), raw_classification(2),
+               raw_classification(3, subject=5), raw_classification(1)]
+        subjects = oc.classify_batch(raw)
+
+        assert [s is not None for s in subjects] == \
+            [True, False, True, False]
+        assert subjects[0].raw_id == 10532146
+        assert subjects[2].raw_id == 5
+        assert len(oc.swap.users.get(1437100).ledger) == 2
+
+        insert_many.assert_called_once()
+        stored = insert_many.call_args[0][0]
+        assert [item['classification_id'] for item in stored] == [1, 3]
+
+    @patch('swap.config.online_swap.batch.size', 3)
+    @patch('swap.config.online_swap.batch.wait', 0)
+    def test_next_batch(self):
+        thread = control.ThreadedControl(SWAP())
+        for i in range(5):
+            thread.queue('classify', i)
+
+        assert [m.data for m in thread.next_batch()] == [0, 1, 2]
+        assert [m.data for m in thread.next_batch()] == [3, 4]
+        assert thread.metrics()['max_queue_depth'] == 5
+
+    def test_one_response_per_subject(self):
+        swap = SWAP()
+        thread = control.ThreadedControl(swap)
+
+        def classify_batch(data):
+            subjects = []
+            for id_, subject in data:
+                if id_ == 'dup':
+                    subjects.append(None)
+                    continue
+                swap.classify(Classification(id_, subject, 1))
+                subjects.append(swap.subjects.get(subject))
+            return subjects
+        thread.control.classify_batch = classify_batch
+
+        responses = []
+        messages = [control.Message('classify', data, responses.append)
+                    for data in [(0, 'a'), (1, 'b'), (2, 'a'), ('dup', 'a')]]
+        thread.classify_batch(messages)
+
+        assert [s.raw_id for s in responses] == ['b', 'a']
+        assert responses[1].score == swap.subjects.get('a').score
+
+        metrics = thread.metrics()
+        assert metrics['batches'] == 1
+        assert metrics['classifications'] == 4
+        assert metrics['duplicates'] == 1
+        assert metrics['responses'] == 2
+        assert metrics['queue_depth'] == 0
+
+
+@patch('swap.config.back_update', False)
+@patch('swap.config.database.name', 'swapDBtest')
+@patch('swap.config.parser.annotation.task', 'T1')
+@patch('swap.config.parser.annotation.true', [1])
+@patch('swap.config.parser.annotation.false', [0])
+class TestSeen:
+
+    @patch.object(Classifications, 'insert_many', MagicMock())
+    @patch.object(Classifications, 'existing')
+    def test_classify_batch_uses_index(self, existing):
+        DB._reset()
+        oc = control.OnlineControl()
+        oc.setSWAP(SWAP())
+        oc.seen = IdSet([2])
+
+        subjects = oc.classify_batch(
+            [raw_classification(1), raw_classification(2),
+             raw_classification(1)])
+
+        assert [s is not None for s in subjects] == [True, False, False]
+        assert 1 in oc.seen
+        existing.assert_not_called()
+
+    @patch.object(Classifications, 'insert_many')
+    @patch.object(Classifications, 'exists')
+    def test_classify_uses_index(self, exists, insert_many):
+        DB._reset()
+        oc = control.OnlineControl()
+        oc.setSWAP(SWAP())
+        oc.seen = IdSet()
+
+        assert oc.classify(raw_classification(7)) is not None
+        assert oc.classify(raw_classification(7)) is None
+        exists.assert_not_called()
+
+        insert_many.assert_called_once()
+        stored = insert_many.call_args[0][0]
+        assert [item['classification_id'] for item in stored] == [7]
+
+    @patch.object(Classifications, 'ids')
+    def test_load_seen(self, ids):
+        ids.side_effect = [np.array([1, 2]), np.array([5])]
+        oc = control.OnlineControl()
+        oc.load_seen()
+
+        assert len(oc.seen) == 3
+        assert 5 in oc.seen
+
+    def test_api_checks_index(self):
+        thread = control.ThreadedControl(SWAP())
+        thread.control.seen = IdSet([60910323])
+        api = app.API(thread)
+
+        assert api._is_recent_cl({'id': '60910323'}) is True
+        assert api._is_recent_cl({'id': '60910324'}) is False
+        assert api._is_recent_cl({'id': '60910324'}) is True
+        assert api._recent_cl == ['60910324']
+
+
+@patch('swap.config.back_update', False)
+@patch('swap.config.database.name', 'swapDBtest')
+@patch('swap.config.online_swap._auth_username', 'caesar')
+@patch('swap.config.online_swap._auth_key', 'TEST')
+class TestScoresEndpoint:
+
+    auth = {'Authorization': 'Basic ' +
+            base64.b64encode(b'caesar:TEST').decode()}
+
+    def setup(self):
+        swap = SWAP()
+        swap.set_gold_labels({'a': 1})
+        for user in range(3):
+            swap.classify(Classification(user, 'a', 1))
+            swap.classify(Classification(user, 'b', 0))
+
+        thread = control.ThreadedControl(swap)
+        api = app.API(thread)
+        return swap, api.app.test_client()
+
+    def get(self, client, query='', headers=None):
+        headers = dict(self.auth, **(headers or {}))
+        return client.get('/scores' + query, headers=headers)
+
+    def test_full(self):
+        swap, client = self.setup()
+        r = self.get(client)
+
+        assert r.status_code == 200
+        data = r.get_json()
+        assert set(data) == {'a', 'b'}
+        assert data['a'] == {'id': 'a', 'gold': 1, 'retired': None,
+                             'p': swap.subjects.get('a').score}
+        assert r.headers['X-Sequence'] == '1'
+
+    def test_not_modified(self):
+        _, client = self.setup()
+        etag = self.get(client).headers['ETag']
+
+        r = self.get(client, headers={'If-None-Match': etag})
+        assert r.status_code == 304
+        assert r.data == b''
+
+    def test_since(self):
+        swap, client = self.setup()
+        sequence = self.get(client).headers['X-Sequence']
+
+        swap.classify(Classification(5, 'c', 1))
+        swap.set_gold_labels({'a': 1, 'b': 0})
+        swap.publish()
+
+        r = self.get(client, '?since=%s' % sequence)
+        data = r.get_json()
+        assert data['total'] == 2
+        assert [s['id'] for s in data['scores']] == ['b', 'c']
+        assert data['sequence'] > int(sequence)
+
+        r = self.get(client, '?since=%d' % data['sequence'])
+        assert r.get_json()['scores'] == []
+
+    def test_pages(self):
+        _, client = self.setup()
+
+        first = self.get(client, '?limit=1').get_json()
+        second = self.get(client, '?offset=1&limit=1').get_json()
+        assert first['total'] == 2
+        assert [s['id'] for s in first['scores']] == ['a']
+        assert [s['id'] for s in second['scores']] == ['b']
+        assert second['offset'] == 1
+
+    def test_json_lines(self):
+        _, client = self.setup()
+        r = self.get(client, '?format=jsonl')
+
+        assert r.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in r.data.splitlines()]
+        assert [line['id'] for line in lines] == ['a', 'b']
+
+    def test_needs_auth(self):
+        _, client = self.setup()
+        assert client.get('/scores').status_code == 401
@@ -0,0 +1,185 @@
+from swap.caesar.utils.dispatcher import Dispatcher
+from swap.caesar.utils.requests import Requests
+
+import importlib.util
+import os
+import threading
+import time
+
+from unittest.mock import MagicMock, patch
+import pytest
+
+# pylint: disable=R0201
+
+path = os.path.dirname(__file__)
+path = os.path.join(path, '../../tools/fake-caesar.py')
+spec = importlib.util.spec_from_file_location('fake_caesar', path)
+fake_caesar = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fake_caesar)
+
+
+def subject(id_, score):
+    return MagicMock(raw_id=id_, score=score)
+
+
+@pytest.fixture
+def caesar():
+    server = fake_caesar.FakeCaesar('localhost', 0, verbose=False)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def auth():
+    return {'Authorization': 'Bearer token'}
+
+
+@patch('swap.config.online_swap.caesar.field', 'swap_score')
+class TestDispatcher:
+
+    def test_sends(self, caesar):
+        dispatcher = Dispatcher(caesar.address, workers=2, auth=auth)
+        for i in range(10):
+            dispatcher.submit(subject(i, i / 10))
+        dispatcher.join()
+        dispatcher.stop()
+
+        bodies = [body for _, _, _, body in caesar.requests]
+        assert sorted(b['reduction']['subject_id'] for b in bodies) == \
+            list(range(10))
+        assert bodies[0] == Requests.reduction(
+            subject(bodies[0]['reduction']['subject_id'],
+                    bodies[0]['reduction']['data']['swap_score']))
+
+        for method, path, headers, _ in caesar.requests:
+            assert method == 'PUT'
+            assert path == '/reductions'
+            assert headers['Authorization'] == 'Bearer token'
+
+        assert dispatcher.metrics() == \
+            {'sent': 10, 'failed': 0, 'retries': 0, 'coalesced': 0,
+             'pending': 0, 'buffered': 0}
+
+    def test_body_built_on_submit(self, caesar):
+        dispatcher = Dispatcher(caesar.address, workers=1, auth=auth)
+        s = subject(1, .2)
+        dispatcher.submit(s)
+        s.score = .9
+        dispatcher.join()
+
+        body = caesar.requests[0][3]
+        assert body['reduction']['data']['swap_score'] == .2
+
+    def test_auth_cached(self, caesar):
+        mock = MagicMock(side_effect=auth)
+        dispatcher = Dispatcher(caesar.address, workers=2, auth=mock)
+        for i in range(5):
+            dispatcher.submit(subject(i, .5))
+        dispatcher.join()
+
+        assert mock.call_count == 1
+
+    def test_retry(self, caesar):
+        caesar.fail = 2
+        dispatcher = Dispatcher(caesar.address, workers=1, retries=3,
+                                backoff=.01, auth=auth)
+        dispatcher.submit(subject(1, .5))
+        dispatcher.join()
+
+        assert len(caesar.requests) == 1
+        assert dispatcher.metrics()['retries'] == 2
+        assert dispatcher.metrics()['sent'] == 1
+
+    def test_drop_after_retries(self, caesar):
+        caesar.fail = 10
+        dispatcher = Dispatcher(caesar.address, workers=1, retries=2,
+                                backoff=.01, auth=auth)
+        dispatcher.submit(subject(1, .5))
+        dispatcher.join()
+
+        assert len(caesar.requests) == 0
+        assert dispatcher.metrics()['failed'] == 1
+        assert caesar.failed == 3
+
+    def test_no_retry_bad_request(self, caesar):
+        caesar.fail = 10
+        caesar.fail_status = 400
+        dispatcher = Dispatcher(caesar.address, workers=1, retries=3,
+                                backoff=.01, auth=auth)
+        dispatcher.submit(subject(1, .5))
+        dispatcher.join()
+
+        assert caesar.failed == 1
+        assert dispatcher.metrics()['failed'] == 1
+
+    def test_refresh_auth(self, caesar):
+        caesar.fail = 1
+        caesar.fail_status = 401
+        mock = MagicMock(side_effect=auth)
+        dispatcher = Dispatcher(caesar.address, workers=1, retries=1,
+                                backoff=.01, auth=mock)
+        dispatcher.submit(subject(1, .5))
+        dispatcher.join()
+
+        assert mock.call_count == 2
+        assert dispatcher.metrics()['sent'] == 1
+
+    def test_submit_does_not_wait(self, caesar):
+        release = threading.Event()
+        send = Dispatcher.send
+
+        def slow(self, body):
+            release.wait(5)
+            return send(self, body)
+
+        dispatcher = Dispatcher(caesar.address, workers=2, auth=auth)
+        with patch.object(Dispatcher, 'send', slow):
+            start = time.monotonic()
+            for i in range(20):
+                dispatcher.submit(subject(i, .5))
+            assert time.monotonic() - start < 1
+            metrics = dispatcher.metrics()
+            assert metrics['pending'] + metrics['buffered'] == 20
+
+            release.set()
+            dispatcher.join()
+
+        assert len(caesar.requests) == 20
+
+    def test_coalesce(self, caesar):
+        dispatcher = Dispatcher(caesar.address, workers=2, interval=10,
+                                auth=auth)
+        for i in range(30):
+            dispatcher.submit(subject(i % 3, i / 100))
+
+        assert dispatcher.metrics()['buffered'] == 3
+        assert dispatcher.metrics()['coalesced'] == 27
+        dispatcher.join()
+
+        scores = {body['reduction']['subject_id']:
+                  body['reduction']['data']['swap_score']
+                  for _, _, _, body in caesar.requests}
+        assert len(caesar.requests) == 3
+        assert scores == {0: .27, 1: .28, 2: .29}
+
+    def test_flush_interval(self, caesar):
+        dispatcher = Dispatcher(caesar.address, workers=1, interval=.01,
+                                auth=auth)
+        dispatcher.submit(subject(1, .5))
+
+        for _ in range(200):
+            if len(caesar.requests) > 0:
+                break
+            time.sleep(.01)
+        assert len(caesar.requests) == 1
+
+    def test_no_interval(self, caesar):
+        dispatcher = Dispatcher(caesar.address, workers=1, interval=0,
+                                auth=auth)
+        for i in range(4):
+            dispatcher.submit(subject(1, i / 10))
+        assert dispatcher.metrics()['buffered'] == 0
+        dispatcher.join()
+
+        assert len(caesar.requests) == 4
@@ -0,0 +1,226 @@
+################################################################
+# Test functions for the online write-ahead log
+
+from swap.swap import SWAP
+from swap.caesar.wal import WriteAheadLog
+import swap.caesar.control as control
+from swap.utils.classification import Classification
+from swap.utils.golds import GoldGetter
+from swap.db.classifications import Classifications
+from swap.utils.idset import IdSet
+import swap.utils.snapshot as snapshot
+
+from unittest.mock import patch
+import numpy as np
+import os
+import pytest
+
+# pylint: disable=R0201
+
+
+def raw(i):
+    user = i % 7
+    return {'classification_id': i, 'user_id': user if i % 3 else None,
+            'session_id': 'session-%d' % user, 'subject_id': i % 13,
+            'annotation': int(i % 4 == 0)}
+
+
+def classify(swap, wal, start, stop):
+    checkpoints = 0
+    for i in range(start, stop):
+        swap.classify(Classification.generate(raw(i)))
+        if wal.append(raw(i)):
+            wal.checkpoint(swap)
+            checkpoints += 1
+    return checkpoints
+
+
+def assert_same(a, b):
+    assert a.golds == b.golds
+    for subject in a.subjects:
+        other = b.subjects.get(subject.raw_id, False)
+        assert other.score == pytest.approx(subject.score)
+        assert other.ledger.history() == \
+            pytest.approx(subject.ledger.history())
+
+
+class TestWriteAheadLog:
+
+    def test_recover(self, tmpdir):
+        wal = WriteAheadLog(str(tmpdir), checkpoint_every=40)
+        swap = SWAP()
+        swap.set_gold_labels({0: 1, 1: 0})
+        wal.checkpoint(swap)
+
+        assert classify(swap, wal, 0, 100) == 2
+        wal.close()
+
+        other = WriteAheadLog(str(tmpdir), checkpoint_every=40)
+        recovered = other.recover()
+        assert other.seq == 100
+        assert other.last_checkpoint == 80
+        assert_same(swap, recovered)
+
+        # Logging continues after recovery
+        classify(swap, other, 100, 130)
+        classify(recovered, other, 100, 130)
+        other.close()
+
+        again = WriteAheadLog(str(tmpdir)).recover()
+        assert_same(swap, again)
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    def test_write_after_changes(self, tmpdir, engine):
+        wal = WriteAheadLog(str(tmpdir))
+        swap = SWAP(engine)
+        wal.checkpoint(swap)
+        classify(swap, wal, 0, 5)
+
+        pending = wal.begin_checkpoint(swap)
+        # Changes after the copy only reach the new log segment
+        classify(swap, wal, 5, 12)
+        wal.write_checkpoint(pending)
+        wal.close()
+
+        assert wal.checkpoints() == [0, 5]
+        path = os.path.join(str(tmpdir), 'checkpoint-5')
+        assert snapshot.Snapshot(path).manifest['classifications'] == 5
+
+        recovered = WriteAheadLog(str(tmpdir)).recover()
+        assert len(recovered.subjects) == len(swap.subjects)
+        for subject in swap.subjects:
+            other = recovered.subjects.get(subject.raw_id, False)
+            assert other.score == pytest.approx(subject.score)
+
+    def test_no_checkpoint(self, tmpdir):
+        assert WriteAheadLog(str(tmpdir)).recover() is None
+
+    def test_prune(self, tmpdir):
+        wal = WriteAheadLog(str(tmpdir), checkpoint_every=10, keep=2)
+        swap = SWAP()
+        wal.checkpoint(swap)
+        classify(swap, wal, 0, 45)
+
+        assert wal.checkpoints() == [30, 40]
+        assert wal.segments() == [30, 40]
+
+    def test_partial_record(self, tmpdir):
+        wal = WriteAheadLog(str(tmpdir))
+        swap = SWAP()
+        wal.checkpoint(swap)
+        classify(swap, wal, 0, 10)
+        wal.close()
+
+        # Crash in the middle of writing a record
+        with open(os.path.join(str(tmpdir), 'wal-0.jsonl'), 'a') as file:
+            file.write('{"seq": 11, "user_')
+
+        other = WriteAheadLog(str(tmpdir))
+        recovered = other.recover()
+        assert other.seq == 10
+        assert_same(swap, recovered)
+
+        classify(swap, other, 10, 20)
+        other.close()
+        assert_same(swap, WriteAheadLog(str(tmpdir)).recover())
+
+    def test_incomplete_checkpoint_ignored(self, tmpdir):
+        wal = WriteAheadLog(str(tmpdir))
+        wal.checkpoint(SWAP())
+        os.makedirs(os.path.join(str(tmpdir), 'checkpoint-50'))
+
+        assert wal.checkpoints() == [0]
+
+
+class TestOnlineRecover:
+
+    @patch.object(GoldGetter, 'golds', {0: 0, 5: 1})
+    @patch('swap.config.database.name', 'swapDBtest')
+    def test_recover_applies_golds(self, tmpdir):
+        with patch('swap.config.online_swap.wal.directory', str(tmpdir)):
+            oc = control.OnlineControl()
+        assert oc.recover() is False
+
+        swap = SWAP()
+        swap.set_gold_labels({0: 1})
+        oc.wal.checkpoint(swap)
+        classify(swap, oc.wal, 0, 20)
+        oc.wal.close()
+
+        with patch('swap.config.online_swap.wal.directory', str(tmpdir)):
+            oc = control.OnlineControl()
+        assert oc.recover() is True
+        assert oc.swap.golds == {0: 0, 5: 1}
+        assert len(oc.swap.subjects) == len(swap.subjects)
+
+
+class Crash(Exception):
+    pass
+
+
+@patch('swap.config.database.name', 'swapDBtest')
+@patch('swap.config.back_update', False)
+@patch.object(GoldGetter, 'golds', {})
+class TestWriteAhead:
+
+    def control(self, tmpdir):
+        with patch('swap.config.online_swap.wal.directory', str(tmpdir)):
+            oc = control.OnlineControl()
+        oc.parse_raw = dict
+        return oc
+
+    def crash(self, tmpdir, method, raws):
+        oc = self.control(tmpdir)
+        oc.setSWAP(SWAP())
+        oc.seen = IdSet()
+        oc.checkpoint()
+
+        # Crash after the log append, before anything else
+        with patch.object(Classifications, 'insert', side_effect=Crash), \
+                patch.object(Classifications, 'insert_many',
+                             side_effect=Crash), \
+                pytest.raises(Crash):
+            getattr(oc, method)(raws)
+        oc.wal.close()
+
+        assert len(oc.swap.subjects) == 0
+
+        oc = self.control(tmpdir)
+        assert oc.recover() is True
+        return oc
+
+    def test_classify(self, tmpdir):
+        oc = self.crash(tmpdir, 'classify', raw(1))
+
+        subject = oc.swap.subjects.get(raw(1)['subject_id'], False)
+        assert subject is not None
+        assert len(subject.ledger) == 1
+
+    def test_classify_batch_checkpoint(self, tmpdir):
+        with patch('swap.config.online_swap.wal.checkpoint_every', 2):
+            oc = self.control(tmpdir)
+        oc.setSWAP(SWAP())
+        oc.seen = IdSet()
+        oc.checkpoint()
+
+        with patch.object(Classifications, 'insert_many'):
+            oc.classify_batch([raw(1), raw(2), raw(3)])
+        # Only copied, the caller writes it outside its lock
+        assert oc.wal.checkpoints() == [0]
+
+        oc.write_checkpoint()
+        assert oc.wal.checkpoints() == [0, 3]
+
+    def test_classify_batch(self, tmpdir):
+        oc = self.crash(tmpdir, 'classify_batch', [raw(1), raw(2), raw(3)])
+
+        for i in [1, 2, 3]:
+            subject = oc.swap.subjects.get(raw(i)['subject_id'], False)
+            assert subject is not None
+
+        # Recovered classifications are not accepted again, even
+        # though they never reached the database
+        with patch.object(Classifications, 'ids',
+                          return_value=np.array([], dtype=np.int64)):
+            oc.load_seen()
+        assert oc.seen.existing([1, 2, 3, 4]) == {1, 2, 3}
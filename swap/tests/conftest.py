@@ -0,0 +1,8 @@
+################################################################
+# Shared pytest setup
+
+"""
+    pytest puts this directory on sys.path when it loads this file,
+    so test modules in subdirectories can import the shared helpers
+    of factory.py
+"""
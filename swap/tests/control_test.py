@@ -9,6 +9,7 @@ from swap.control import Control
 from swap.utils.golds import GoldGetter
 
 from unittest.mock import MagicMock, patch
+import multiprocessing
 import pytest
 
 # pylint: disable=R0201
@@ -42,6 +43,75 @@ class TestControl:
         mock.assert_called_with()
 
 
+    @patch('swap.config.back_update', True)
+    @patch('swap.config.batch_update', False)
+    def test_replay_matches_serial(self):
+        from swap.swap import SWAP
+        from swap.utils.classification import Classification
+
+        data = [Classification(i % 9, (i * 7) % 23, int(i % 4 == 0))
+                for i in range(300)]
+        # Components of anonymous one-off sessions
+        data += [Classification('not-logged-in-%d' % i, 100 + i, 1)
+                 for i in range(20)]
+        golds = {0: 1, 1: 0, 100: 1, 500: 0}
+
+        serial = SWAP()
+        serial.set_gold_labels(golds)
+        for cl in data:
+            serial.classify(cl)
+        serial.process_changes()
+
+        c = Control()
+        c.gold_getter.getters = [lambda: golds]
+        # Workers inherit config by forking, whatever the default
+        with patch('multiprocessing.get_context',
+                   wraps=multiprocessing.get_context) as context:
+            swap = c.replay(data, 3)
+        context.assert_called_once_with('fork')
+
+        assert swap.golds == golds
+        assert len(swap.subjects) == len(serial.subjects)
+        for subject in serial.subjects:
+            other = swap.subjects.get(subject.raw_id, False)
+            assert other.score == pytest.approx(subject.score)
+
+    @patch('swap.config.back_update', True)
+    @patch('swap.config.batch_update', True)
+    @patch('swap.config.engine', 'agents')
+    @patch('swap.config.control.processes', 3)
+    def test_run_replay_not_recalculated(self):
+        from swap.swap import SWAP
+        from swap.utils.classification import Classification
+        import swap.engine.static as static
+
+        data = [{'classification_id': i, 'user_id': i % 9,
+                 'session_id': None, 'subject_id': (i * 7) % 23,
+                 'annotation': int(i % 4 == 0)} for i in range(300)]
+        golds = {0: 1, 1: 0, 5: 1}
+
+        serial = SWAP()
+        serial.set_gold_labels(golds)
+        for cl in data:
+            serial.classify(Classification.generate(cl))
+        serial.process_changes()
+
+        c = Control()
+        c.gold_getter.getters = [lambda: golds]
+        c.get_classifications = lambda: iter(data)
+
+        # Workers are forked with the patch, so only calls in this
+        # process are counted
+        with patch.object(static, 'process_agents',
+                          wraps=static.process_agents) as process:
+            c.run(amount=len(data))
+        process.assert_not_called()
+
+        for subject in serial.subjects:
+            other = c.swap.subjects.get(subject.raw_id, False)
+            assert other.score == pytest.approx(subject.score)
+
+
 # def test_classifications_projection():
 #     q = Query()
 #     q.fields(['user_id', 'classification_id'])
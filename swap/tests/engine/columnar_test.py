@@ -0,0 +1,171 @@
+################################################################
+# Test functions for the columnar SWAP engine
+
+from swap.swap import SWAP
+from swap.engine.columnar import ColumnarSWAP, Column, segments, calculate
+from swap.engine.static import segment_cumsum
+from swap.utils.classification import Classification
+import swap.config as config
+from factory import classifications, golds, run, degenerate, \
+    degenerate_golds
+
+from unittest.mock import patch
+import numpy as np
+import pickle
+import pytest
+
+# pylint: disable=R0201
+
+
+def compare(a, b):
+    assert len(a.subjects) == len(b.subjects)
+    for subject in a.subjects:
+        id_ = a.subjects.raw_id(subject.id)
+        other = b.subjects.get(id_, make_new=False)
+        assert subject.gold == other.gold
+        if len(subject.ledger) > 0:
+            assert subject.score == pytest.approx(other.score, abs=1e-12)
+
+    for user in a.users:
+        other = b.users.get(a.users.raw_id(user.id), make_new=False)
+        assert user.score == pytest.approx(other.score)
+
+    ha = a.history_export()
+    hb = b.history_export()
+    for id_, _, scores in ha:
+        assert hb.get(id_).scores == pytest.approx(scores, abs=1e-12)
+
+
+class TestColumn:
+
+    def test_append_grows(self):
+        c = Column(np.int32, capacity=2)
+        for i in range(10):
+            assert c.append(i) == i
+
+        assert len(c) == 10
+        assert c.array.tolist() == list(range(10))
+
+    def test_setitem(self):
+        c = Column(np.float64)
+        c.append(1)
+        c[0] = .5
+        assert c[0] == .5
+
+
+class TestSegments:
+
+    def test_order(self):
+        keys = np.array([2, 0, 2, 1, 0])
+        order, starts, counts = segments(keys, 4)
+
+        assert counts.tolist() == [2, 1, 2, 0]
+        assert starts.tolist() == [0, 2, 3, 5]
+        assert order.tolist() == [1, 4, 3, 0, 2]
+
+    def test_cumsum(self):
+        keys = np.array([2, 0, 2, 1, 0])
+        values = np.array([1., 2., 3., 4., 5.])
+        sums, (_, _, counts) = segment_cumsum(values, keys, 4)
+
+        assert sums.tolist() == [1, 2, 4, 4, 7]
+        assert counts.tolist() == [2, 1, 2, 0]
+
+
+class TestColumnarSWAP:
+
+    def test_engine_select(self):
+        assert type(SWAP(engine='columnar')) is ColumnarSWAP
+        assert type(SWAP(engine='agents')) is SWAP
+
+    @patch('swap.config.engine', 'columnar')
+    def test_engine_config(self):
+        assert type(SWAP()) is ColumnarSWAP
+
+    def test_engine_invalid(self):
+        with pytest.raises(ValueError):
+            SWAP(engine='other')
+
+    @patch('swap.config.back_update', False)
+    def test_dynamic_matches_agents(self):
+        data = classifications()
+        a = run(SWAP(), data, golds(seed=2), process=False)
+        b = run(SWAP(engine='columnar'), data, golds(seed=2), process=False)
+
+        compare(a, b)
+
+    @patch('swap.config.back_update', True)
+    def test_static_matches_agents(self):
+        data = classifications()
+        a = run(SWAP(), data, golds(seed=2))
+        b = run(SWAP(engine='columnar'), data, golds(seed=2))
+
+        compare(a, b)
+
+    @patch('swap.config.back_update', False)
+    def test_gold_change_matches_agents(self):
+        data = classifications()
+        a = run(SWAP(), data[:1000], golds(seed=2), process=False)
+        b = run(SWAP(engine='columnar'), data[:1000], golds(seed=2),
+                process=False)
+
+        for swap in (a, b):
+            swap.set_gold_labels(golds(seed=3))
+            for cl in data[1000:]:
+                swap.classify(cl)
+            swap.process_changes()
+
+        compare(a, b)
+
+    @patch('swap.config.back_update', True)
+    @patch('swap.config.gamma', 0)
+    def test_degenerate(self):
+        # The agents divide by zero without gamma, compare with
+        # calculate one classification at a time instead
+        data = degenerate()
+        swap = run(SWAP(engine='columnar'), data, degenerate_golds())
+
+        for id_, _, scores in swap.history_export():
+            prior = config.p0
+            for i, cl in enumerate(cl for cl in data if cl.subject == id_):
+                user = swap._user(cl.user, make_new=False)
+                prior = calculate(prior, cl.annotation,
+                                  *swap._user_score(user))
+                assert scores[i + 1] == pytest.approx(prior, abs=1e-12)
+
+        assert swap.subjects.get(2).score == 1
+        assert swap.subjects.get(3).score == 0
+        assert swap.subjects.get(4).score == pytest.approx(config.p0)
+        assert 0 < swap.subjects.get(5).score < 1
+
+    def test_duplicate_ignored(self):
+        swap = SWAP(engine='columnar')
+        swap.classify(Classification(0, 1, 1))
+        swap.classify(Classification(0, 1, 0))
+
+        assert len(swap) == 1
+
+    def test_duplicate_ignored_after_pickle(self):
+        swap = SWAP(engine='columnar')
+        swap.classify(Classification(0, 1, 1))
+        swap = pickle.loads(pickle.dumps(swap))
+        swap.classify(Classification(0, 1, 0))
+        swap.classify(Classification(1, 1, 0))
+
+        assert len(swap) == 2
+
+    def test_golds(self):
+        swap = SWAP(engine='columnar')
+        labels = {0: 1, 1: 1, 2: 0, 3: 0}
+        swap.set_gold_labels(labels)
+        assert swap.golds == labels
+
+        swap.set_gold_labels({1: 0})
+        assert swap.golds == {1: 0}
+
+    def test_stats(self):
+        swap = run(SWAP(engine='columnar'), classifications(), golds(seed=2))
+
+        assert 'user' in swap.stats.stats
+        assert 'subject' in swap.stats.stats
+        swap.manifest()
@@ -0,0 +1,161 @@
+################################################################
+# Test functions for the multi-class SWAP engine
+
+from swap.swap import SWAP
+from swap.engine.multiclass import MultiClassSWAP, priors, interesting
+from swap.utils.classification import Classification
+import swap.utils.snapshot as snapshot
+import factory
+
+from unittest.mock import patch
+import numpy as np
+import pytest
+
+# pylint: disable=R0201
+
+
+def classifications(n=3000, classes=2, seed=1):
+    """
+    Users give the true class, subject % classes, 70% of the time
+    """
+    return factory.classifications(n, subjects=200, classes=classes,
+                                   accuracy=.7, seed=seed)
+
+
+def golds(classes=2):
+    return factory.golds(200, every=5, classes=classes)
+
+
+class TestMultiClassSWAP:
+
+    def test_engine_select(self):
+        assert type(SWAP(engine='multiclass')) is MultiClassSWAP
+
+    def test_priors(self):
+        with patch('swap.config.p0', .2):
+            assert priors(2).tolist() == [.8, .2]
+            assert priors(5) == pytest.approx([.8, .05, .05, .05, .05])
+            assert interesting(priors(5)) == pytest.approx(.2)
+
+    @pytest.mark.parametrize('back_update', [True, False])
+    def test_binary_matches_columnar(self, back_update):
+        data = classifications()
+        with patch('swap.config.back_update', back_update):
+            a = factory.run(SWAP('columnar'), data, golds())
+            b = factory.run(SWAP('multiclass'), data, golds())
+
+        assert b._subject_score.array == \
+            pytest.approx(a._subject_score.array, abs=1e-12)
+        assert b._subject_posterior.array[:, 1] == \
+            pytest.approx(a._subject_score.array, abs=1e-12)
+
+        for user in a.users:
+            u0, u1 = user.score
+            confusion = b.users.agent(user.id).score
+            assert confusion[0, 0] == pytest.approx(u0)
+            assert confusion[1, 1] == pytest.approx(u1)
+
+        ha = a.history_export()
+        hb = b.history_export()
+        assert hb.scores.values == pytest.approx(ha.scores.values, abs=1e-12)
+
+    @patch('swap.config.gamma', 0)
+    def test_degenerate_matches_columnar(self):
+        data = factory.degenerate()
+        with patch('swap.config.back_update', True):
+            a = factory.run(SWAP('columnar'), data, factory.degenerate_golds())
+            b = factory.run(SWAP('multiclass'), data,
+                            factory.degenerate_golds())
+
+        assert not np.isnan(b._cl_posterior.array).any()
+        assert b._subject_posterior.array[:, 1] == \
+            pytest.approx(a._subject_score.array, abs=1e-12)
+        assert b._cl_score.array == \
+            pytest.approx(a._cl_score.array, abs=1e-12)
+
+    @patch('swap.config.classes', 4)
+    @pytest.mark.parametrize('back_update', [True, False])
+    def test_finds_classes(self, back_update):
+        data = classifications(n=4000, classes=4)
+        with patch('swap.config.back_update', back_update):
+            swap = factory.run(SWAP('multiclass'), data, golds(classes=4))
+
+        posteriors = swap.posterior_export()
+        assert len(posteriors) == len(swap.subjects)
+
+        correct = [np.argmax(p) == id_ % 4 for id_, p in posteriors.items()]
+        assert np.mean(correct) > .8
+        for p in posteriors.values():
+            assert p.sum() == pytest.approx(1)
+
+        stats = swap.users.stats()
+        assert sorted(stats.stats) == [0, 1, 2, 3]
+
+    @patch('swap.config.classes', 3)
+    def test_online_matches_batch(self):
+        data = classifications(n=500, classes=3)
+        with patch('swap.config.back_update', False):
+            online = SWAP('multiclass')
+            for cl in data:
+                online.classify(cl)
+
+        with patch('swap.config.back_update', True):
+            batch = factory.run(SWAP('multiclass'), data, {})
+
+        # Without gold labels the user confusion matrices stay uniform,
+        # so both orders give the same posteriors
+        assert online._subject_posterior.array == \
+            pytest.approx(batch._subject_posterior.array)
+        assert online._cl_posterior.array == \
+            pytest.approx(batch._cl_posterior.array)
+
+    @patch('swap.config.classes', 3)
+    def test_gold_change(self):
+        data = classifications(n=1000, classes=3)
+        with patch('swap.config.back_update', True):
+            swap = factory.run(SWAP('multiclass'), data, golds(classes=3))
+            swap.set_gold_labels({0: 1, 4: 2})
+            swap.process_changes()
+            fresh = factory.run(SWAP('multiclass'), data, {0: 1, 4: 2})
+
+        assert swap._user_confusion.array.tolist() == \
+            fresh._user_confusion.array.tolist()
+        for subject in swap.subjects:
+            if len(subject.ledger) == 0:
+                continue
+            other = fresh.subjects.get(subject.raw_id, make_new=False)
+            assert subject.gold == other.gold
+            assert subject.score == pytest.approx(other.score)
+
+    @patch('swap.config.classes', 3)
+    def test_invalid_annotation(self):
+        swap = SWAP('multiclass')
+        with pytest.raises(ValueError):
+            swap.classify(Classification(0, 0, 3))
+        assert len(swap) == 0
+
+    @patch('swap.config.classes', 3)
+    def test_snapshot(self, tmpdir):
+        path = str(tmpdir.join('run.swap'))
+        data = classifications(n=500, classes=3)
+        with patch('swap.config.back_update', True):
+            swap = factory.run(SWAP('multiclass'), data, golds(classes=3))
+            snapshot.save(swap, path)
+
+            with patch('swap.config.classes', 2):
+                loaded = snapshot.load(path)
+
+            assert type(loaded) is MultiClassSWAP
+            assert loaded.classes == 3
+            assert loaded._subject_posterior.array == \
+                pytest.approx(swap._subject_posterior.array)
+
+            more = classifications(n=100, classes=3, seed=5)
+            for cl in more:
+                swap.classify(cl)
+                loaded.classify(cl)
+            swap.process_changes()
+            loaded.process_changes()
+
+        assert loaded._subject_posterior.array == \
+            pytest.approx(swap._subject_posterior.array)
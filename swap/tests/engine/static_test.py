@@ -0,0 +1,207 @@
+################################################################
+# Test functions for the static batch solver
+
+from swap.swap import SWAP
+from swap.engine.static import StaticSolver
+import factory
+
+from unittest.mock import patch
+import numpy as np
+import pytest
+
+# pylint: disable=R0201
+
+
+def classifications(n=3000):
+    return factory.classifications(n, users=50, subjects=200, seed=4)
+
+
+def golds(seed=5):
+    return factory.golds(200, every=4, seed=seed)
+
+
+def run(batch, data, golds_, new_golds=None):
+    with patch('swap.config.batch_update', batch):
+        swap = factory.run(SWAP(), data, golds_)
+
+        if new_golds is not None:
+            swap.set_gold_labels(new_golds)
+            swap.process_changes()
+
+    return swap
+
+
+@patch('swap.config.back_update', True)
+class TestStaticSolver:
+
+    def test_user_counts(self):
+        solver = StaticSolver([0, 0, 1, 1], [0, 1, 0, 2], [1, 0, 0, 1],
+                              (2, 3))
+        seen, matched = solver.user_counts(np.array([1, 0, -1]))
+
+        assert seen[0].tolist() == [1, 0]
+        assert seen[1].tolist() == [1, 1]
+        assert matched[0].tolist() == [1, 0]
+        assert matched[1].tolist() == [1, 0]
+
+    def test_subject_scores(self):
+        u0 = np.array([.6, .8])
+        u1 = np.array([.7, .9])
+        solver = StaticSolver([0, 1, 1], [0, 0, 1], [1, 0, 1], (2, 2))
+        history, scores = solver.subject_scores(u0, u1, .12)
+
+        p = .12 * .7 / (.12 * .7 + .88 * .4)
+        assert history[0] == pytest.approx(p)
+        p = p * .1 / (p * .1 + (1 - p) * .8)
+        assert history[1] == pytest.approx(p)
+        assert scores[0] == pytest.approx(p)
+        assert scores[1] == pytest.approx(.12 * .9 / (.12 * .9 + .88 * .2))
+
+    def test_empty_subject_is_prior(self):
+        solver = StaticSolver([0], [0], [1], (1, 2))
+        _, scores = solver.subject_scores(np.array([.5]), np.array([.5]), .1)
+
+        assert scores[1] == .1
+
+    def test_matches_agents(self):
+        data = classifications()
+        a = run(False, data, golds())
+        b = run(True, data, golds())
+
+        for subject in a.subjects:
+            other = b.subjects.agent(subject.id)
+            assert other.score == pytest.approx(subject.score, rel=1e-9)
+
+            scores = [t.score for t in subject.ledger]
+            other = [t.score for t in other.ledger]
+            assert other == pytest.approx(scores, rel=1e-9)
+
+        for user in a.users:
+            other = b.users.agent(user.id)
+            assert other.score == pytest.approx(user.score)
+            assert other.ledger.yes.seen == user.ledger.yes.seen
+            assert other.ledger.no.matched == user.ledger.no.matched
+
+            scores = [t.score for t in user.ledger]
+            other = [t.score for t in other.ledger]
+            assert other == pytest.approx(scores)
+
+    def test_matches_agents_gold_change(self):
+        data = classifications()
+        a = run(False, data, golds(), golds(seed=6))
+        b = run(True, data, golds(), golds(seed=6))
+
+        for subject in a.subjects:
+            other = b.subjects.agent(subject.id)
+            assert other.score == pytest.approx(subject.score, rel=1e-9)
+
+        for user in a.users:
+            scores = [t.score for t in user.ledger]
+            other = [t.score for t in b.users.agent(user.id).ledger]
+            assert other == pytest.approx(scores)
+
+    def test_clears_changes(self):
+        swap = run(True, classifications(n=100), golds())
+
+        for agent in list(swap.users) + list(swap.subjects):
+            assert agent.ledger.changed == []
+            assert agent.ledger.stale is False
+
+
+@patch('swap.config.back_update', True)
+class TestEM:
+
+    @staticmethod
+    def problem(seed=0, users=60, subjects=400, n=6000):
+        """
+        Users of varying accuracy on subjects whose true label
+        is known, with a few of them gold
+        """
+        r = np.random.default_rng(seed)
+        truth = (r.random(subjects) < .3).astype(int)
+        accuracy = r.uniform(.6, .95, users)
+
+        u = r.integers(0, users, n)
+        s = r.integers(0, subjects, n)
+        correct = r.random(n) < accuracy[u]
+        a = np.where(correct, truth[s], 1 - truth[s])
+
+        golds = np.full(subjects, -1)
+        golds[:20] = truth[:20]
+
+        solver = StaticSolver(u, s, a, (users, subjects))
+        return solver, golds, truth, accuracy
+
+    def test_no_iterations_is_solve(self):
+        solver, golds, _, _ = self.problem()
+        result = solver.em(golds, max_iterations=0)
+        static = solver.solve(golds)
+
+        assert result['iterations'] == []
+        assert result['converged'] is False
+        assert result['scores'] == pytest.approx(static['scores'])
+
+    def test_converges(self):
+        solver, golds, truth, accuracy = self.problem()
+        result = solver.em(golds, tolerance=1e-8, max_iterations=200)
+        static = solver.solve(golds)
+
+        assert result['converged']
+        iterations = result['iterations']
+        assert iterations[-1]['change'] <= 1e-8
+        assert all(i['seconds'] >= 0 for i in iterations)
+
+        # Users learn from the non gold subjects too
+        error = np.abs(result['u1'] - accuracy).mean()
+        assert error < np.abs(static['u1'] - accuracy).mean()
+
+        test = golds < 0
+        correct = (result['scores'][test] > .5) == truth[test]
+        static = (static['scores'][test] > .5) == truth[test]
+        assert correct.mean() > static.mean()
+
+        # User scores are those of the weighted counters
+        u0, u1 = solver.user_scores(result['seen'], result['matched'])
+        assert u0 == pytest.approx(result['u0'])
+        assert u1 == pytest.approx(result['u1'])
+
+    def test_fixed_point(self):
+        solver, golds, _, _ = self.problem()
+        result = solver.em(golds, tolerance=1e-12, max_iterations=500)
+        again = solver.em(golds, tolerance=1e-12, max_iterations=500)
+
+        assert result['scores'] == pytest.approx(again['scores'])
+
+        # History ends in the final scores
+        _, scores = solver.subject_scores(result['u0'], result['u1'])
+        assert scores == pytest.approx(result['scores'])
+
+    def test_max_iterations(self):
+        solver, golds, _, _ = self.problem()
+        result = solver.em(golds, tolerance=0, max_iterations=3)
+
+        assert len(result['iterations']) == 3
+        assert result['converged'] is False
+
+    def test_process_agents(self):
+        data = classifications()
+        with patch('swap.config.em.enabled', True):
+            swap = run(True, data, golds())
+        plain = run(True, data, golds())
+
+        changed = [user for user in swap.users
+                   if user.score != plain.users.agent(user.id).score]
+        assert len(changed) > 0
+
+        # Counters and running transaction scores agree with the scores
+        for user in swap.users:
+            ledger = user.ledger
+            assert user.score == pytest.approx(
+                (ledger.no.calculate(), ledger.yes.calculate()))
+            if len(ledger) > 0:
+                assert list(ledger)[-1].score == pytest.approx(user.score)
+
+        for subject in swap.subjects:
+            scores = [t.score for t in subject.ledger]
+            if len(scores) > 0:
+                assert scores[-1] == pytest.approx(subject.score)
@@ -0,0 +1,103 @@
+################################################################
+# Test functions for the multi-trial engine
+
+from swap.swap import SWAP
+from swap.engine.static import StaticSolver
+from swap.engine.trials import TrialSolver, Trials
+import factory
+
+from unittest.mock import patch
+import numpy as np
+import random
+import pytest
+
+# pylint: disable=R0201
+
+
+def classifications(n=2000):
+    return factory.classifications(n, seed=7)
+
+
+def gold_sets(k, subjects=150, seed=8):
+    r = random.Random(seed)
+    return [{i: r.randint(0, 1) for i in r.sample(range(subjects), 30)}
+            for _ in range(k)]
+
+
+def real_golds(subjects=150):
+    return factory.golds(subjects, every=1)
+
+
+def init_swap(data):
+    return factory.run(SWAP(), data)
+
+
+@patch('swap.config.back_update', True)
+class TestTrials:
+
+    def test_solver_matches_static(self):
+        solver = TrialSolver([0, 0, 1, 1, 2], [0, 1, 0, 2, 2],
+                             [1, 0, 0, 1, 1], (3, 3))
+        golds = np.array([[1, 0, -1], [-1, 1, 0], [0, 0, 1]])
+
+        scores = solver.scores(golds, .12)
+        for k in range(golds.shape[1]):
+            result = StaticSolver.solve(solver, golds[:, k], .12)
+            assert scores[:, k] == pytest.approx(result['scores'])
+
+    def test_static_trials_axis(self):
+        solver = TrialSolver([0, 0, 1, 1, 2], [0, 1, 0, 2, 2],
+                             [1, 0, 0, 1, 1], (3, 3))
+        golds = np.array([[1, 0], [-1, 1], [0, -1]])
+
+        result = solver.solve(golds, .12)
+        for k in range(golds.shape[1]):
+            single = solver.solve(golds[:, k], .12)
+            assert result['history'][:, k] == \
+                pytest.approx(single['history'])
+            assert result['scores'][:, k] == pytest.approx(single['scores'])
+
+    @patch('swap.config.batch_update', False)
+    def test_matches_agents(self):
+        data = classifications()
+        golds = gold_sets(5)
+
+        trials = Trials(init_swap(data), batch_size=2,
+                        real_golds=real_golds())
+        results = list(trials.run(golds))
+        assert [g for g, _ in results] == golds
+
+        for gold_set, export in results:
+            swap = SWAP()
+            swap.set_gold_labels(gold_set)
+            for cl in data:
+                swap.classify(cl)
+            swap.process_changes()
+
+            assert len(export) == len(swap.subjects)
+            for subject in swap.subjects:
+                score = export.scores[subject.raw_id]
+                assert score.p == pytest.approx(subject.score)
+                assert score.gold == subject.raw_id % 2
+
+    def test_run_is_lazy(self):
+        trials = Trials(init_swap(classifications(n=200)), batch_size=3,
+                        real_golds=real_golds())
+
+        consumed = []
+
+        def generate():
+            for golds in gold_sets(10):
+                consumed.append(golds)
+                yield golds
+
+        run = trials.run(generate())
+        next(run)
+        assert len(consumed) == 3
+
+    def test_unknown_subject_ignored(self):
+        trials = Trials(init_swap(classifications(n=200)),
+                        real_golds=real_golds())
+        scores = trials.scores([{0: 1, 'missing': 0}])
+
+        assert scores.shape == (len(trials.ids), 1)
@@ -0,0 +1,102 @@
+################################################################
+# Shared factories of test classifications and gold labels
+
+from swap.utils.classification import Classification
+
+import random
+
+
+def classifications(n=2000, users=40, subjects=150, classes=2,
+                    accuracy=None, anonymous=0, seed=1):
+    """
+    Random classifications
+
+    Parameters
+    ----------
+    n, users, subjects : int
+        Number of classifications, users and subjects
+    classes : int
+        Annotations are classes 0 .. classes - 1
+    accuracy : float
+        (optional) Users give the true class, subject % classes, with
+        this accuracy and a random class otherwise. Without it every
+        annotation is random
+    anonymous : float
+        Fraction of classifications by not logged in users, which get
+        string ids
+    seed : int
+    """
+    r = random.Random(seed)
+    data = []
+    for _ in range(n):
+        user = r.randrange(users)
+        subject = r.randrange(subjects)
+
+        annotation = r.randrange(classes)
+        if accuracy is not None and r.random() < accuracy:
+            annotation = subject % classes
+
+        if r.random() < anonymous:
+            user = 'not-logged-in-%d' % user
+        data.append(Classification(user, subject, annotation))
+    return data
+
+
+def golds(subjects=150, every=3, classes=2, seed=None):
+    """
+    Gold labels of every few subjects
+
+    Parameters
+    ----------
+    every : int
+        Label subjects 0, every, 2 * every, ...
+    seed : int
+        (optional) Random labels, otherwise the true class of
+        classifications, subject % classes
+    """
+    if seed is None:
+        return {i: i % classes for i in range(0, subjects, every)}
+
+    r = random.Random(seed)
+    return {i: r.randrange(classes) for i in range(0, subjects, every)}
+
+
+def degenerate():
+    """
+    Classifications by users with degenerate confusion matrices.
+    Without gamma, user 'b' has (u0, u1) = (1, 1), 'c' (0, 0),
+    'a' (1, 0) and 'd' (.5, 2 / 3), see degenerate_golds. Annotated
+    1, b's likelihood ratio is inf, c's -inf and a's nan
+    """
+    data = [
+        ('b', 0, 1), ('b', 1, 0), ('c', 0, 0), ('c', 1, 1),
+        ('a', 0, 0), ('a', 1, 0), ('d', 1, 0), ('d', 7, 1),
+        ('d', 0, 1), ('d', 6, 1), ('d', 8, 0),
+        # Saturated by b, c can't move it back
+        ('b', 2, 1), ('c', 2, 1), ('a', 2, 1),
+        ('c', 3, 1), ('b', 3, 1),
+        # 0 / 0 leaves the prior
+        ('a', 4, 1),
+        # After the saturated subjects, still finite
+        ('d', 5, 1), ('a', 5, 0)]
+    return [Classification(*cl) for cl in data]
+
+
+def degenerate_golds():
+    """
+    Gold labels of degenerate
+    """
+    return {0: 1, 1: 0, 6: 1, 7: 0, 8: 1}
+
+
+def run(swap, data, golds_=None, process=True):
+    """
+    Give swap the gold labels and classifications, then process them
+    """
+    if golds_ is not None:
+        swap.set_gold_labels(golds_)
+    for cl in data:
+        swap.classify(cl)
+    if process:
+        swap.process_changes()
+    return swap
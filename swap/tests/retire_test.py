@@ -0,0 +1,158 @@
+################################################################
+# Test functions for online retirement
+
+from swap.swap import SWAP
+from swap.utils.classification import Classification
+import swap.utils.snapshot as snapshot
+import factory
+
+from unittest.mock import patch
+import pytest
+
+# pylint: disable=R0201
+
+THRESHOLDS = (.02, .6)
+
+
+def classifications(seed=4):
+    # Users are right about subject % 2 80% of the time
+    return factory.classifications(3000, users=20, subjects=50,
+                                   accuracy=.6, seed=seed)
+
+
+def build(engine='agents', process=True):
+    return factory.run(SWAP(engine=engine), classifications(),
+                       factory.golds(50, every=5), process)
+
+
+def train(swap, users):
+    """
+    Users classify 40 gold subjects correctly
+    """
+    swap.set_gold_labels({i: i % 2 for i in range(40)})
+    for user in users:
+        for i in range(40):
+            swap.classify(Classification(user, i, i % 2))
+
+
+def first_crossing(history):
+    for n, p in enumerate(history):
+        if p < THRESHOLDS[0] or p > THRESHOLDS[1]:
+            return n, p
+
+
+@patch('swap.config.thresholds', THRESHOLDS)
+class TestRetire:
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    @pytest.mark.parametrize('subject_ledger', ['chain', 'tree'])
+    @patch('swap.config.back_update', False)
+    def test_first_crossing(self, engine, subject_ledger):
+        with patch('swap.config.subject_ledger', subject_ledger):
+            swap = build(engine, process=False)
+        retired = {id_: (n, p) for id_, n, p in swap.retired()}
+
+        assert len(retired) > 0
+        for id_, _, history in swap.history_export():
+            crossing = first_crossing(history)
+            if crossing is None:
+                assert id_ not in retired
+            else:
+                n, p = retired[id_]
+                assert n == crossing[0]
+                assert p == pytest.approx(crossing[1])
+
+        assert list(swap.retired()) == []
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    @pytest.mark.parametrize('keep_history', [True, False])
+    @patch('swap.config.back_update', True)
+    def test_back_update_final_scores(self, engine, keep_history):
+        with patch('swap.config.keep_history', keep_history):
+            swap = build(engine)
+        retired = {id_: (n, p) for id_, n, p in swap.retired()}
+
+        assert len(retired) > 0
+        for subject in swap.subjects:
+            if len(subject.ledger) == 0:
+                continue
+            p = subject.score
+            if p < THRESHOLDS[0] or p > THRESHOLDS[1]:
+                assert retired[subject.raw_id] == \
+                    (len(subject.ledger), pytest.approx(p))
+            else:
+                assert subject.raw_id not in retired
+
+    @patch('swap.config.back_update', True)
+    def test_engines_agree(self):
+        agents = {id_: (n, p) for id_, n, p in build('agents').retired()}
+        columnar = {id_: (n, p) for id_, n, p in build('columnar').retired()}
+
+        assert set(agents) == set(columnar)
+        for id_, (n, p) in agents.items():
+            assert columnar[id_] == (n, pytest.approx(p))
+
+    def test_retirement_is_permanent(self):
+        swap = SWAP()
+        train(swap, range(9))
+        for user in range(3):
+            swap.classify(Classification(user, 'a', 1))
+        swap.process_changes()
+        assert 'a' in [id_ for id_, _, _ in swap.retired()]
+
+        for user in range(3, 9):
+            swap.classify(Classification(user, 'a', 0))
+        swap.process_changes()
+        assert swap.subjects.get('a').score < THRESHOLDS[0]
+        assert 'a' not in [id_ for id_, _, _ in swap.retired()]
+        # Crossed with the second yes vote
+        assert swap.subjects.get('a').ledger.retired[0] == 2
+
+    def test_disabled(self):
+        with patch('swap.config.thresholds', None):
+            swap = build()
+        assert list(swap.retired()) == []
+
+    def test_merge(self):
+        swap = SWAP()
+        other = SWAP()
+        train(other, range(3))
+        for user in range(3):
+            other.classify(Classification(user, 'a', 1))
+        other.process_changes()
+
+        retired = [other.subjects.raw_id(id_)
+                   for id_ in other.subjects._retired]
+        assert 'a' in retired
+
+        swap.merge(other)
+        assert [id_ for id_, _, _ in swap.retired()] == retired
+        assert list(other.retired()) == []
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    def test_score_export(self, engine):
+        swap = build(engine)
+        retired = {id_: p for id_, _, p in swap.retired()}
+
+        with patch('swap.config.keep_history', False), \
+                patch('swap.utils.scores.ScoreExport.get_real_golds',
+                      staticmethod(lambda: {})):
+            export = swap.score_export()
+        for score in export.scores.values():
+            assert score.retired == retired.get(score.id)
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    def test_snapshot(self, tmpdir, engine):
+        swap = build(engine)
+        path = str(tmpdir.join('run.swap'))
+        snapshot.save(swap, path)
+
+        loaded = snapshot.load(path)
+        before = {id_: (n, p) for id_, n, p in swap.retired()}
+
+        # Already retired subjects stay retired after loading
+        for cl in classifications(seed=5):
+            loaded.classify(cl)
+        loaded.process_changes()
+        after = {id_ for id_, _, _ in loaded.retired()}
+        assert len(after & set(before)) == 0
@@ -4,8 +4,9 @@ from swap.agents.bureau import Bureau
 from swap.agents.user import User
 from swap.agents.subject import Subject
 from swap.agents.agent import Stats
+from swap.utils.scores import ScoreExport
 
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 
@@ -169,6 +170,275 @@ class TestSwap:
         print(bureau.get(1))
         assert bureau.get(2).gold == 0
 
+    def test_set_gold_diff_notifies_once(self):
+        swap = SWAP()
+        swap.set_gold_labels({0: 1, 1: 0})
+        # users 0 and 1 classify subjects 0-2, users 2 and 3 subjects 3-5
+        for u in range(4):
+            for s in range(3):
+                swap.classify(Classification(u, s + 3 * (u // 2), 1))
+
+        ledger_type = type(swap.users.get(0).ledger)
+        with patch.object(ledger_type, 'notify_golds', autospec=True,
+                          side_effect=ledger_type.notify_golds) as notify:
+            swap.set_gold_labels({0: 1, 1: 1, 4: 0})
+
+        notified = {}
+        for user in swap.users:
+            calls = [call for call in notify.call_args_list
+                     if call[0][0] is user.ledger]
+            assert len(calls) <= 1
+            if calls:
+                subjects = calls[0][0][1]
+                notified[user.raw_id] = sorted(s.raw_id for s in subjects)
+
+        assert notified == {0: [1], 1: [1], 2: [4], 3: [4]}
+        assert swap.golds == {0: 1, 1: 1, 4: 0}
+
+    @patch('swap.config.back_update', True)
+    @patch('swap.config.batch_update', False)
+    def test_set_gold_sweep_matches_fresh(self):
+        data = [Classification(i % 7, i % 13, int(i % 5 < 2))
+                for i in range(300)]
+
+        def run(sweeps):
+            swap = SWAP()
+            for golds in sweeps:
+                swap.set_gold_labels(golds)
+            for cl in data:
+                swap.classify(cl)
+            swap.process_changes()
+            return swap
+
+        swept = run([{0: 1, 1: 0, 2: 0}])
+        for golds in [{1: 1, 5: 0}, {}, {3: 1, 4: 0, 5: 1}]:
+            swept.set_gold_labels(golds)
+            swept.process_changes()
+        fresh = run([{3: 1, 4: 0, 5: 1}])
+
+        assert swept.golds == fresh.golds
+        for subject in fresh.subjects:
+            other = swept.subjects.get(subject.raw_id)
+            assert other.score == pytest.approx(subject.score)
+
+    @pytest.mark.parametrize('back_update', [True, False])
+    def test_merge_matches_single(self, back_update):
+        # Two components, users and subjects offset by 10
+        data = [Classification(i % 4 + 10 * (i % 2), i % 6 + 10 * (i % 2),
+                               int(i % 3 == 0)) for i in range(200)]
+        golds = {0: 1, 1: 0, 10: 1, 13: 0}
+
+        def run(data, golds):
+            swap = SWAP()
+            swap.set_gold_labels(golds)
+            for cl in data:
+                swap.classify(cl)
+            swap.process_changes()
+            return swap
+
+        with patch('swap.config.back_update', back_update), \
+                patch('swap.config.batch_update', False):
+            single = run(data, golds)
+            merged = run([cl for cl in data if cl.user < 10],
+                         {0: 1, 1: 0})
+            other = run([cl for cl in data if cl.user >= 10],
+                        {10: 1, 13: 0})
+            merged.merge(other)
+            merged.process_changes()
+
+        assert len(other.users) == 0
+        assert merged.golds == golds
+        for subject in single.subjects:
+            match = merged.subjects.get(subject.raw_id, False)
+            assert match.score == pytest.approx(subject.score)
+            assert match.ledger.history() == \
+                pytest.approx(subject.ledger.history())
+        for user in single.users:
+            match = merged.users.get(user.raw_id, False)
+            assert match.score == pytest.approx(user.score)
+
+    def test_merge_overlap(self):
+        a = SWAP()
+        a.classify(Classification(0, 0, 1))
+        b = SWAP()
+        b.classify(Classification(1, 0, 1))
+
+        with pytest.raises(KeyError):
+            a.merge(b)
+
+    def test_pickle_long_ledger(self):
+        import pickle
+
+        swap = SWAP()
+        for i in range(3000):
+            swap.classify(Classification(i, 0, i % 2))
+        swap.process_changes()
+
+        copy = pickle.loads(pickle.dumps(swap))
+        ledger = copy.subjects.get(0).ledger
+        assert ledger.history() == swap.subjects.get(0).ledger.history()
+        assert ledger.last.order == 2999
+        assert ledger.last.left.right is ledger.last
+
+    def test_dense_ids(self):
+        swap = SWAP()
+        swap.set_gold_labels({'s1': 1})
+        swap.classify(Classification('not-logged-in-a', 's2', 1))
+        swap.classify(Classification('not-logged-in-a', 's1', 1))
+
+        assert [s.id for s in swap.subjects] == [0, 1]
+        assert [u.id for u in swap.users] == [0]
+        assert swap.golds == {'s1': 1}
+        assert set(swap.history_export().history) == {'s1', 's2'}
+
+    @pytest.mark.parametrize('back_update', [True, False])
+    def test_tree_ledger_matches_chain(self, back_update):
+        def run(subject_ledger):
+            with patch('swap.config.subject_ledger', subject_ledger), \
+                    patch('swap.config.back_update', back_update), \
+                    patch('swap.config.batch_update', False):
+                swap = SWAP()
+                swap.set_gold_labels({0: 1, 3: 0, 6: 1})
+                for i in range(200):
+                    cl = Classification(i % 7, i % 11, int(i % 3 == 0))
+                    swap.classify(cl)
+                swap.process_changes()
+                return swap
+
+        chain = run('chain')
+        tree = run('tree')
+
+        for subject in chain.subjects:
+            other = tree.subjects.agent(subject.id)
+            assert other.score == pytest.approx(subject.score)
+            assert other.ledger.history() == \
+                pytest.approx(subject.ledger.history())
+
+    @pytest.mark.parametrize('back_update,batch_update',
+                             [(True, True), (True, False), (False, False)])
+    def test_lite_matches_full(self, back_update, batch_update):
+        def run(keep_history):
+            with patch('swap.config.keep_history', keep_history), \
+                    patch('swap.config.back_update', back_update), \
+                    patch('swap.config.batch_update', batch_update):
+                swap = SWAP()
+                swap.set_gold_labels({0: 1, 3: 0, 6: 1})
+                for i in range(200):
+                    cl = Classification(i % 7, i % 11, int(i % 3 == 0))
+                    swap.classify(cl)
+                swap.process_changes()
+                return swap
+
+        full = run(True)
+        lite = run(False)
+
+        for subject in full.subjects:
+            other = lite.subjects.agent(subject.id)
+            assert other.score == pytest.approx(subject.score)
+            assert other.ledger.total == pytest.approx(
+                sum(t.likelihood() for t in other.ledger))
+            assert all(t.score is None for t in other.ledger)
+        for user in full.users:
+            other = lite.users.agent(user.id)
+            assert other.score == pytest.approx(user.score)
+            assert all(t.score is None for t in other.ledger)
+
+    @patch('swap.config.keep_history', False)
+    @patch.object(ScoreExport, 'get_real_golds', MagicMock(return_value={}))
+    def test_lite_exports(self):
+        swap = SWAP()
+        swap.set_gold_labels({0: 1})
+        swap.classify(Classification(0, 0, 1))
+        swap.classify(Classification(0, 1, 0))
+        swap.process_changes()
+
+        export = swap.score_export()
+        assert len(export) == 2
+        assert all(not score.is_retired for score in export.scores.values())
+
+        with pytest.raises(ValueError):
+            swap.history_export()
+
+    @pytest.mark.parametrize('back_update,batch_update',
+                             [(True, True), (True, False), (False, False)])
+    def test_running_stats(self, back_update, batch_update):
+        with patch('swap.config.back_update', back_update), \
+                patch('swap.config.batch_update', batch_update):
+            swap = SWAP()
+            swap.set_gold_labels({0: 1, 3: 0, 6: 1})
+            for i in range(300):
+                cl = Classification(i % 13, i % 29, int(i % 3 == 0))
+                swap.classify(cl)
+            swap.process_changes()
+            swap.set_gold_labels({0: 0, 4: 1})
+            swap.process_changes()
+
+        users = swap.users.stats()
+        exact = User.stats(swap.users)
+        for label in (0, 1):
+            assert users.stats[label].mean == \
+                pytest.approx(exact.stats[label].mean)
+            assert users.stats[label].stdev == \
+                pytest.approx(exact.stats[label].stdev)
+            assert users.stats[label].median == \
+                pytest.approx(exact.stats[label].median, abs=1e-3)
+
+        subjects = swap.subjects.stats()
+        exact = Subject.stats(swap.subjects)
+        assert subjects.mean == pytest.approx(exact.mean)
+        assert subjects.stdev == pytest.approx(exact.stdev)
+        assert subjects.median == pytest.approx(exact.median, abs=1e-3)
+
+    @pytest.mark.parametrize('back_update', [True, False])
+    def test_log_odds_matches_probability(self, back_update):
+        def run(log_odds):
+            with patch('swap.config.log_odds', log_odds), \
+                    patch('swap.config.back_update', back_update), \
+                    patch('swap.config.batch_update', False):
+                swap = SWAP()
+                swap.set_gold_labels({0: 1, 3: 0, 6: 1})
+                for i in range(200):
+                    cl = Classification(i % 7, i % 11, int(i % 5 < 2))
+                    swap.classify(cl)
+                swap.process_changes()
+                return swap
+
+        prob = run(False)
+        logodds = run(True)
+
+        for subject in prob.subjects:
+            other = logodds.subjects.agent(subject.id)
+            assert other.score == pytest.approx(subject.score)
+            assert other.ledger.history() == \
+                pytest.approx(subject.ledger.history())
+
+    @patch('swap.config.back_update', True)
+    @patch('swap.config.batch_update', False)
+    def test_gold_change_only_touches_affected(self):
+        swap = SWAP()
+        swap.set_gold_labels({0: 1})
+        # users 0 and 1 classify subjects 0-2, users 2 and 3 subjects 3-5
+        for u in range(4):
+            for s in range(3):
+                swap.classify(Classification(u, s + 3 * (u // 2), 1))
+        swap.process_changes()
+
+        swap.subjects.get(1).set_gold_label(0, swap.subjects, swap.users)
+        assert swap.users._dirty == {0, 1}
+
+        # Users are recalculated together in one batch
+        ledger_type = type(swap.subjects.get(0).ledger)
+        with patch.object(User, 'recalculate',
+                          side_effect=User.recalculate) as batch, \
+                patch.object(ledger_type, 'recalculate', autospec=True,
+                             side_effect=ledger_type.recalculate) as single:
+            swap.process_changes()
+
+        users = {ledger.id for call in batch.call_args_list
+                 for ledger in call[0][0]}
+        assert users == {0, 1}
+        assert {call[0][0].id for call in single.call_args_list} == {0, 1, 2}
+
     # def test_subject_gold_label_1(self):
     #     swap = SWAP(p0=2e-4, epsilon=1.0)
     #     swap.gold_from_cl = True
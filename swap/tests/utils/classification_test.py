@@ -22,3 +22,14 @@ class Test_Classification:
     def test_init_type_errors(self):
         with pytest.raises(ClValueError):
             Classification(1, 1, '1')
+
+    def test_generate_interns_session(self):
+        def cl():
+            session = ''.join(['not-logged-in-', 'abc123'])
+            return {'user_id': None, 'session_id': session,
+                    'subject_id': 1, 'annotation': 0}
+
+        a = Classification.generate(cl())
+        b = Classification.generate(cl())
+        assert a.user == 'not-logged-in-abc123'
+        assert a.user is b.user
@@ -0,0 +1,66 @@
+################################################################
+# Test functions for connected component partitioning
+
+from swap.utils.components import UnionFind, components, partition
+from swap.utils.classification import Classification
+
+# pylint: disable=R0201
+
+
+def cls(pairs):
+    return [Classification(u, s, 1) for u, s in pairs]
+
+
+class TestUnionFind:
+
+    def test_union(self):
+        sets = UnionFind()
+        for _ in range(5):
+            sets.add()
+
+        sets.union(0, 1)
+        sets.union(3, 4)
+        sets.union(1, 4)
+
+        assert sets.find(0) == sets.find(3)
+        assert sets.find(2) != sets.find(0)
+        assert len(sets) == 5
+
+
+class TestComponents:
+
+    def test_labels(self):
+        data = cls([(0, 0), (1, 1), (2, 0), (1, 2), (3, 3), (4, 4)])
+        assert components(data) == [0, 1, 0, 1, 2, 3]
+
+        # user 2 joins the first two components
+        data.append(Classification(2, 2, 1))
+        assert components(data) == [0, 0, 0, 0, 1, 2, 0]
+
+    def test_users_and_subjects_separate(self):
+        # user 1 and subject 1 are different nodes
+        data = cls([(0, 1), (1, 0)])
+        assert components(data) == [0, 1]
+
+    def test_partition(self):
+        data = cls([(0, 0), (1, 1), (0, 2), (2, 3), (1, 1), (3, 4),
+                    (2, 0), (4, 5)])
+        groups = partition(data, 2)
+
+        assert len(groups) == 2
+        assert sum(len(group) for group in groups) == len(data)
+
+        for group in groups:
+            # Order kept within groups
+            order = [data.index(cl) for cl in group]
+            assert order == sorted(order)
+
+        # Components are never split
+        users = [set(cl.user for cl in group) for group in groups]
+        subjects = [set(cl.subject for cl in group) for group in groups]
+        assert not users[0] & users[1]
+        assert not subjects[0] & subjects[1]
+
+    def test_partition_drops_empty(self):
+        groups = partition(cls([(0, 0), (1, 0)]), 4)
+        assert len(groups) == 1
@@ -0,0 +1,74 @@
+################################################################
+# Test functions for the Fenwick tree
+
+from swap.utils.fenwick import FenwickTree
+
+import math
+import random
+import pytest
+
+# pylint: disable=R0201
+
+
+class TestFenwickTree:
+
+    def test_append(self):
+        tree = FenwickTree()
+        for i in range(10):
+            tree.append(i)
+
+        assert len(tree) == 10
+        assert tree.total == 45
+        for n in range(11):
+            assert tree.prefix(n) == sum(range(n))
+
+    def test_set(self):
+        r = random.Random(0)
+        values = [r.random() for _ in range(50)]
+        tree = FenwickTree()
+        for v in values:
+            tree.append(v)
+
+        for _ in range(100):
+            i = r.randrange(50)
+            values[i] = r.random()
+            tree.set(i, values[i])
+
+        assert tree.total == pytest.approx(sum(values))
+        for n in range(51):
+            assert tree.prefix(n) == pytest.approx(sum(values[:n]))
+        assert list(tree) == values
+
+    def test_empty(self):
+        tree = FenwickTree()
+        assert tree.total == 0
+        assert tree.prefix(0) == 0
+
+    def test_rebuild(self):
+        r = random.Random(1)
+        values = [r.uniform(-1e3, 1e3) for _ in range(20)]
+        tree = FenwickTree()
+        for v in values:
+            tree.append(v)
+
+        # Enough changes to trigger rebuilds, nodes match the values
+        for _ in range(100):
+            i = r.randrange(20)
+            values[i] = r.uniform(-1e-3, 1e-3)
+            tree.set(i, values[i])
+
+        expected = FenwickTree()
+        for v in values:
+            expected.append(v)
+        tree.rebuild()
+        assert tree._tree == pytest.approx(expected._tree, abs=1e-12)
+        assert tree.total == pytest.approx(math.fsum(values), abs=1e-12)
+
+    def test_not_finite(self):
+        tree = FenwickTree()
+        tree.append(1.)
+        with pytest.raises(ValueError):
+            tree.append(math.inf)
+        with pytest.raises(ValueError):
+            tree.set(0, -math.inf)
+        assert tree.total == 1.
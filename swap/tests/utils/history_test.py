@@ -0,0 +1,96 @@
+################################################################
+# Test functions for the ragged score history store
+
+from swap.swap import SWAP
+from swap.utils.history import Ragged, HistoryExport
+from swap.utils.scores import ScoreExport, Score
+from swap.utils.classification import Classification
+
+import numpy as np
+import random
+import pytest
+
+# pylint: disable=R0201
+
+
+def build(engine='agents', n=500, seed=3):
+    r = random.Random(seed)
+    swap = SWAP(engine=engine)
+    swap.set_gold_labels({i: i % 2 for i in range(10)})
+    for _ in range(n):
+        swap.classify(Classification(
+            r.randrange(30), r.randrange(60), r.randint(0, 1)))
+    swap.process_changes()
+    return swap
+
+
+class TestRagged:
+
+    def test_append(self):
+        r = Ragged(capacity=2)
+        rows = [[1, 2, 3], [], [4], [5, 6, 7, 8, 9]]
+        for i, row in enumerate(rows):
+            assert r.append(row) == i
+
+        assert len(r) == 4
+        assert r.offsets.tolist() == [0, 3, 3, 4, 9]
+        for i, row in enumerate(rows):
+            assert r.row(i).tolist() == row
+
+        r.append([10])
+        assert r.row(4).tolist() == [10]
+        assert r.values.tolist() == list(range(1, 11))
+
+    def test_from_arrays_is_view(self):
+        values = np.arange(6, dtype=float)
+        r = Ragged.from_arrays(values, [0, 2, 6])
+
+        assert r.row(1).tolist() == [2, 3, 4, 5]
+        values[3] = 10
+        assert r.row(1)[1] == 10
+
+    def test_first(self):
+        r = Ragged.from_arrays(np.arange(10), [0, 3, 3, 7, 10])
+        mask = np.isin(r.values, [1, 2, 8, 9])
+
+        assert r.first(mask).tolist() == [1, -1, -1, 8]
+
+
+class TestHistoryExport:
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    def test_matches_ledgers(self, engine):
+        swap = build(engine)
+        export = swap.history_export()
+
+        assert len(export) == len(export.history)
+        for subject in swap.subjects:
+            if len(subject.ledger) == 0:
+                continue
+            history = export.get(subject.raw_id)
+            assert history.gold == subject.gold
+            assert history.scores[0] == .12
+            assert history.scores[-1] == pytest.approx(subject.score)
+
+    def test_retired(self):
+        export = HistoryExport(
+            ['a', 'b', 'c'], [1, 0, -1],
+            Ragged.from_arrays([.5, .6, .99, .5, .4, .5, .001, .9],
+                               [0, 3, 5, 8]))
+
+        assert export.retired(.01, .95) == {'a': .99, 'c': .001}
+
+    def test_retire_matches_scan(self):
+        history = build().history_export()
+        scores = {id_: Score(id_, gold, float(s[-1]))
+                  for id_, gold, s in history}
+        export = ScoreExport(scores, new_golds=False, history=history,
+                             thresholds=(.05, .9))
+
+        for score in export.scores.values():
+            expect = None
+            for p in history.get(score.id).scores:
+                if p < .05 or p > .9:
+                    expect = p
+                    break
+            assert score.retired == expect
@@ -0,0 +1,91 @@
+################################################################
+# Test functions for the in-memory id set
+
+from swap.utils.idset import IdSet, BloomFilter
+
+import numpy as np
+import pytest
+
+# pylint: disable=R0201
+
+
+class TestIdSet:
+
+    def test_contains(self):
+        ids = IdSet([5, 3, 9, 3])
+        assert len(ids) == 3
+        assert 3 in ids
+        assert 9 in ids
+        assert 4 not in ids
+        assert 10 not in ids
+        assert '5' in ids
+
+    def test_empty(self):
+        ids = IdSet()
+        assert len(ids) == 0
+        assert 1 not in ids
+        assert ids.existing([1, 2]) == set()
+
+    @pytest.mark.parametrize('bloom', [None, .01])
+    def test_add_and_merge(self, bloom):
+        ids = IdSet(range(0, 100, 2), bloom=bloom, merge_every=8)
+        for i in range(1, 40, 2):
+            assert ids.add(i) is True
+        assert ids.add(1) is False
+        assert ids.add(2) is False
+
+        assert len(ids._recent) < 8
+        assert len(ids) == 70
+        for i in range(40):
+            assert i in ids
+        assert 41 not in ids
+
+    def test_merge_ratio(self):
+        ids = IdSet(range(1000), merge_every=8, merge_ratio=.125)
+        for i in range(1000, 1124):
+            ids.add(i)
+        assert len(ids._recent) == 124
+        ids.add(1124)
+        assert len(ids._recent) == 0
+        assert len(ids) == 1125
+
+    def test_existing(self):
+        ids = IdSet([1, 2, 3], merge_every=100)
+        ids.add(10)
+        assert ids.existing([1, 4, 10, 11, 3]) == {1, 3, 10}
+
+    def test_large_ids(self):
+        ids = IdSet([2 ** 40, 60910323])
+        assert 60910323 in ids
+        assert 2 ** 40 in ids
+        assert 2 ** 40 + 1 not in ids
+
+
+class TestBloomFilter:
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        values = np.random.RandomState(0).randint(0, 2 ** 40, 1000)
+        bloom.add_many(values[:500])
+        for value in values[500:]:
+            bloom.add(value)
+
+        for value in values:
+            assert value in bloom
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(10000, error=.01)
+        bloom.add_many(np.arange(10000) * 7)
+
+        hits = sum(i * 7 + 1 in bloom for i in range(10000))
+        assert hits < 300
+
+    def test_scalar_matches_array(self):
+        a = BloomFilter(100)
+        b = BloomFilter(100)
+        values = [0, 1, 12345, 2 ** 62, -5]
+        a.add_many(values)
+        for value in values:
+            b.add(value)
+
+        assert np.array_equal(a._bits, b._bits)
@@ -0,0 +1,52 @@
+################################################################
+# Test functions for the id interning table
+
+from swap.utils.index import Index
+
+import pytest
+
+# pylint: disable=R0201
+
+
+class TestIndex:
+
+    def test_dense(self):
+        index = Index()
+        ids = ['a', 'not-logged-in-1', 15, 'b']
+        assert [index.get(id_) for id_ in ids] == [0, 1, 2, 3]
+        assert index.get(15) == 2
+        assert len(index) == 4
+
+    def test_reverse(self):
+        index = Index()
+        for id_ in ['x', 'y', 'z']:
+            index.get(id_)
+
+        assert index.id(1) == 'y'
+        assert list(index.ids()) == ['x', 'y', 'z']
+
+    def test_ids_view(self):
+        index = Index()
+        for id_ in ['x', 'y', 'z']:
+            index.get(id_)
+
+        ids = index.ids()
+        index.get('w')
+        # Fixed when taken, later ids are not in it
+        assert len(ids) == 3
+        assert list(ids) == ['x', 'y', 'z']
+        assert ids[-1] == 'z'
+        assert ids[1:] == ['y', 'z']
+        assert ids.get('y') == 1
+        assert ids.get('w') is None
+        assert 'w' not in ids
+        with pytest.raises(IndexError):
+            ids[3]
+        with pytest.raises(TypeError):
+            ids[0] = 'a'
+
+    def test_no_new(self):
+        index = Index()
+        assert index.get('x', make_new=False) is None
+        assert 'x' not in index
+        assert len(index) == 0
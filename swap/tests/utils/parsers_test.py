@@ -148,6 +148,17 @@ class Test_Project_Parser:
 
         assert v is None
 
+    def test_parse_value_classes(self):
+        self.override_annotation('T0', None, ['Abc'], ['Def'])
+        parser = parsers.AnnotationParser(None)
+
+        classes = [['Def'], ['Abc', 'Ab'], ['Ghi']]
+        with patch.object(config.parser.annotation, 'classes', classes):
+            assert parser._parse_value('Def') == 0
+            assert parser._parse_value('Ab') == 1
+            assert parser._parse_value('Ghi') == 2
+            assert parser._parse_value('Jkl') is None
+
     def test_parse_value_and_find(self):
         self.override_annotation('T0', '0.value.1.2.3', [5], [0])
         parser = parsers.AnnotationParser(None)
@@ -0,0 +1,241 @@
+################################################################
+# Test functions for copy on write score views
+
+from swap.swap import SWAP
+from swap.utils.scoreview import ScoreTable
+from swap.utils.scores import ScoreExport
+from swap.utils.classification import Classification
+from swap.utils.index import Index
+import factory
+
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pytest
+
+# pylint: disable=R0201
+
+
+def index(n):
+    index = Index()
+    for i in range(n):
+        index.get('s%d' % i)
+    return index
+
+
+def classifications(n=600):
+    return factory.classifications(n, users=20, subjects=80, seed=3)
+
+
+def current(swap, retired):
+    """
+    (score, retired) of every classified subject, from the SWAP itself
+
+    Parameters
+    ----------
+    retired : dict
+        Retired scores so far, updated from swap.retired
+    """
+    for id_, _, score in swap.retired():
+        retired[id_] = score
+
+    scores = {}
+    for subject in swap.subjects:
+        if len(subject.ledger) == 0:
+            continue
+        id_ = swap.subjects.raw_id(subject.id)
+        scores[id_] = (subject.score, retired.get(id_))
+    return scores
+
+
+class TestScoreTable:
+
+    def test_update_and_get(self):
+        table = ScoreTable(chunk_size=4)
+        table.update([0, 5], [.2, .7], [np.nan, .7], [1, 1], [-1, 1])
+        view = table.view(index(8))
+
+        assert view.get('s0') == (.2, None)
+        assert view.get('s5') == (.7, .7)
+        # Not classified, or not published yet
+        assert view.get('s1') is None
+        assert view.get('s7') is None
+        assert view.get('missing') is None
+        assert len(view) == 2
+        assert list(view) == [('s0', .2, None), ('s5', .7, .7)]
+
+    def test_view_is_immutable(self):
+        table = ScoreTable(chunk_size=4)
+        table.update(range(8), np.full(8, .5), np.full(8, np.nan),
+                     np.ones(8), np.full(8, -1))
+        before = table.view(index(12))
+
+        table.update([1, 10], [.9, .1], [np.nan, np.nan], [1, 1], [-1, -1])
+        after = table.view(index(12))
+
+        assert before.get('s1') == (.5, None)
+        assert before.get('s10') is None
+        assert after.get('s1') == (.9, None)
+        assert after.get('s10') == (.1, None)
+        assert after.version == before.version + 1
+
+        # Only the written chunk was copied
+        assert before._chunks[0] is not after._chunks[0]
+        assert before._chunks[1] is after._chunks[1]
+
+    def test_writes_before_view_not_copied(self):
+        table = ScoreTable(chunk_size=4)
+        table.update([0], [.1], [np.nan], [1], [-1])
+        table.view(index(4))
+
+        table.update([0], [.2], [np.nan], [1], [-1])
+        chunk = table._chunks[0]
+        table.update([1], [.3], [np.nan], [1], [-1])
+        assert table._chunks[0] is chunk
+
+    def test_sync(self):
+        table = ScoreTable(chunk_size=4)
+        scores = np.linspace(0, 1, 10)
+        retired = np.full(10, np.nan)
+        classified = np.ones(10, dtype=bool)
+        golds = np.full(10, -1)
+
+        table.sync(scores, retired, classified, golds)
+        before = table.view(index(10))
+
+        scores[9] = .5
+        table.sync(scores, retired, classified, golds)
+        after = table.view(index(10))
+
+        assert before._chunks[0] is after._chunks[0]
+        assert before._chunks[1] is after._chunks[1]
+        assert before._chunks[2] is not after._chunks[2]
+        assert after.get('s9') == (.5, None)
+        assert before.get('s9') == (1., None)
+
+    def test_ids_fixed(self):
+        table = ScoreTable(chunk_size=4)
+        ids = index(2)
+        table.update([0, 1], [.2, .7], [np.nan, np.nan], [1, 1], [-1, -1])
+        view = table.view(ids)
+
+        # Readers never go through the index the writer changes
+        ids.get('s2')
+        table.update([2], [.4], [np.nan], [1], [-1])
+        with patch.object(Index, 'get', side_effect=AssertionError), \
+                patch.object(Index, 'id', side_effect=AssertionError):
+            assert view.get('s1') == (.7, None)
+            assert view.get('s2') is None
+            assert [id_ for id_, _, _ in view] == ['s0', 's1']
+        assert table.view(ids).get('s2') == (.4, None)
+
+    def test_empty(self):
+        view = ScoreTable().view(index(0))
+        assert len(view) == 0
+        assert list(view) == []
+
+    def test_sequence(self):
+        table = ScoreTable(chunk_size=4)
+        golds = np.full(10, -1)
+        scores = np.full(10, .5)
+        retired = np.full(10, np.nan)
+        classified = np.ones(10)
+
+        table.sync(scores, retired, classified, golds)
+        first = table.view(index(10))
+        assert first.sequence == 1
+        assert len(first.rows(since=0)) == 10
+        assert len(first.rows(since=1)) == 0
+
+        # No changes, same sequence and no copies
+        table.sync(scores, retired, classified, golds)
+        second = table.view(index(10))
+        assert second.sequence == 1
+        assert second._chunks == first._chunks
+
+        golds[2] = 1
+        table.update([7, 8], [.5, .9], [np.nan, .9], [1, 1], [-1, -1])
+        table.sync(scores, retired, classified, golds)
+        third = table.view(index(10))
+        assert third.sequence == 3
+        assert third.rows(since=1).tolist() == [2, 8]
+        assert third.rows(since=3).tolist() == []
+
+    def test_records(self):
+        table = ScoreTable(chunk_size=4)
+        table.update([0, 1, 5], [.2, .7, .1], [np.nan, .7, np.nan],
+                     [1, 1, 0], [0, 1, -1])
+        view = table.view(index(8))
+
+        assert list(view.records(view.rows())) == [
+            {'id': 's0', 'gold': 0, 'p': .2, 'retired': None},
+            {'id': 's1', 'gold': 1, 'p': .7, 'retired': .7}]
+
+        export = view.score_export(new_golds=False)
+        assert export.full_dict() == {
+            's0': {'id': 's0', 'gold': 0, 'p': .2, 'retired': None},
+            's1': {'id': 's1', 'gold': 1, 'p': .7, 'retired': .7}}
+
+
+@patch.object(ScoreExport, 'get_real_golds', MagicMock(return_value={}))
+class TestPublish:
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    @pytest.mark.parametrize('back_update', [True, False])
+    def test_matches_swap(self, engine, back_update):
+        data = classifications()
+        with patch('swap.config.back_update', back_update), \
+                patch('swap.config.thresholds', (.05, .9)):
+            swap = SWAP(engine)
+            swap.set_gold_labels({i: i % 2 for i in range(0, 80, 4)})
+            assert swap.view() is None
+
+            for cl in data[:300]:
+                swap.classify(cl)
+            swap.process_changes()
+            first = swap.publish()
+            retired = {}
+            expected = current(swap, retired)
+
+            for cl in data[300:]:
+                swap.classify(cl)
+                if not back_update:
+                    swap.publish()
+            swap.process_changes()
+            view = swap.publish()
+
+        assert swap.view() is view
+        assert {id_: (p, r) for id_, p, r in first} == \
+            pytest.approx(expected)
+        expected_after = current(swap, retired)
+        assert {id_: (p, r) for id_, p, r in view} == \
+            pytest.approx(expected_after)
+        assert len(view) == len(expected_after)
+
+        export = view.score_export()
+        assert set(export.scores) == set(expected_after)
+
+    def test_new_subject(self):
+        swap = SWAP()
+        swap.classify(Classification(0, 'a', 1))
+        view = swap.publish()
+        swap.classify(Classification(0, 'b', 1))
+
+        assert view.get('b') is None
+        assert swap.publish().get('b') is not None
+
+    @pytest.mark.parametrize('engine', ['agents', 'columnar'])
+    def test_gold_change(self, engine):
+        with patch('swap.config.back_update', False):
+            swap = SWAP(engine)
+            data = classifications(100)
+            for cl in data:
+                swap.classify(cl)
+            first = swap.publish()
+
+            subject = data[0].subject
+            swap.set_gold_labels({subject: 1})
+            view = swap.publish()
+
+        assert view.sequence > first.sequence
+        changed = list(view.records(view.rows(since=first.sequence)))
+        assert [(r['id'], r['gold']) for r in changed] == [(subject, 1)]
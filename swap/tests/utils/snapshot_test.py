@@ -0,0 +1,134 @@
+################################################################
+# Test functions for SWAP snapshots
+
+from swap.swap import SWAP
+import swap.utils.snapshot as snapshot
+import factory
+
+from unittest.mock import patch
+import json
+import os
+import pytest
+
+# pylint: disable=R0201
+
+
+def classifications(n=300, seed=1):
+    # Some users not logged in, so user ids have mixed types
+    return factory.classifications(n, users=7, subjects=11, anonymous=.3,
+                                   seed=seed)
+
+
+def build(engine='agents', process=True):
+    return factory.run(SWAP(engine=engine), classifications(),
+                       {0: 1, 3: 0, 5: 1}, process)
+
+
+def assert_same(a, b):
+    assert a.golds == b.golds
+    assert a.users.idset() == b.users.idset()
+    for subject in a.subjects:
+        other = b.subjects.get(subject.raw_id, False)
+        assert other.score == pytest.approx(subject.score)
+    for user in a.users:
+        other = b.users.get(user.raw_id, False)
+        assert other.score == pytest.approx(user.score)
+
+    if hasattr(a.subjects, 'rebuild_stats'):
+        assert b.subjects.stats().mean == \
+            pytest.approx(a.subjects.stats().mean)
+        assert b.subjects.stats().median == \
+            pytest.approx(a.subjects.stats().median)
+
+    ha = a.history_export().history
+    hb = b.history_export().history
+    assert set(ha) == set(hb)
+    for id_ in ha:
+        assert hb[id_].scores == pytest.approx(ha[id_].scores)
+
+
+class TestSnapshot:
+
+    @pytest.mark.parametrize('back_update', [True, False])
+    @pytest.mark.parametrize('subject_ledger', ['chain', 'tree'])
+    def test_agents_round_trip(self, tmpdir, back_update, subject_ledger):
+        path = str(tmpdir.join('run.swap'))
+        with patch('swap.config.back_update', back_update), \
+                patch('swap.config.batch_update', False), \
+                patch('swap.config.subject_ledger', subject_ledger):
+            swap = build(process=False)
+            snapshot.save(swap, path)
+            loaded = snapshot.load(path)
+
+            # Pending changes are kept, processing continues the same
+            swap.process_changes()
+            loaded.process_changes()
+            assert_same(swap, loaded)
+
+            swap.set_gold_labels({0: 0, 4: 1})
+            loaded.set_gold_labels({0: 0, 4: 1})
+            for cl in classifications(50, seed=2):
+                swap.classify(cl)
+                loaded.classify(cl)
+            swap.process_changes()
+            loaded.process_changes()
+            assert_same(swap, loaded)
+
+    @pytest.mark.parametrize('back_update', [True, False])
+    def test_columnar_round_trip(self, tmpdir, back_update):
+        path = str(tmpdir.join('run.swap'))
+        with patch('swap.config.back_update', back_update):
+            swap = build('columnar')
+            snapshot.save(swap, path)
+            loaded = snapshot.load(path)
+            assert type(loaded) is type(swap)
+            assert_same(swap, loaded)
+
+            for cl in classifications(50, seed=2):
+                swap.classify(cl)
+                loaded.classify(cl)
+            # Already classified
+            loaded.classify(classifications(1)[0])
+            swap.process_changes()
+            loaded.process_changes()
+            assert_same(swap, loaded)
+
+    def test_scores_without_agents(self, tmpdir):
+        path = str(tmpdir.join('run.swap'))
+        swap = build()
+        snapshot.save(swap, path)
+
+        scores = snapshot.Snapshot(path).scores()
+        assert scores == {s.raw_id: pytest.approx(s.score)
+                          for s in swap.subjects if len(s.ledger) > 0}
+
+    def test_manifest(self, tmpdir):
+        path = str(tmpdir.join('run.swap'))
+        swap = build()
+        snapshot.save(swap, path)
+
+        s = snapshot.Snapshot(path)
+        assert s.engine == 'agents'
+        assert s.manifest['classifications'] == \
+            sum(len(subject.ledger) for subject in swap.subjects)
+        assert set(s.config) == set(snapshot.CONFIG)
+
+    def test_newer_version(self, tmpdir):
+        path = str(tmpdir.join('run.swap'))
+        snapshot.save(build(), path)
+
+        fname = os.path.join(path, 'manifest.json')
+        with open(fname) as file:
+            manifest = json.load(file)
+        manifest['version'] = snapshot.VERSION + 1
+        with open(fname, 'w') as file:
+            json.dump(manifest, file)
+
+        with pytest.raises(ValueError):
+            snapshot.Snapshot(path)
+
+    def test_is_snapshot(self, tmpdir):
+        path = str(tmpdir.join('run.swap'))
+        assert not snapshot.is_snapshot(path)
+        snapshot.save(build(), path)
+        assert snapshot.is_snapshot(path)
@@ -0,0 +1,168 @@
+################################################################
+# Benchmarks replaying synthetic classifications through SWAP
+#
+# usage: python tools/benchmark.py [classifications] [--engine agents]
+#        [--back-update] [--lite] [--baseline path]
+#
+# --baseline compares memory with another checkout of swap, for
+# example the commit before a change:
+#   git worktree add /tmp/before <commit>
+#   python tools/benchmark.py --baseline /tmp/before/swap
+
+import swap.config as config
+from swap.swap import SWAP
+from swap.utils.classification import Classification
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+def classifications(n, users, subjects, seed=0):
+    """
+    Synthetic classifications. Half the users are anonymous and
+    identified by a session string, as in panoptes exports
+    """
+    r = random.Random(seed)
+    for _ in range(n):
+        user = r.randrange(users)
+        if user % 2:
+            user = 'not-logged-in-%032x' % user
+        yield {'user_id': None if type(user) is str else user,
+               'session_id': user,
+               'subject_id': r.randrange(subjects),
+               'annotation': r.randint(0, 1)}
+
+
+def golds(subjects, seed=0):
+    r = random.Random(seed)
+    return {i: r.randint(0, 1) for i in range(0, subjects, 10)}
+
+
+def new_swap(engine):
+    # Checkouts from before the engines only have agents
+    if engine == 'agents':
+        return SWAP()
+    return SWAP(engine=engine)
+
+
+def measure(args):
+    """
+    Bytes allocated by a SWAP instance, before and after
+    process_changes
+    """
+    data = [Classification.generate(cl) for cl in classifications(
+        args.n, args.users, args.subjects)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    swap = new_swap(args.engine)
+    swap.set_gold_labels(golds(args.subjects), with_bar=False)
+    for cl in data:
+        swap.classify(cl)
+    classify = tracemalloc.get_traced_memory()[0] - before
+
+    swap.process_changes()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    return {'classify': classify, 'size': size}
+
+
+def baseline(args):
+    """
+    measure, run in a subprocess against the checkout at args.baseline
+    """
+    command = [sys.executable, os.path.abspath(__file__), str(args.n),
+               '--users', str(args.users), '--subjects', str(args.subjects),
+               '--engine', args.engine, '--json']
+    if args.back_update:
+        command.append('--back-update')
+    if args.lite:
+        command.append('--lite')
+
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(args.baseline))
+    out = subprocess.run(command, env=env, check=True,
+                         stdout=subprocess.PIPE).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def memory(args):
+    """
+    Bytes allocated by a SWAP instance per classification, compared
+    with args.baseline if given
+    """
+    after = measure(args)
+    size = after['size']
+    print('memory: %d classifications %.1f MB %.1f bytes/classification' %
+          (args.n, size / 2**20, size / args.n))
+    print('        %.1f MB before process_changes' %
+          (after['classify'] / 2**20))
+
+    if args.baseline is not None:
+        before = baseline(args)
+        old = before['size']
+        print('baseline: %.1f MB %.1f bytes/classification' %
+              (old / 2**20, old / args.n))
+        print('change: %.1f MB before -> %.1f MB after (%+.1f%%)' %
+              (old / 2**20, size / 2**20, (size - old) / old * 100))
+
+
+def speed(args):
+    """
+    Time to classify and process changes
+    """
+    data = [Classification.generate(cl) for cl in classifications(
+        args.n, args.users, args.subjects)]
+
+    start = time.time()
+    swap = new_swap(args.engine)
+    swap.set_gold_labels(golds(args.subjects), with_bar=False)
+    for cl in data:
+        swap.classify(cl)
+    classify = time.time() - start
+
+    start = time.time()
+    swap.process_changes()
+    process = time.time() - start
+
+    print('speed: classify %.2fs process_changes %.2fs' %
+          (classify, process))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('n', nargs='?', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--subjects', type=int, default=50000)
+    parser.add_argument('--engine', default='agents',
+                        choices=['agents', 'columnar', 'multiclass'])
+    parser.add_argument('--back-update', action='store_true')
+    parser.add_argument('--lite', action='store_true',
+                        help='Keep no score history, see config.keep_history')
+    parser.add_argument('--baseline', metavar='path',
+                        help='Also measure memory with the swap package at'
+                             ' path, another checkout, and compare')
+    parser.add_argument('--json', action='store_true',
+                        help='Only measure memory, print it as json')
+
+    args = parser.parse_args()
+    config.back_update = args.back_update
+    config.keep_history = not args.lite
+
+    if args.json:
+        print(json.dumps(measure(args)))
+        return
+
+    memory(args)
+    speed(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,10 @@
 
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 from functools import wraps
+import json
+import sys
+import threading
 
 def debug(func):
     @wraps(func)
@@ -13,51 +17,109 @@ def debug(func):
     return wrapper
 
 class Handler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, like caesar
+    protocol_version = 'HTTP/1.1'
 
-    def do_GET(self):
-        request_path = self.path
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
 
-        print("\n----- Request Start ----->\n")
-        print(request_path)
-        print(self.headers)
-        print("<----- Request End -----\n")
-
-        self.send_response(200)
+    def _respond(self, status, message):
+        body = bytes(message, "utf8")
+        self.send_response(status)
         self.send_header('Content-type','text/html')
+        self.send_header('Content-length', str(len(body)))
         self.end_headers()
 
-        # Send message back to client
-        message = "Hello world!"
         # Write content as utf-8 data
-        self.wfile.write(bytes(message, "utf8"))
+        self.wfile.write(body)
+
+    def do_GET(self):
+        request_path = self.path
+
+        if self.server.verbose:
+            print("\n----- Request Start ----->\n")
+            print(request_path)
+            print(self.headers)
+            print("<----- Request End -----\n")
+
+        # Send message back to client
+        self._respond(200, "Hello world!")
         return
 
     def do_POST(self):
         request_path = self.path
 
-        print("\n----- Request Start ----->\n")
-        print(request_path)
-
         request_headers = self.headers
         content_length = request_headers.get('content-length')
         length = int(content_length) if content_length else 0
+        body = self.rfile.read(length)
 
-        print(request_headers)
-        print(self.rfile.read(length))
-        print("<----- Request End -----\n")
+        if self.server.verbose:
+            print("\n----- Request Start ----->\n")
+            print(request_path)
+            print(request_headers)
+            print(body)
+            print("<----- Request End -----\n")
 
-        self.send_response(200)
-        self.send_header('Content-type','text/html')
-        self.end_headers()
+        status = self.server.record(self, body)
 
         # Send message back to client
-        message = "Hello world!"
-        # Write content as utf-8 data
-        self.wfile.write(bytes(message, "utf8"))
+        self._respond(status, "Hello world!")
         return
 
     do_PUT = do_POST
     do_DELETE = do_GET
 
-httpd = HTTPServer(('localhost', 3000), Handler)
-httpd.serve_forever()
+
+class FakeCaesar(ThreadingMixIn, HTTPServer):
+    """
+    Local stand in for caesar. Records every request body and can
+    answer the first few requests with an error
+    """
+    daemon_threads = True
+
+    def __init__(self, host='localhost', port=3000, verbose=True,
+                 fail=0, fail_status=503):
+        super().__init__((host, port), Handler)
+        self.verbose = verbose
+        self.fail = fail
+        self.fail_status = fail_status
+
+        self.lock = threading.Lock()
+        self.requests = []
+        self.failed = 0
+
+    @property
+    def address(self):
+        host, port = self.server_address
+        return 'http://%s:%d/reductions' % (host, port)
+
+    def record(self, handler, body):
+        with self.lock:
+            if self.failed < self.fail:
+                self.failed += 1
+                return self.fail_status
+
+            try:
+                body = json.loads(body.decode('utf8'))
+            except ValueError:
+                pass
+            self.requests.append(
+                (handler.command, handler.path, dict(handler.headers), body))
+            return 200
+
+    def start(self, poll_interval=.05):
+        """
+        Serve on a background thread
+        """
+        thread = threading.Thread(
+            target=self.serve_forever, args=(poll_interval,), daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    httpd = FakeCaesar('localhost', port)
+    httpd.serve_forever()